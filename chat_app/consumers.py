@@ -1,35 +1,212 @@
+"""
+Chat pro Raum.
+
+- pro Verbindung ein Token-Bucket (CHAT_RATE Nachrichten/s, Burst CHAT_BURST)
+  und Größenlimits für Frame und Nachricht – wer flutet, bekommt einen
+  Fehler statt einer Nachricht im Raum
+- pro Raum ein Ringpuffer (deque mit maxlen) der letzten CHAT_HISTORY
+  Nachrichten; wer neu reinkommt, kriegt sie in *einem* Frame
+- Nachrichten werden pro Raum gesammelt und einmal pro CHAT_TICK als ein
+  group_send rausgeschickt – ein Burst kostet einen Frame, nicht einen pro
+  Nachricht
+
+Verlauf und Sammelpuffer leben im Prozess. Batches aus anderen Workern
+landen beim ersten lokalen Empfänger ebenfalls im Verlauf (per Batch-ID
+nur einmal).
+"""
+import asyncio
 import json
+import time
+import uuid
+from collections import OrderedDict, deque
 
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from ultictactoe_app.metrics import Counter, Gauge
+
+RATE = getattr(settings, "CHAT_RATE", 2.0)                # Nachrichten pro Sekunde (Dauer)
+BURST = getattr(settings, "CHAT_BURST", 5)                # so viele auf einmal
+MAX_FRAME = getattr(settings, "CHAT_MAX_FRAME", 2048)     # Bytes pro eingehendem Frame
+MAX_LENGTH = getattr(settings, "CHAT_MAX_LENGTH", 500)    # Zeichen pro Nachricht
+HISTORY = getattr(settings, "CHAT_HISTORY", 50)
+TICK = getattr(settings, "CHAT_TICK", 0.1)
+MAX_ROOMS = getattr(settings, "CHAT_MAX_ROOMS", 10_000)   # leere Räume darüber hinaus vergessen
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "stamp")
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = clock()
+
+    def take(self, now) -> float:
+        """Ein Token nehmen. Rückgabe: 0 wenn ok, sonst Sekunden bis zum nächsten Token."""
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class ChatRoom:
+    __slots__ = ("group", "history", "pending", "members", "_seen", "_timer")
+
+    def __init__(self, group):
+        self.group = group
+        self.history = deque(maxlen=HISTORY)
+        self.pending = []
+        self.members = 0
+        self._seen = deque(maxlen=64)     # IDs der letzten Batches (schon im Verlauf)
+        self._timer = None
+
+    def remember(self, batch_id, messages):
+        if batch_id in self._seen:
+            return
+        self._seen.append(batch_id)
+        self.history.extend(messages)
+
+
+_rooms = OrderedDict()    # group -> ChatRoom, älteste zuerst
+_flushes = set()
+
+
+def _room(group) -> ChatRoom:
+    room = _rooms.get(group)
+    if room is None:
+        room = _rooms[group] = ChatRoom(group)
+        if len(_rooms) > MAX_ROOMS:
+            # leere Räume (nur noch Verlauf) rauswerfen, älteste zuerst
+            idle = [g for g, r in _rooms.items() if g != group and not r.members and not r.pending]
+            for g in idle[:len(_rooms) - MAX_ROOMS]:
+                del _rooms[g]
+    else:
+        _rooms.move_to_end(group)
+    return room
+
+
+def _queue(layer, room, message):
+    room.pending.append(message)
+    if room._timer is None:
+        loop = asyncio.get_running_loop()
+        room._timer = loop.call_later(TICK, _start_flush, loop, layer, room)
+
+
+def _start_flush(loop, layer, room):
+    task = loop.create_task(_flush(layer, room))
+    _flushes.add(task)
+    task.add_done_callback(_flushes.discard)
+
+
+async def _flush(layer, room):
+    room._timer = None
+    messages, room.pending = room.pending, []
+    if not messages:
+        return
+    batch_id = uuid.uuid4().hex
+    room.remember(batch_id, messages)
+    BATCHES.inc()
+    await layer.group_send(room.group, {"type": "chat.batch", "id": batch_id, "messages": messages})
+
+
+class ChatStream:
+    """
+    Chat-Logik einer Verbindung, unabhängig vom Transport: ChatConsumer
+    (eigener Socket) und der Multiplex-Consumer im Spiel benutzen sie.
+    send: async (dict) -> None, schickt ein Objekt an genau diesen Client.
+    """
+
+    def __init__(self, layer, group, send):
+        self.layer = layer
+        self.room = _room(group)
+        self.bucket = TokenBucket(RATE, BURST)
+        self._send = send
+
+    async def open(self):
+        self.room.members += 1
+        if self.room.history:
+            # Verlauf für Nachzügler in einem Frame
+            await self._send({"messages": list(self.room.history), "history": True})
+
+    def close(self):
+        self.room.members -= 1
+
+    def allow(self) -> float:
+        """Token für eine Aktion nehmen (auch Tippen-Anzeige o. Ä.). Rückgabe wie TokenBucket.take."""
+        return self.bucket.take(time.monotonic())
+
+    async def receive(self, data):
+        message = data.get("message") if isinstance(data, dict) else None
+        if not isinstance(message, str) or not message.strip():
+            MESSAGES.labels("invalid").inc()
+            return
+        if len(message) > MAX_LENGTH:
+            MESSAGES.labels("too_large").inc()
+            await self.error(f"Nachricht zu lang (max. {MAX_LENGTH} Zeichen).")
+            return
+
+        wait = self.allow()
+        if wait:
+            MESSAGES.labels("limited").inc()
+            await self.error("Zu viele Nachrichten – kurz warten.", retry_after=round(wait, 2))
+            return
+
+        MESSAGES.labels("ok").inc()
+        # gesammelt, geht mit dem nächsten Tick als ein group_send raus
+        _queue(self.layer, self.room, message)
+
+    async def error(self, message, **extra):
+        await self._send({"error": message, **extra})
+
+    async def deliver(self, event):
+        self.room.remember(event["id"], event["messages"])   # Batches anderer Worker
+        await self._send({"messages": event["messages"]})
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"chat_{self.room_name}"
+        self.chat = ChatStream(self.channel_layer, self.room_group_name,
+                               lambda obj: self.send(text_data=json.dumps(obj)))
 
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         await self.accept()
+        await self.chat.open()
 
     async def disconnect(self, close_code):
+        self.chat.close()
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
     # Receive message from WebSocket
-    async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message = text_data_json["message"]
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None or len(text_data) > MAX_FRAME:
+            MESSAGES.labels("too_large").inc()
+            await self.chat.error("Nachricht zu groß.")
+            return
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            MESSAGES.labels("invalid").inc()
+            return
+        await self.chat.receive(data)
 
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.room_group_name, {"type": "chat.message", "message": message}
-        )
+    # Receive batch from room group
+    async def chat_batch(self, event):
+        await self.chat.deliver(event)
 
-    # Receive message from room group
+    # alte Einzel-Events (z. B. von einem Worker mit altem Code während des Deploys)
     async def chat_message(self, event):
-        message = event["message"]
+        await self.send(text_data=json.dumps({"messages": [event["message"]]}))
+
 
-        # Send message to WebSocket
-        await self.send(text_data=json.dumps({"message": message}))
\ No newline at end of file
+MESSAGES = Counter("chat_messages_total", "eingehende Chat-Nachrichten nach Ergebnis", labels=("result",))
+BATCHES = Counter("chat_batches_total", "gesendete Chat-Frames (gesammelt pro Tick)")
+Gauge("chat_rooms", "Chat-Räume im Speicher (mit Verlauf)", fn=lambda: len(_rooms))
@@ -1,3 +1,56 @@
-from django.test import TestCase
+import asyncio
 
-# Create your tests here.
+from channels.layers import InMemoryChannelLayer
+from django.test import SimpleTestCase
+
+from .consumers import BURST, MAX_LENGTH, ChatStream, TokenBucket
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=2.0, burst=3, clock=lambda: 0.0)
+        self.assertEqual([bucket.take(0.0) for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.take(0.0), 0.5)      # nächstes Token in 1 / rate s
+        self.assertAlmostEqual(bucket.take(0.25), 0.25)
+        self.assertEqual(bucket.take(0.5), 0.0)
+        self.assertGreater(bucket.take(0.5), 0)
+
+    def test_refill_is_capped_at_burst(self):
+        bucket = TokenBucket(rate=1.0, burst=2, clock=lambda: 0.0)
+        bucket.take(0.0)
+        bucket.take(0.0)
+        waits = [bucket.take(1000.0) for _ in range(3)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertGreater(waits[2], 0)
+
+
+class ChatStreamTests(SimpleTestCase):
+    async def test_limits_and_one_batch_per_tick(self):
+        layer = InMemoryChannelLayer()
+        channel = await layer.new_channel()
+        await layer.group_add("chat_test", channel)
+        sent = []
+
+        async def send(obj):
+            sent.append(obj)
+
+        stream = ChatStream(layer, "chat_test", send)
+        await stream.open()
+        await stream.receive({"message": "x" * (MAX_LENGTH + 1)})
+        for i in range(BURST + 1):
+            await stream.receive({"message": f"m{i}"})
+        self.assertEqual(len(sent), 2)                     # zu lang + ein Mal gedrosselt
+        self.assertIn("retry_after", sent[1])
+
+        batch = await asyncio.wait_for(layer.receive(channel), 2)
+        self.assertEqual(batch["messages"], [f"m{i}" for i in range(BURST)])
+        stream.close()
+
+        # Nachzügler bekommt den Verlauf in einem Frame
+        late = []
+
+        async def send_late(obj):
+            late.append(obj)
+
+        await ChatStream(layer, "chat_test", send_late).open()
+        self.assertEqual(late, [{"messages": [f"m{i}" for i in range(BURST)], "history": True}])
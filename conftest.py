@@ -0,0 +1,21 @@
+# pytest ohne pytest-django: Settings laden, damit die tests.py der Apps importierbar sind,
+# und wie "manage.py test" eine Test-Datenbank anlegen (nie db.sqlite3 selbst).
+# Die Tests laufen genauso mit "python manage.py test".
+import os
+
+import django
+import pytest
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "ultictactoe.settings")
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def _test_databases():
+    from django.test.utils import setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+
+    setup_test_environment()
+    old = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(old, verbosity=0)
+    teardown_test_environment()
@@ -30,7 +30,7 @@ let socket = null;
                 const code = msg.code;
                 alloc.close();
                 // ❌ openLobbyModal(code);  // <-- ENTFERNEN
-                connectToRoom(code, nickname);
+                connectToRoom(code, nickname, msg.reservation);   // Token löst die Reservierung ein
                 }
             };
             alloc.onerror = () => alert("Konnte keinen Code anfordern.");
@@ -43,7 +43,7 @@ let socket = null;
             openModal('lobbyModal');
         }
 
-        function connectToRoom(roomCode, nickname) {
+        function connectToRoom(roomCode, nickname, reservation) {
             window.myNickname = nickname;
             const url = `${wsBase()}/ws/game/${encodeURIComponent(roomCode)}/`;
             socket = new WebSocket(url);
@@ -51,7 +51,7 @@ let socket = null;
 
             socket.onopen = () => {
                 console.log('WS open', { roomCode, nickname});
-                socket.send(JSON.stringify({ action: "create_or_join", nickname }));
+                socket.send(JSON.stringify({ action: "create_or_join", nickname, reservation }));
                 setLobbyStatus(`Verbunden mit Lobby ${roomCode} – warte auf Spieler…`);
             };
 
@@ -29,13 +29,14 @@ django_asgi_app = get_asgi_application()
 # from chat_app.routing import websocket_urlpatterns
 # NEU:
 from ultictactoe_app.routing import websocket_urlpatterns
+from chat_app.routing import websocket_urlpatterns as chat_urlpatterns
 
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
         "websocket": AllowedHostsOriginValidator(
             AuthMiddlewareStack(
-                URLRouter(websocket_urlpatterns)  # <- lädt jetzt die Routen aus ultictactoe_app
+                URLRouter(websocket_urlpatterns + chat_urlpatterns)  # <- Spiel + Chat
             )
         ),
     }
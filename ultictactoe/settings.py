@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -91,6 +92,19 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL: Leser blockieren den Writer nicht; synchronous=NORMAL reicht mit WAL
+            # (fsync beim Checkpoint statt bei jedem Commit)
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA cache_size=-20000;'
+                'PRAGMA mmap_size=134217728;'
+            ),
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -145,11 +159,113 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
 ASGI_APPLICATION = "ultictactoe.asgi.application"
+# HybridChannelLayer = RedisChannelLayer, aber Gruppen-Mitglieder im selben
+# Prozess bekommen ihre Nachrichten direkt (ultictactoe_app.layers)
 CHANNEL_LAYERS = {
     "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
+        "BACKEND": "ultictactoe_app.layers.HybridChannelLayer",
         "CONFIG": {
             "hosts": [("127.0.0.1", 6379)],
+            # s, so lange gilt "keine anderen Prozesse in der Gruppe" höchstens; Beitritte
+            # anderer Worker leeren den Cache sofort (Pub/Sub). 0 = bei jedem group_send fragen
+            "registry_ttl": 5.0,
+        },
+    },
+}
+
+# Raum-Zustand (ultictactoe_app.store). Für mehrere Daphne-Worker auf Redis umstellen:
+#   "BACKEND": "ultictactoe_app.store.RedisRoomStore",
+#   "CONFIG": {"url": "redis://127.0.0.1:6379/1"},
+ROOM_STORE = {
+    "BACKEND": "ultictactoe_app.store.InMemoryRoomStore",
+}
+
+# Raum-Codes (ultictactoe_app.codes)
+ROOM_CODE_LENGTH = 4                 # 4 -> 10k Codes, 5 -> 100k, ...
+ROOM_CODE_RESERVATION_TTL = 120      # Sekunden, bis ein vergebener Code ohne Join verfällt
+
+# Zuschauer (ultictactoe_app.spectators), ws/game/<code>/?role=spectator
+SPECTATORS_PER_ROOM = 5000
+SPECTATORS_PER_PROCESS = 20000
+SPECTATOR_TICK = 0.1                 # Sekunden; schnelle Züge in dem Fenster werden zusammengefasst
+SPECTATOR_RELAY = False              # bei mehreren Workern (RedisRoomStore) einschalten
+
+# Bot-Gegner (ultictactoe_app.bot), läuft in einem eigenen Prozess-Pool
+BOT_WORKERS = 2                      # Prozesse = gleichzeitige Suchen
+BOT_MAX_GAMES = 20                   # Räume mit Bot gleichzeitig
+BOT_MOVE_MS = 500                    # Denkzeit pro Zug
+BOT_MAX_MOVE_MS = 2000               # Obergrenze, falls der Host mehr will (add_bot budget_ms)
+BOT_MAX_PLAYOUTS = 200_000
+HINT_MS = 200                        # Analyse (ultictactoe_app.analysis) für action "hint"
+HINT_SLOTS = 1                       # eigene Pool-Prozesse für Hints, zusätzlich zu BOT_WORKERS
+HINT_RATE = 0.5                      # Hints pro Sekunde und Verbindung (Dauer) ...
+HINT_BURST = 3                       # ... und so viele direkt hintereinander
+
+
+# Unbenutzte Räume nach so vielen Sekunden (je Phase) löschen und den Code freigeben
+ROOM_TTL = {"lobby": 1800, "starting": 900, "playing": 900, "finished": 300}
+ROOM_REAPER_TICK = 1.0               # Auflösung des Timer-Rads in Sekunden
+
+# Wiederverbinden (ultictactoe_app.resume): Token beim Join, verpasste Events aus dem Ringpuffer
+RESUME_TOKEN_TTL = 3600              # s
+RESUME_LOG_SIZE = 64                 # Events pro Raum
+
+
+# Schnelles Spiel (ultictactoe_app.matchmaking): Suchfenster ± Wertung, wächst mit der Wartezeit
+MATCH_BUCKET = 50                    # Bucketbreite des Index in Wertungspunkten
+MATCH_WINDOW = 100                   # Startfenster
+MATCH_WIDEN = 25.0                   # + Punkte pro Sekunde Wartezeit
+MATCH_MAX_WINDOW = 800
+MATCH_TICK = 0.5                     # so oft wird für Wartende neu gesucht (s)
+
+
+# Elo + Rangliste (user_app.ratings): nur Partien zwischen zwei eingeloggten Spielern
+RATINGS_ENABLED = True
+LEADERBOARD_PAGE_SIZE = 50
+LEADERBOARD_REFRESH = 300            # s, danach lädt ein Worker den Index neu aus der DB (Änderungen anderer Worker)
+
+
+# Chat (chat_app.consumers): Limits pro Verbindung, Verlauf + Sammeln pro Raum
+CHAT_RATE = 2.0                      # Nachrichten pro Sekunde im Schnitt ...
+CHAT_BURST = 5                       # ... und so viele auf einmal
+CHAT_MAX_FRAME = 2048                # Bytes pro eingehendem Frame
+CHAT_MAX_LENGTH = 500                # Zeichen pro Nachricht
+CHAT_HISTORY = 50                    # letzte N Nachrichten für Nachzügler
+CHAT_TICK = 0.1                      # s, so oft geht pro Raum höchstens ein Frame raus
+
+
+# Partien/Züge in die DB (ultictactoe_app.history): gepuffert, gebündelt geschrieben
+HISTORY_ENABLED = True
+HISTORY_BATCH_SIZE = 500             # Einträge pro Transaktion
+HISTORY_FLUSH_INTERVAL = 0.5         # Sekunden, spätestens dann wird geschrieben
+HISTORY_MAX_QUEUE = 50_000           # voll -> Züge warten (HISTORY_BLOCK s), dann verwerfen
+HISTORY_BLOCK = 1.0
+
+# Neustart: laufende Räume aus Snapshot + Zügen danach wiederherstellen (ultictactoe_app.recovery)
+RECOVER_ROOMS = True
+SNAPSHOT_INTERVAL = 5.0              # Sekunden zwischen Snapshots geänderter Räume
+
+
+# Metriken unter /metrics (ultictactoe_app.metrics); None = von überall
+METRICS_ALLOWED_IPS = ("127.0.0.1", "::1")
+
+# Logging: ULTICTACTOE_LOG_LEVEL=DEBUG für Debug-Ausgaben aus dem Zug-Pfad,
+# davon wird nur ein Anteil (LOG_DEBUG_SAMPLE) geschrieben
+LOG_DEBUG_SAMPLE = 0.01
+LOGGING = {
+    "version": 1,
+    "disable_existing_loggers": False,
+    "formatters": {
+        "plain": {"format": "%(asctime)s %(levelname)s %(name)s %(message)s"},
+    },
+    "handlers": {
+        "console": {"class": "logging.StreamHandler", "formatter": "plain"},
+    },
+    "loggers": {
+        "ultictactoe_app": {
+            "handlers": ["console"],
+            "level": os.environ.get("ULTICTACTOE_LOG_LEVEL", "INFO"),
+            "propagate": False,
         },
     },
 }
@@ -17,7 +17,7 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
-from ultictactoe_app.views import Index
+from ultictactoe_app.views import Index, Metrics
 
 urlpatterns = [
     path("chat/", include("chat_app.urls")),
@@ -27,6 +27,7 @@ urlpatterns = [
     
     path('play/', include('ultictactoe_app.urls')),
     path('user/', include('user_app.urls')),
+    path("metrics", Metrics.as_view(), name="metrics"),
     path("", Index.as_view(), name="index"),
 
 ]
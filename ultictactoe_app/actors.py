@@ -0,0 +1,69 @@
+# ultictactoe_app/actors.py
+"""
+Befehle pro Raum strikt nacheinander ausführen.
+
+Jeder Raum bekommt einen eigenen Lock (angelegt beim ersten Befehl,
+weggeräumt, sobald niemand mehr wartet). Befehle für denselben Raum
+laufen in Ankunftsreihenfolge, verschiedene Räume laufen parallel –
+kein globaler Lock, der den ganzen Server ausbremst.
+
+Dazu gibt es Queue-Tiefen pro Raum, um "heiße" Räume zu finden.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+
+
+class _RoomSlot:
+    __slots__ = ("lock", "depth", "peak")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()   # asyncio.Lock ist FIFO-fair
+        self.depth = 0               # laufender + wartende Befehle
+        self.peak = 0
+
+
+class RoomSerializer:
+    def __init__(self):
+        self._slots = {}      # code -> _RoomSlot
+        self.commands = 0     # insgesamt ausgeführte Befehle
+        self.max_depth = 0    # höchste je gesehene Queue-Tiefe (alle Räume)
+
+    @asynccontextmanager
+    async def hold(self, code: str):
+        """
+        async with room_commands.hold(code):
+            ... Raum lesen, ändern, senden ...
+        """
+        slot = self._slots.get(code)
+        if slot is None:
+            slot = self._slots[code] = _RoomSlot()
+        slot.depth += 1
+        if slot.depth > slot.peak:
+            slot.peak = slot.depth
+            if slot.depth > self.max_depth:
+                self.max_depth = slot.depth
+        try:
+            async with slot.lock:
+                yield
+        finally:
+            slot.depth -= 1
+            self.commands += 1
+            if not slot.depth:
+                self._slots.pop(code, None)
+
+    def depth(self, code: str) -> int:
+        slot = self._slots.get(code)
+        return slot.depth if slot else 0
+
+    def hot_rooms(self, limit: int = 10):
+        """[(code, depth, peak), …] – Räume mit den längsten Queues zuerst."""
+        hot = sorted(self._slots.items(), key=lambda kv: kv[1].depth, reverse=True)
+        return [(code, s.depth, s.peak) for code, s in hot[:limit]]
+
+    def stats(self) -> dict:
+        return {
+            "busy_rooms": len(self._slots),
+            "queued": sum(s.depth for s in self._slots.values()),
+            "max_depth": self.max_depth,
+            "commands": self.commands,
+        }
@@ -1,3 +1,17 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Game, Move
+
+
+class MoveInline(admin.TabularInline):
+    model = Move
+    extra = 0
+    readonly_fields = ("ply", "symbol", "big", "small", "played_at")
+
+
+@admin.register(Game)
+class GameAdmin(admin.ModelAdmin):
+    list_display = ("room", "x_name", "o_name", "winner", "moves", "started_at", "finished_at")
+    list_filter = ("winner",)
+    search_fields = ("room", "x_name", "o_name")
+    inlines = [MoveInline]
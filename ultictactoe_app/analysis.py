@@ -0,0 +1,323 @@
+# ultictactoe_app/analysis.py
+"""
+Stellungsanalyse: Alpha-Beta (Negamax) mit iterativer Vertiefung.
+
+  - Zobrist-Hash über die 81 Zellen (je Spieler), das erzwungene Großfeld
+    und wer am Zug ist; wird pro Zug inkrementell nachgeführt
+  - Transpositionstabelle fester Größe, 2 Einträge pro Bucket:
+    einer tiefenbevorzugt (ältere Suchen werden verdrängt), einer immer ersetzen
+  - Zugsortierung: TT-Zug zuerst, dann History-Heuristik
+
+Deterministisch (feste Zobrist-Schlüssel, keine Zufallszüge). Ohne Django –
+läuft im Server im Bot-Prozess-Pool (Hinweise) oder direkt für Massenanalyse:
+
+    solver = Solver()
+    a = solver.analyze(game, time_ms=200)
+    a.best, a.score, a.pv, a.nodes, a.nps
+"""
+import random
+import time
+
+from .bot import BITS, DRAW, Position
+from .engine import FULL, LINE_MASKS
+
+MATE = 100_000
+INF = 1_000_000
+EXACT, LOWER, UPPER = 0, 1, 2
+
+_rng = random.Random(0x55A7)
+Z_CELL = tuple(tuple(_rng.getrandbits(64) for _ in range(81)) for _ in range(2))
+Z_FORCED = tuple(_rng.getrandbits(64) for _ in range(10))   # Index forced + 1
+Z_TURN = _rng.getrandbits(64)
+
+POP = tuple(bin(m).count("1") for m in range(512))
+
+# Gewicht der kleinen Felder nach Lage auf dem großen Brett (Mitte > Ecke > Kante)
+BIG_WEIGHT = (3, 2, 3, 2, 4, 2, 3, 2, 3)
+
+
+def zobrist(pos) -> int:
+    h = Z_FORCED[pos.forced + 1]
+    if pos.turn:
+        h ^= Z_TURN
+    for side in (0, 1):
+        zc = Z_CELL[side]
+        for big in range(9):
+            for s in BITS[pos.boards[side][big]]:
+                h ^= zc[big * 9 + s]
+    return h
+
+
+# --- Bewertung ------------------------------------------------------------------
+
+def _open_lines(me, block):
+    # offene Linien (ohne Gegner-/Sperrfelder): 2 eigene -> 3 Punkte, 1 eigenes -> 1
+    sc = 0
+    for lm in LINE_MASKS:
+        if not lm & block:
+            n = POP[me & lm]
+            sc += 3 if n == 2 else n
+    return sc
+
+
+_SMALL = {}
+_META = {}
+
+
+def _small(x, o):
+    k = x << 9 | o
+    v = _SMALL.get(k)
+    if v is None:
+        v = _SMALL[k] = _open_lines(x, o) - _open_lines(o, x)
+    return v
+
+
+def _meta(mx, mo, md):
+    k = (mx << 9 | mo) << 9 | md
+    v = _META.get(k)
+    if v is None:
+        won = sum(BIG_WEIGHT[b] for b in BITS[mx]) - sum(BIG_WEIGHT[b] for b in BITS[mo])
+        v = _META[k] = 8 * won + 12 * (_open_lines(mx, mo | md) - _open_lines(mo, mx | md))
+    return v
+
+
+def evaluate(pos) -> int:
+    """Heuristik aus Sicht des Spielers am Zug."""
+    bx, bo = pos.boards
+    mx, mo, md = pos.meta
+    s = _meta(mx, mo, md)
+    for big in BITS[FULL & ~(mx | mo | md)]:
+        s += _small(bx[big], bo[big]) * BIG_WEIGHT[big]
+    return -s if pos.turn else s
+
+
+# --- Transpositionstabelle --------------------------------------------------------
+
+class TranspositionTable:
+    """
+    2**bits Buckets, je zwei Einträge (key, depth, flag, score, move, age):
+      deep   -> ersetzt nur bei >= Tiefe oder wenn aus einer älteren Suche
+      recent -> nimmt alles, was in deep keinen Platz bekommt
+    """
+
+    def __init__(self, bits=16):
+        self.mask = (1 << bits) - 1
+        self.deep = [None] * (self.mask + 1)
+        self.recent = [None] * (self.mask + 1)
+        self.age = 0
+        self.hits = 0
+
+    def probe(self, key):
+        i = key & self.mask
+        e = self.deep[i]
+        if e is not None and e[0] == key:
+            self.hits += 1
+            return e
+        e = self.recent[i]
+        if e is not None and e[0] == key:
+            self.hits += 1
+            return e
+        return None
+
+    def store(self, key, depth, flag, score, move):
+        i = key & self.mask
+        e = self.deep[i]
+        entry = (key, depth, flag, score, move, self.age)
+        if e is None or e[0] == key or depth >= e[1] or e[5] != self.age:
+            self.deep[i] = entry
+        else:
+            self.recent[i] = entry
+
+    def new_search(self):
+        self.age += 1
+
+    def clear(self):
+        self.deep = [None] * (self.mask + 1)
+        self.recent = [None] * (self.mask + 1)
+        self.age = 0
+        self.hits = 0
+
+
+# --- Suche -------------------------------------------------------------------------
+
+class _Timeout(Exception):
+    pass
+
+
+class Analysis:
+    """
+    score    -> Bewertung aus Sicht des Spielers am Zug (> 0 gut für ihn)
+    best     -> (big, small) oder None
+    pv       -> Hauptvariante [(big, small), …]
+    mate     -> Züge bis zum erzwungenen Ende (+ gewinnt, - verliert) oder None
+    depth, nodes, nps, time_ms
+    """
+
+    __slots__ = ("score", "best", "pv", "mate", "depth", "nodes", "nps", "time_ms")
+
+    def __init__(self, score, best, pv, mate, depth, nodes, time_ms):
+        self.score = score
+        self.best = best
+        self.pv = pv
+        self.mate = mate
+        self.depth = depth
+        self.nodes = nodes
+        self.time_ms = time_ms
+        self.nps = int(nodes / (time_ms / 1000)) if time_ms > 0 else 0
+
+    def as_dict(self) -> dict:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+def _mate_in(score):
+    if score >= MATE - 1000:
+        return MATE - score
+    if score <= -MATE + 1000:
+        return -(MATE + score)
+    return None
+
+
+def _cell(c):
+    return (c // 9, c % 9) if c is not None else None
+
+
+class Solver:
+    """Hält TT und History über mehrere Analysen (z. B. alle Stellungen einer Partie)."""
+
+    def __init__(self, tt_bits=16):
+        self.tt = TranspositionTable(tt_bits)
+        self.history = [[0] * 81, [0] * 81]
+        self.nodes = 0
+        self._deadline = None
+
+    def analyze(self, game, max_depth=None, time_ms=None) -> Analysis:
+        """
+        game: engine.GameState oder bot.Position.
+        Ohne max_depth und time_ms wird bis Tiefe 6 gesucht.
+        """
+        pos = game if isinstance(game, Position) else Position.from_game(game)
+        if max_depth is None:
+            max_depth = 81 if time_ms else 6
+        start = time.perf_counter()
+        self._deadline = start + time_ms / 1000 if time_ms else None
+        self.nodes = 0
+        self.tt.new_search()
+        self.history = [[v >> 2 for v in h] for h in self.history]
+
+        if pos.result is not None:
+            score = 0 if pos.result == DRAW else -MATE
+            return Analysis(score, None, [], _mate_in(score), 0, 0, 0.0)
+
+        key = zobrist(pos)
+        score, best, depth = evaluate(pos), None, 0
+        for d in range(1, max_depth + 1):
+            try:
+                s = self._search(pos.copy(), key, d, -INF, INF, 0)
+            except _Timeout:
+                break
+            e = self.tt.probe(key)
+            score, best, depth = s, e[4] if e else best, d
+            if _mate_in(s) is not None:
+                break   # entschieden, tiefer bringt nichts
+        if best is None:
+            best = pos.legal()[0]   # nicht mal Tiefe 1 geschafft
+
+        elapsed = (time.perf_counter() - start) * 1000
+        return Analysis(score, _cell(best), self._pv(pos, key, best, depth),
+                        _mate_in(score), depth, self.nodes, elapsed)
+
+    def analyze_game(self, moves, max_depth=4, time_ms=None):
+        """
+        Alle Stellungen einer Partie (GameState.moves: big*9+small pro Zug).
+        Rückgabe: [Analysis vor Zug 1, vor Zug 2, …]
+        """
+        pos = Position([[0] * 9, [0] * 9], [0, 0, 0], 0, -1)
+        out = []
+        for cell in moves:
+            out.append(self.analyze(pos.copy(), max_depth=max_depth, time_ms=time_ms))
+            pos.play(cell)
+        return out
+
+    def _pv(self, pos, key, best, depth):
+        p, pv, move = pos.copy(), [], best
+        while move is not None and len(pv) < max(depth, 1) and move in p.legal():
+            pv.append(_cell(move))
+            me, old = p.turn, p.forced
+            p.play(move)
+            key ^= Z_CELL[me][move] ^ Z_FORCED[old + 1] ^ Z_FORCED[p.forced + 1] ^ Z_TURN
+            e = self.tt.probe(key)
+            move = e[4] if e else None
+        return pv
+
+    def _search(self, pos, key, depth, alpha, beta, ply):
+        self.nodes += 1
+        if self._deadline and not self.nodes & 1023 and time.perf_counter() > self._deadline:
+            raise _Timeout
+
+        if pos.result is not None:
+            return 0 if pos.result == DRAW else -(MATE - ply)   # der Gegner hat gerade gewonnen
+        if depth <= 0:
+            return evaluate(pos)
+
+        alpha0 = alpha
+        tt_move = None
+        e = self.tt.probe(key)
+        if e is not None:
+            tt_move = e[4]
+            if e[1] >= depth:
+                s = e[3]
+                if s >= MATE - 1000:
+                    s -= ply
+                elif s <= -MATE + 1000:
+                    s += ply
+                if e[2] == EXACT:
+                    return s
+                if e[2] == LOWER and s >= beta:
+                    return s
+                if e[2] == UPPER and s <= alpha:
+                    return s
+
+        me = pos.turn
+        hist = self.history[me]
+        moves = pos.legal()
+        moves.sort(key=hist.__getitem__, reverse=True)
+        if tt_move is not None and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+
+        boards, meta = pos.boards[me], pos.meta
+        z_me, z_old = Z_CELL[me], Z_FORCED[pos.forced + 1] ^ Z_TURN
+        best, best_move = -INF, None
+        for cell in moves:
+            big = cell // 9
+            old_mask, m0, m1, m2, old_forced = boards[big], meta[0], meta[1], meta[2], pos.forced
+            pos.play(cell)
+            s = -self._search(pos, key ^ z_me[cell] ^ z_old ^ Z_FORCED[pos.forced + 1],
+                              depth - 1, -beta, -alpha, ply + 1)
+            # Zug zurücknehmen
+            boards[big] = old_mask
+            meta[0], meta[1], meta[2] = m0, m1, m2
+            pos.forced, pos.turn, pos.result = old_forced, me, None
+
+            if s > best:
+                best, best_move = s, cell
+                if s > alpha:
+                    alpha = s
+                    if alpha >= beta:
+                        hist[cell] += depth * depth
+                        break
+
+        if best <= alpha0:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        stored = best + ply if best >= MATE - 1000 else (best - ply if best <= -MATE + 1000 else best)
+        self.tt.store(key, depth, flag, stored, best_move)
+        return best
+
+
+def hint(state, time_ms):
+    """Einstieg für den Prozess-Pool: Stellung als Tupel (bot.Position.to_tuple) -> dict."""
+    return Solver(tt_bits=15).analyze(Position.from_tuple(state), time_ms=time_ms).as_dict()
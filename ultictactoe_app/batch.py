@@ -0,0 +1,140 @@
+# ultictactoe_app/batch.py
+"""
+Viele Partien gleichzeitig als NumPy-Arrays (für manage.py selfplay).
+
+Gleiche Bitboards wie engine.GameState, nur mit einer Batch-Achse vorne:
+  boards  (B, 2, 9)  uint16  Masken von X / O pro kleinem Feld
+  meta    (B, 3)     uint16  gewonnene Großfelder X / O / unentschieden
+  turn    (B,)       uint8   0 = X, 1 = O
+  forced  (B,)       int8    -1 = freie Wahl
+  result  (B,)       int8    -1 = läuft, 0 = X, 1 = O, 2 = Unentschieden
+Legale Züge und Sieg-Checks laufen über Nachschlagetabellen für alle
+Partien auf einmal statt einmal small_result() pro Feld.
+
+Braucht numpy (in requirements.txt unter "optional"; nur selfplay nutzt es).
+"""
+import numpy as np
+
+from .engine import FULL, WIN_LINE
+
+# BIT_CELLS[m] -> 9 bools, Bit i von m gesetzt
+BIT_CELLS = np.array([[(m >> i) & 1 for i in range(9)] for m in range(512)], dtype=bool)
+WINS = np.array([w >= 0 for w in WIN_LINE], dtype=bool)
+ONE = np.array([1 << i for i in range(9)], dtype=np.uint16)
+
+RESULT_CODES = {0: "X", 1: "O", 2: "D"}
+
+
+class Batch:
+    def __init__(self, size: int, rng=None):
+        self.size = size
+        self.rng = rng or np.random.default_rng()
+        self.boards = np.zeros((size, 2, 9), dtype=np.uint16)
+        self.meta = np.zeros((size, 3), dtype=np.uint16)
+        self.turn = np.zeros(size, dtype=np.uint8)
+        self.forced = np.full(size, -1, dtype=np.int8)
+        self.result = np.full(size, -1, dtype=np.int8)
+        self.moves = np.zeros((size, 81), dtype=np.uint8)   # Zellen big*9+small
+        self.length = np.zeros(size, dtype=np.uint8)
+
+    def legal(self) -> np.ndarray:
+        """(B, 81) bool – für beendete Partien alles False."""
+        occupied = self.boards[:, 0] | self.boards[:, 1]                 # (B, 9)
+        empty = ~BIT_CELLS[occupied]                                      # (B, 9, 9)
+        open_big = ~BIT_CELLS[self.meta[:, 0] | self.meta[:, 1] | self.meta[:, 2]]   # (B, 9)
+        forced = self.forced >= 0
+        only = np.zeros_like(open_big)
+        only[forced, self.forced[forced]] = True
+        allowed = np.where(forced[:, None], only, open_big) & (self.result < 0)[:, None]
+        return (empty & allowed[:, :, None]).reshape(self.size, 81)
+
+    def wins_small(self) -> np.ndarray:
+        """(B, 81) bool – Zug würde für den Spieler am Zug das kleine Feld gewinnen."""
+        idx = np.arange(self.size)
+        mine = self.boards[idx, self.turn]                                # (B, 9)
+        return WINS[mine[:, :, None] | ONE[None, None, :]].reshape(self.size, 81)
+
+    def choose(self, policy: str = "random") -> np.ndarray:
+        """Ein Zug pro laufender Partie (Zelle 0..80), -1 für beendete."""
+        legal = self.legal()
+        score = self.rng.random(legal.shape)
+        if policy == "greedy":
+            score += self.wins_small() * 2.0   # kleines Feld gewinnen, wenn es geht
+        score[~legal] = -1.0
+        cell = score.argmax(axis=1)
+        cell[~legal.any(axis=1)] = -1
+        return cell
+
+    def play(self, cell: np.ndarray):
+        """Züge eintragen (cell wie aus choose(), -1 wird übersprungen)."""
+        live = np.nonzero(cell >= 0)[0]
+        if not live.size:
+            return
+        c = cell[live]
+        big, small = c // 9, c % 9
+        me = self.turn[live]
+
+        mask = self.boards[live, me, big] | ONE[small]
+        self.boards[live, me, big] = mask
+        other = self.boards[live, 1 - me, big]
+
+        won = WINS[mask]
+        full = ~won & ((mask | other) == FULL)
+        big_bit = ONE[big]
+        self.meta[live[won], me[won]] |= big_bit[won]
+        self.meta[live[full], 2] |= big_bit[full]
+
+        meta_me = self.meta[live, me]
+        game_won = won & WINS[meta_me]
+        done = self.meta[live, 0] | self.meta[live, 1] | self.meta[live, 2]
+        draw = ~game_won & (done == FULL)
+        res = self.result[live]
+        res[game_won] = me[game_won]
+        res[draw] = 2
+        self.result[live] = res
+
+        target_done = BIT_CELLS[done, small] | (res >= 0)
+        self.forced[live] = np.where(target_done, -1, small).astype(np.int8)
+        self.turn[live] = 1 - me
+
+        self.moves[live, self.length[live]] = c
+        self.length[live] += 1
+
+    def run(self, policy: str = "random"):
+        while True:
+            cell = self.choose(policy)
+            if (cell < 0).all():
+                return
+            self.play(cell)
+
+    def encode(self) -> bytes:
+        """
+        Kompaktes Format, eine Partie nach der anderen:
+          1 Byte Länge n, 1 Byte Ergebnis (0 X, 1 O, 2 D), n Byte Zellen
+        """
+        out = bytearray()
+        for i in range(self.size):
+            n = int(self.length[i])
+            out.append(n)
+            out.append(int(self.result[i]))
+            out += self.moves[i, :n].tobytes()
+        return bytes(out)
+
+
+def decode(data: bytes):
+    """Umkehrung von Batch.encode: [(result, bytes der Züge), …]"""
+    out, i = [], 0
+    while i < len(data):
+        n, res = data[i], data[i + 1]
+        out.append((res, data[i + 2:i + 2 + n]))
+        i += 2 + n
+    return out
+
+
+def play_batch(size: int, policy: str, seed: int):
+    """Einstieg für den Prozess-Pool: (kodierte Partien, Zähler X/O/D, Zugsumme, Eröffnungen)."""
+    b = Batch(size, np.random.default_rng(seed))
+    b.run(policy)
+    counts = np.bincount(b.result.astype(np.int64), minlength=3)
+    openings = np.bincount(b.moves[:, 0].astype(np.int64), minlength=81)
+    return b.encode(), counts.tolist(), int(b.length.sum()), openings.tolist()
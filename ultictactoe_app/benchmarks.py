@@ -0,0 +1,289 @@
+# ultictactoe_app/benchmarks.py
+"""
+Mikro-Benchmarks für Spielregeln und Consumer (manage.py bench).
+
+Jeder Fall liefert Zeiten pro Operation in µs (Median, Minimum, p95 über
+mehrere Durchläufe). Ergebnisse lassen sich als JSON-Baseline speichern
+und später vergleichen. Verglichen wird das Minimum (am wenigsten vom
+Rest der Maschine gestört); als Regression zählt ein Fall erst, wenn er
+um mehr als `threshold` plus sein gemessenes Rauschen langsamer ist.
+Mit repeat > 1 läuft jeder Fall mehrmals, das drückt das Rauschen weiter.
+
+Consumer-Roundtrips laufen komplett im Prozess: InMemoryChannelLayer,
+InMemoryRoomStore und channels' WebsocketCommunicator – kein Redis nötig,
+die DB-Historie (history.py) ist dabei abgeschaltet.
+"""
+import asyncio
+import contextlib
+import io
+import json
+import platform
+import random
+import statistics
+import time
+import timeit
+
+from .codes import CodeAllocator
+from .engine import GameState
+
+CASES = {}
+
+
+def case(name):
+    def deco(fn):
+        CASES[name] = fn
+        return fn
+    return deco
+
+
+def _stats(samples_us):
+    samples_us = sorted(samples_us)
+    return {
+        "median_us": round(statistics.median(samples_us), 3),
+        "min_us": round(samples_us[0], 3),
+        "p95_us": round(samples_us[min(len(samples_us) - 1, int(len(samples_us) * 0.95))], 3),
+        "n": len(samples_us),
+    }
+
+
+def _timeit(fn, number, repeat):
+    # pro Durchlauf: Zeit / number -> µs pro Aufruf
+    return _stats([t / number * 1e6 for t in timeit.repeat(fn, number=number, repeat=repeat)])
+
+
+def _random_game(moves, seed=1):
+    rng = random.Random(seed)
+    g = GameState()
+    for _ in range(moves):
+        if g.winner:
+            break
+        g.apply_move(*rng.choice(_legal(g)))
+    return g
+
+
+def _legal(g):
+    return [(b, s) for b in range(9) for s in range(9)
+            if g.forced in (-1, b) and not g.is_finished(b) and not g.is_occupied(b, s)]
+
+
+# --- Spielregeln ----------------------------------------------------------------
+
+@case("small_result")
+def _bench_small_result(scale):
+    from .consumers import small_result
+    rng = random.Random(2)
+    boards = []
+    for _ in range(64):
+        cells = {}
+        for i in rng.sample(range(9), rng.randrange(10)):
+            cells[i] = rng.choice("XO")
+        boards.append(cells)
+    return _timeit(lambda: [small_result(b) for b in boards], 200 * scale, 7) | {"per": 64}
+
+
+@case("big_board_winner")
+def _bench_big_board_winner(scale):
+    from .consumers import big_board_winner
+    fields = [_random_game(m, seed=m).finished_fields() for m in range(0, 81, 3)]
+    return _timeit(lambda: [big_board_winner(f) for f in fields], 500 * scale, 7) | {"per": len(fields)}
+
+
+@case("is_global_draw")
+def _bench_is_global_draw(scale):
+    from .consumers import is_global_draw
+    fields = [_random_game(m, seed=m).finished_fields() for m in range(0, 81, 3)]
+    fields.append({b: "D" for b in range(9)})
+    return _timeit(lambda: [is_global_draw(f) for f in fields], 500 * scale, 7) | {"per": len(fields)}
+
+
+@case("_is_big_finished")
+def _bench_is_big_finished(scale):
+    from .consumers import _is_big_finished
+    from .rooms import Room
+    room = Room("0000")
+    room.game = _random_game(50)
+    return _timeit(lambda: [_is_big_finished(room, b) for b in range(9)], 2000 * scale, 7) | {"per": 9}
+
+
+def _code_case(fill):
+    def run(scale):
+        from . import consumers
+        alloc = CodeAllocator(length=4, rng=random.Random(3))
+        for _ in range(int(alloc.size * fill)):
+            alloc.claim(*alloc.reserve())
+        saved, consumers.code_allocator = consumers.code_allocator, alloc
+
+        def op():
+            # ziehen + zurückgeben, damit der Füllstand gleich bleibt
+            alloc.release(consumers.generate_unique_code()[0])
+        try:
+            return _timeit(op, 2000 * scale, 7)
+        finally:
+            consumers.code_allocator = saved
+    return run
+
+
+for _fill in (0.0, 0.5, 0.9, 0.99):
+    case(f"generate_unique_code@{int(_fill * 100)}%")(_code_case(_fill))
+
+
+# --- Consumer-Roundtrips -----------------------------------------------------------
+
+def _roundtrip(kind):
+    def run(scale):
+        from django.test import override_settings
+        with override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}), \
+                contextlib.redirect_stdout(io.StringIO()):
+            return asyncio.run(_consumer_bench(kind, 100 * scale))
+    return run
+
+
+async def _consumer_bench(kind, n):
+    from channels.routing import URLRouter
+    from channels.testing import WebsocketCommunicator
+
+    from . import consumers
+    from .routing import websocket_urlpatterns
+    from .store import InMemoryRoomStore
+
+    app = URLRouter(websocket_urlpatterns)
+    saved, consumers.room_store = consumers.room_store, InMemoryRoomStore()
+    history_enabled, consumers.history.enabled = consumers.history.enabled, False   # keine DB im Benchmark
+
+    async def connect(room):
+        c = WebsocketCommunicator(app, f"/ws/game/{room}/")
+        ok, _ = await c.connect()
+        assert ok
+        return c
+
+    async def send(c, payload):
+        await c.send_to(text_data=json.dumps(payload))
+
+    async def drain(c):
+        while not await c.receive_nothing(timeout=0.001):
+            await c.receive_from()
+
+    samples = []
+    try:
+        if kind == "create_or_join":
+            for i in range(n):
+                t = time.perf_counter()
+                c = await connect(f"b{i}")
+                await send(c, {"action": "create_or_join", "nickname": "A"})
+                await c.receive_from()   # player_list
+                await c.receive_from()   # joined
+                samples.append((time.perf_counter() - t) * 1e6)
+                await c.disconnect()
+            return _stats(samples)
+
+        a, b = await connect("bench"), await connect("bench")
+        for c, nick in ((a, "A"), (b, "B")):
+            await send(c, {"action": "create_or_join", "nickname": nick})
+            await drain(a)
+            await drain(b)
+        await send(a, {"action": "start_game"})
+        await drain(a)
+        await drain(b)
+        by_symbol = {"X": a, "O": b}
+        rng = random.Random(4)
+
+        if kind == "game_move":
+            while len(samples) < n:
+                g = (await consumers.room_store.get("bench")).game
+                if g.winner:
+                    await send(a, {"action": "reset"})
+                    await drain(a)
+                    await drain(b)
+                    continue
+                big, small = rng.choice(_legal(g))
+                mover = by_symbol[g.current]
+                t = time.perf_counter()
+                await send(mover, {"action": "game_move", "big": big, "small": small})
+                await mover.receive_from()    # eigener move-Broadcast
+                samples.append((time.perf_counter() - t) * 1e6)
+                await drain(a)
+                await drain(b)
+        else:
+            # Stellung mit ein paar Zügen, dann get_state / sync messen
+            for _ in range(30):
+                g = (await consumers.room_store.get("bench")).game
+                if g.winner:
+                    break
+                big, small = rng.choice(_legal(g))
+                await send(by_symbol[g.current], {"action": "game_move", "big": big, "small": small})
+                await drain(a)
+                await drain(b)
+            v = (await consumers.room_store.get("bench")).game.version
+            payload = {"action": "get_state"} if kind == "get_state" else {"action": "sync", "since": max(0, v - 3)}
+            for _ in range(n):
+                t = time.perf_counter()
+                await send(a, payload)
+                await a.receive_from()
+                samples.append((time.perf_counter() - t) * 1e6)
+        await a.disconnect()
+        await b.disconnect()
+        return _stats(samples)
+    finally:
+        consumers.room_store = saved
+        consumers.history.enabled = history_enabled
+
+
+for _kind in ("create_or_join", "game_move", "get_state", "sync"):
+    case(f"roundtrip:{_kind}")(_roundtrip(_kind))
+
+
+# --- Ausführen / Vergleichen ---------------------------------------------------------
+
+def _merge(runs):
+    """Mehrere Läufe eines Falls zusammenfassen; noise = relative Streuung (Median zu Minimum)."""
+    out = dict(runs[0])
+    out["min_us"] = min(r["min_us"] for r in runs)
+    out["median_us"] = round(statistics.median(r["median_us"] for r in runs), 3)
+    out["p95_us"] = round(statistics.median(r["p95_us"] for r in runs), 3)
+    out["n"] = sum(r["n"] for r in runs)
+    # Streuung innerhalb eines Laufs und zwischen den Minima der Läufe, das Größere zählt
+    spread = max(r["min_us"] for r in runs) / out["min_us"] - 1 if out["min_us"] else 0.0
+    jitter = out["median_us"] / out["min_us"] - 1 if out["min_us"] else 0.0
+    out["noise"] = round(max(spread, jitter), 4)
+    return out
+
+
+def run(names=None, scale=1, progress=None, repeat=1):
+    results = {}
+    for name, fn in CASES.items():
+        if names and not any(n in name for n in names):
+            continue
+        results[name] = _merge([fn(scale) for _ in range(max(1, repeat))])
+        if progress:
+            progress(name, results[name])
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "scale": scale,
+            "repeat": max(1, repeat),
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float = 0.15):
+    """
+    [(name, baseline_us, current_us, Änderung, Grenze, regression?)] für alle
+    Fälle, die in beiden vorkommen. Änderung = current / baseline - 1 auf dem
+    Minimum; Grenze = threshold + das größere Rauschen der beiden Messungen,
+    das aber höchstens threshold zählt – ein verrauschter Fall darf sonst
+    beliebig langsamer werden. Grenze also maximal 2 * threshold.
+    """
+    rows = []
+    base = baseline.get("results", {})
+    for name, cur in current.get("results", {}).items():
+        if name not in base:
+            continue
+        b, c = base[name]["min_us"], cur["min_us"]
+        change = c / b - 1 if b else 0.0
+        noise = max(base[name].get("noise", 0.0), cur.get("noise", 0.0))
+        limit = threshold + min(noise, threshold)
+        rows.append((name, b, c, change, limit, change > limit))
+    return rows
@@ -0,0 +1,275 @@
+# ultictactoe_app/bot.py
+"""
+Computer-Gegner: Monte-Carlo-Baumsuche (UCT) auf Bitboards.
+
+Die Suche selbst (think) ist reines Python ohne Django und läuft in einem
+Prozess-Pool – der Daphne-Event-Loop wartet nur auf das Ergebnis.
+Der Zug, der dabei rauskommt, geht danach ganz normal durch
+store.apply_move(), also durch dieselbe Prüfung wie ein Spielerzug.
+
+Grenzen (siehe BotPlayer):
+  workers      -> gleichzeitig laufende Bot-Suchen
+  hint_slots   -> gleichzeitige Analysen für "hint", eigene Prozesse im Pool
+  max_games    -> Räume mit Bot gleichzeitig
+  max_budget   -> Obergrenze Denkzeit pro Zug (ms), egal was der Host will
+"""
+import asyncio
+import math
+import random
+import time
+
+from .engine import FULL, WIN_LINE
+
+# BITS[mask] -> gesetzte Bits als Tupel, z. B. BITS[0b101] == (0, 2)
+BITS = tuple(tuple(i for i in range(9) if m >> i & 1) for m in range(512))
+
+X, O, DRAW = 0, 1, 2
+
+
+class BotLimit(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+# --- Stellung ---------------------------------------------------------------
+
+class Position:
+    """
+    Schlanke Kopie von engine.GameState für die Suche:
+    boards[0][big] / boards[1][big] -> Masken von X / O, meta[0..2] -> X, O, Unentschieden,
+    turn 0 = X, forced -1 = freie Wahl, result None / X / O / DRAW.
+    """
+
+    __slots__ = ("boards", "meta", "turn", "forced", "result")
+
+    def __init__(self, boards, meta, turn, forced, result=None):
+        self.boards = boards
+        self.meta = meta
+        self.turn = turn
+        self.forced = forced
+        self.result = result
+
+    @classmethod
+    def from_game(cls, game):
+        result = {None: None, "X": X, "O": O, "D": DRAW}[game.winner]
+        return cls([list(game.x), list(game.o)], [game.meta_x, game.meta_o, game.meta_d],
+                   X if game.current == "X" else O, game.forced, result)
+
+    def to_tuple(self):
+        # für den Prozess-Pool (klein und schnell zu picklen)
+        return (tuple(self.boards[0]), tuple(self.boards[1]), tuple(self.meta),
+                self.turn, self.forced, self.result)
+
+    @classmethod
+    def from_tuple(cls, t):
+        return cls([list(t[0]), list(t[1])], list(t[2]), t[3], t[4], t[5])
+
+    def copy(self):
+        return Position([self.boards[0][:], self.boards[1][:]], self.meta[:],
+                        self.turn, self.forced, self.result)
+
+    def legal(self):
+        """Freie Zellen als big*9+small."""
+        if self.result is not None:
+            return []
+        bx, bo = self.boards
+        if self.forced >= 0:
+            big = self.forced
+            base = big * 9
+            return [base + s for s in BITS[FULL & ~(bx[big] | bo[big])]]
+        out = []
+        for big in BITS[FULL & ~(self.meta[0] | self.meta[1] | self.meta[2])]:
+            base = big * 9
+            out.extend(base + s for s in BITS[FULL & ~(bx[big] | bo[big])])
+        return out
+
+    def play(self, cell):
+        """Zug ohne Prüfung (kommt immer aus legal())."""
+        big, small = divmod(cell, 9)
+        me = self.turn
+        mask = self.boards[me][big] = self.boards[me][big] | (1 << small)
+        meta = self.meta
+        if WIN_LINE[mask] >= 0:
+            meta[me] |= 1 << big
+            if WIN_LINE[meta[me]] >= 0:
+                self.result = me
+        elif mask | self.boards[1 - me][big] == FULL:
+            meta[DRAW] |= 1 << big
+        done = meta[0] | meta[1] | meta[2]
+        if self.result is None and done == FULL:
+            self.result = DRAW
+        self.forced = -1 if self.result is not None or done >> small & 1 else small
+        self.turn = 1 - me
+
+
+# --- MCTS --------------------------------------------------------------------
+
+class _Node:
+    __slots__ = ("move", "parent", "children", "untried", "wins", "visits", "player")
+
+    def __init__(self, move, parent, untried, player):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = untried
+        self.wins = 0.0
+        self.visits = 0
+        self.player = player   # wer den Zug `move` gemacht hat
+
+
+def _rollout(pos, rng):
+    choice = rng.choice
+    while pos.result is None:
+        pos.play(choice(pos.legal()))
+    return pos.result
+
+
+def search(pos, budget_ms=500, max_playouts=200_000, seed=None, c=1.4):
+    """
+    UCT-Suche ab `pos`. Rückgabe: (cell, playouts) – cell = big*9+small
+    mit den meisten Besuchen, None wenn es keinen legalen Zug gibt.
+    """
+    rng = random.Random(seed)
+    legal = pos.legal()
+    if len(legal) <= 1:
+        return (legal[0] if legal else None), 0
+
+    root = _Node(None, None, legal, 1 - pos.turn)
+    deadline = time.perf_counter() + budget_ms / 1000
+    playouts = 0
+    log = math.log
+
+    while playouts < max_playouts:
+        # Uhr nur alle 64 Playouts fragen
+        if not playouts & 63 and time.perf_counter() >= deadline:
+            break
+        node, p = root, pos.copy()
+
+        # 1) Auswahl
+        while not node.untried and node.children:
+            lv = log(node.visits)
+            node = max(node.children,
+                       key=lambda ch: ch.wins / ch.visits + c * math.sqrt(lv / ch.visits))
+            p.play(node.move)
+
+        # 2) Erweiterung
+        if node.untried:
+            move = node.untried.pop(rng.randrange(len(node.untried)))
+            mover = p.turn
+            p.play(move)
+            child = _Node(move, node, p.legal(), mover)
+            node.children.append(child)
+            node = child
+
+        # 3) Zufallspartie, 4) Rückpropagierung
+        result = _rollout(p, rng)
+        while node is not None:
+            node.visits += 1
+            if result == node.player:
+                node.wins += 1.0
+            elif result == DRAW:
+                node.wins += 0.5
+            node = node.parent
+        playouts += 1
+
+    best = max(root.children, key=lambda ch: ch.visits)
+    return best.move, playouts
+
+
+def think(state, budget_ms, max_playouts, seed=None):
+    """Einstieg für den Prozess-Pool: Stellung als Tupel rein, (big, small, playouts) raus."""
+    cell, playouts = search(Position.from_tuple(state), budget_ms, max_playouts, seed)
+    if cell is None:
+        return None
+    return cell // 9, cell % 9, playouts
+
+
+# --- Einbindung in den Server --------------------------------------------------
+
+class BotPlayer:
+    """
+    Verwaltet Bot-Plätze und den Prozess-Pool.
+
+    seat()/unseat() pro Raum (max_games), think() rechnet einen Zug im Pool.
+    Mehr als `workers` Suchen gleichzeitig warten am Semaphor, nicht im
+    Executor – so staut sich im Pool nichts auf und menschliche Räume
+    merken davon nichts (die warten nie auf einen Bot).
+
+    hint() hat zusätzlich `hint_slots` eigene Prozesse und wartet nie:
+    sind alle belegt, gibt es sofort BotLimit. Hints können Bot-Züge also
+    weder verdrängen noch sich vor ihnen stauen.
+    """
+
+    def __init__(self, workers=2, max_games=20, budget_ms=500, max_budget_ms=2000,
+                 max_playouts=200_000, hint_slots=1):
+        self.workers = workers
+        self.hint_slots = hint_slots
+        self.max_games = max_games
+        self.budget_ms = budget_ms
+        self.max_budget_ms = max_budget_ms
+        self.max_playouts = max_playouts
+        self.games = {}          # code -> Denkzeit pro Zug (ms)
+        self.moves = 0
+        self.playouts = 0
+        self._executor = None
+        self._slots = None
+        self.hints_running = 0
+
+    def seat(self, code: str, budget_ms=None) -> int:
+        if code not in self.games and len(self.games) >= self.max_games:
+            raise BotLimit("Gerade sind alle Bots beschäftigt.")
+        try:
+            budget = int(budget_ms) if budget_ms is not None else self.budget_ms
+        except (TypeError, ValueError):
+            budget = self.budget_ms
+        self.games[code] = max(10, min(budget, self.max_budget_ms))
+        return self.games[code]
+
+    def unseat(self, code: str):
+        self.games.pop(code, None)
+
+    def _pool(self):
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn statt fork: Daphne hat schon Threads, fork wäre da heikel
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers + self.hint_slots, mp_context=multiprocessing.get_context("spawn"))
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._executor
+
+    async def run(self, fn, *args):
+        """fn(*args) im Pool ausführen (fn muss auf Modulebene liegen, wegen Pickle)."""
+        pool = self._pool()
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+    async def hint(self, fn, *args):
+        """Wie run(), aber aus dem Hint-Kontingent. Wirft BotLimit, wenn alle Plätze belegt sind."""
+        if self.hints_running >= self.hint_slots:
+            raise BotLimit("Gerade ist keine Analyse frei – gleich nochmal versuchen.")
+        pool = self._pool()
+        self.hints_running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+        finally:
+            self.hints_running -= 1
+
+    async def think(self, code: str, game):
+        """(big, small) für die aktuelle Stellung, None ohne legalen Zug."""
+        budget = self.games.get(code, self.budget_ms)
+        res = await self.run(think, Position.from_game(game).to_tuple(), budget, self.max_playouts)
+        if res is None:
+            return None
+        self.moves += 1
+        self.playouts += res[2]
+        return res[0], res[1]
+
+    def stats(self) -> dict:
+        return {"bot_games": len(self.games), "bot_moves": self.moves, "bot_playouts": self.playouts}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
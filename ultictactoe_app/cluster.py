@@ -0,0 +1,266 @@
+# ultictactoe_app/cluster.py
+"""
+Mehrere Worker-Prozesse mit Raum-Affinität (manage.py runworkers).
+
+Räume leben im Speicher eines Prozesses. Damit trotzdem alle Kerne
+arbeiten, startet der Supervisor N Daphne-Worker und davor einen kleinen
+TCP-Router: Verbindungen auf /ws/game/<raum>/ bzw. /ws/play/<raum>/ gehen
+per Consistent Hashing (HashRing) immer zum Worker, dem der Raum gehört.
+Kommt ein Worker dazu oder fällt einer weg, wandert nur ~1/N der Räume.
+
+Räume mit offenen Verbindungen bleiben an ihrem Worker festgepinnt (plus
+`pin_ttl` Sekunden nach der letzten Verbindung, für Redirect/Reconnect) –
+ein neuer Worker übernimmt nur Räume, die gerade niemand benutzt.
+
+Die Worker kennen den aktuellen Ring über eine JSON-Datei vom Supervisor
+(Membership) und vergeben nur Codes, die ihnen selbst gehören – sonst
+landet der erste Join in einem anderen Prozess.
+
+Der Router schaut nur in die erste Zeile jeder TCP-Verbindung. Browser
+öffnen für WebSockets eigene Verbindungen; HTTP-Keep-Alive über mehrere
+Pfade landet komplett beim ersten Worker (egal, HTTP ist zustandslos).
+"""
+import asyncio
+import bisect
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from urllib.parse import unquote
+
+from .metrics import log_event
+
+ROOM_PATH = re.compile(r"^/ws/(?:game|play)/([^/?]+)/")
+
+
+def norm_room(name: str) -> str:
+    # wie consumers.norm_room – Router und Consumer müssen denselben Schlüssel hashen
+    return re.sub(r"[^a-zA-Z0-9._-]", "_", (name or "").strip())[:90]
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent Hashing mit `replicas` virtuellen Punkten pro Knoten."""
+
+    def __init__(self, nodes=(), replicas: int = 128):
+        self.replicas = replicas
+        self._points = []      # sortierte Hashes
+        self._owner = {}       # Hash -> Knoten
+        self.nodes = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            h = _hash(f"{node}#{i}")
+            self._owner[h] = node
+            bisect.insort(self._points, h)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        for i in range(self.replicas):
+            h = _hash(f"{node}#{i}")
+            if self._owner.get(h) == node:
+                del self._owner[h]
+                del self._points[bisect.bisect_left(self._points, h)]
+
+    def node_for(self, key: str):
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, _hash(key)) % len(self._points)
+        return self._owner[self._points[i]]
+
+
+class Membership:
+    """
+    Sicht eines Workers auf den Ring (Datei vom Supervisor, wird höchstens
+    alle `check` Sekunden per mtime auf Änderungen geprüft).
+    """
+
+    def __init__(self, me: str, ring_file: str, check: float = 1.0, clock=time.monotonic):
+        self.me = me
+        self.ring_file = ring_file
+        self.check = check
+        self._clock = clock
+        self._checked = None
+        self._mtime = None
+        self.ring = HashRing([me])
+
+    @classmethod
+    def from_env(cls):
+        me, path = os.environ.get("ULTICTACTOE_WORKER"), os.environ.get("ULTICTACTOE_RING_FILE")
+        return cls(me, path) if me and path else None
+
+    def _refresh(self):
+        now = self._clock()
+        if self._checked is not None and now - self._checked < self.check:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.ring_file).st_mtime_ns
+            if mtime == self._mtime:
+                return
+            with open(self.ring_file) as f:
+                nodes = json.load(f)
+        except (OSError, ValueError):
+            return   # Supervisor schreibt gerade / Datei weg -> alter Ring gilt weiter
+        self._mtime = mtime
+        self.ring = HashRing(nodes or [self.me])
+
+    def owns(self, code: str) -> bool:
+        self._refresh()
+        return self.ring.node_for(norm_room(code)) == self.me
+
+
+def write_ring(path: str, nodes):
+    # erst temporär, dann umbenennen -> Worker lesen nie eine halbe Datei
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(sorted(nodes), f)
+    os.replace(tmp, path)
+
+
+class FrontRouter:
+    """
+    TCP-Proxy vor den Workern. backends: Worker-ID -> (host, port).
+    Raum-Pfade nach Ring (bzw. Pin), /ws/quickplay/ immer zu einem Worker
+    (eine gemeinsame Warteschlange), alles andere reihum.
+    """
+
+    def __init__(self, pin_ttl: float = 120.0, clock=time.monotonic):
+        self.ring = HashRing()
+        self.backends = {}
+        self.pin_ttl = pin_ttl
+        self._clock = clock
+        self._pins = {}           # raum -> [worker, offene Verbindungen, zuletzt benutzt]
+        self._rr = itertools.count()
+        self.connections = {}     # worker -> offene Verbindungen
+        self.routed = 0
+        self.moved = 0            # Räume, die nach Ablauf des Pins woanders hin gingen
+
+    # --- Worker ----------------------------------------------------------------------
+
+    def add(self, worker, addr):
+        self.backends[worker] = addr
+        self.connections.setdefault(worker, 0)
+        self.ring.add(worker)
+
+    def drain(self, worker):
+        """Keine neuen Räume mehr, festgepinnte laufen weiter."""
+        self.ring.remove(worker)
+
+    def remove(self, worker):
+        self.ring.remove(worker)
+        self.backends.pop(worker, None)
+        for room in [r for r, pin in self._pins.items() if pin[0] == worker]:
+            del self._pins[room]
+
+    # --- Auswahl ---------------------------------------------------------------------
+
+    def _pick(self, path: str):
+        m = ROOM_PATH.match(path)
+        if m:
+            room = norm_room(unquote(m.group(1)))
+            pin = self._pins.get(room)
+            now = self._clock()
+            if pin is not None and pin[0] in self.backends and (pin[1] or now - pin[2] < self.pin_ttl):
+                return pin[0], room
+            worker = self.ring.node_for(room)
+            if pin is not None and worker != pin[0]:
+                self.moved += 1
+            return worker, room
+        if path.startswith("/ws/quickplay/"):
+            return self.ring.node_for("quickplay"), None
+        live = sorted(self.ring.nodes)
+        return (live[next(self._rr) % len(live)] if live else None), None
+
+    def _pin(self, room, worker, delta):
+        pin = self._pins.get(room)
+        if pin is None or pin[0] != worker:
+            if delta < 0:
+                return   # Raum ist inzwischen woanders festgepinnt
+            pin = self._pins[room] = [worker, 0, 0.0]
+        pin[1] += delta
+        pin[2] = self._clock()
+
+    def sweep(self):
+        now = self._clock()
+        for room in [r for r, p in self._pins.items() if not p[1] and now - p[2] >= self.pin_ttl]:
+            del self._pins[room]
+
+    # --- Proxy -----------------------------------------------------------------------
+
+    async def serve(self, host, port):
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader, writer):
+        worker = room = None
+        try:
+            try:
+                head = await reader.readuntil(b"\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            parts = head.split(b" ", 2)
+            path = parts[1].decode("latin-1") if len(parts) > 1 else "/"
+            worker, room = self._pick(path)
+            if worker is None:
+                writer.write(b"HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n\r\n")
+                return
+            try:
+                up_reader, up_writer = await asyncio.open_connection(*self.backends[worker])
+            except OSError as e:
+                log_event("router_backend_down", logging.WARNING, worker=worker, error=repr(e))
+                writer.write(b"HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\n\r\n")
+                return
+
+            self.routed += 1
+            self.connections[worker] = self.connections.get(worker, 0) + 1
+            if room:
+                self._pin(room, worker, 1)
+            try:
+                up_writer.write(head)
+                await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+            finally:
+                self.connections[worker] -= 1
+                if room:
+                    self._pin(room, worker, -1)
+                up_writer.close()
+        finally:
+            writer.close()
+
+    def stats(self):
+        return {
+            "workers": sorted(self.ring.nodes),
+            "connections": dict(self.connections),
+            "pinned_rooms": len(self._pins),
+            "routed": self.routed,
+            "moved": self.moved,
+        }
+
+
+async def _pipe(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        try:
+            writer.write_eof()
+        except (OSError, RuntimeError):
+            pass
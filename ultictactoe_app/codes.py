@@ -0,0 +1,175 @@
+# ultictactoe_app/codes.py
+"""
+Vergabe der Raum-Codes in O(1).
+
+Statt so lange zu würfeln, bis ein freier Code gefunden ist, liegt der
+freie Bereich als (lazy) gemischte Liste vor: ein Fisher-Yates-Shuffle,
+von dem nur die vertauschten Positionen gespeichert werden. Speicher
+wächst also mit der Zahl der vergebenen Codes, nicht mit 10**length.
+
+Lebenszyklus eines Codes:
+  frei --reserve()--> reserviert --claim()--> belegt --release()--> frei
+reserve() gibt zum Code ein Token zurück; einlösen kann die Reservierung
+nur, wer es mitbringt – wer den Code vorher errät oder abtippt, nimmt ihn
+dem Client, der ihn angefordert hat, nicht weg. Reservierungen, die nicht
+rechtzeitig per claim() eingelöst werden, fallen nach `reservation_ttl`
+Sekunden automatisch zurück in den Pool.
+
+Mit `owns` (cluster.Membership.owns) vergibt reserve() nur Codes, die
+diesem Worker gehören – bei N Workern im Schnitt N Versuche.
+"""
+import random
+import secrets
+import time
+from collections import deque
+
+
+class NoCodesLeft(Exception):
+    """Alle Codes sind belegt oder reserviert."""
+
+
+class CodeAllocator:
+    def __init__(self, length: int = 4, reservation_ttl: float = 120.0,
+                 clock=time.monotonic, rng=None, owns=None):
+        self.length = length
+        self.size = 10 ** length
+        self.reservation_ttl = reservation_ttl
+        self._clock = clock
+        self._rng = rng or random.Random()
+        self.owns = owns         # code -> bool, None = alle
+
+        # freier Bereich = Positionen [0, _free_count)
+        # _val: Position -> Code, _pos: Code -> Position (nur Abweichungen von i -> i)
+        self._free_count = self.size
+        self._val = {}
+        self._pos = {}
+
+        self._reserved = {}      # code -> (Ablaufzeit, Token)
+        self._expiry = deque()   # (Ablaufzeit, code), TTL ist fest -> automatisch sortiert
+        self._in_use = set()
+
+    # --- Pool (sparse Fisher-Yates) ---
+
+    def _value_at(self, i: int) -> int:
+        return self._val.get(i, i)
+
+    def _set(self, i: int, code: int):
+        if i == code:
+            self._val.pop(i, None)
+            self._pos.pop(code, None)
+        else:
+            self._val[i] = code
+            self._pos[code] = i
+
+    def _is_free(self, code: int) -> bool:
+        p = self._pos.get(code, code)
+        return p < self._free_count and self._value_at(p) == code
+
+    def _take(self, p: int) -> int:
+        """Code an Position p aus dem freien Bereich nehmen (letzten nach vorne holen)."""
+        code = self._value_at(p)
+        last = self._free_count - 1
+        if p != last:
+            self._set(p, self._value_at(last))
+        self._val.pop(last, None)
+        self._pos.pop(code, None)
+        self._free_count = last
+        return code
+
+    def _put(self, code: int):
+        self._set(self._free_count, code)
+        self._free_count += 1
+
+    # --- Codes als Strings ---
+
+    def _format(self, code: int) -> str:
+        return f"{code:0{self.length}d}"
+
+    def _parse(self, code):
+        s = str(code)
+        if len(s) != self.length or not s.isdigit():
+            return None
+        return int(s)
+
+    # --- öffentliche API ---
+
+    def _purge(self):
+        now = self._clock()
+        while self._expiry and self._expiry[0][0] <= now:
+            expires, code = self._expiry.popleft()
+            if self._reserved.get(code, (None,))[0] == expires:
+                del self._reserved[code]
+                self._put(code)
+
+    def reserve(self):
+        """
+        Zufälligen freien Code holen und für reservation_ttl Sekunden festhalten.
+        Rückgabe: (code, token) – das Token braucht claim() zum Einlösen.
+        """
+        self._purge()
+        if not self._free_count:
+            raise NoCodesLeft()
+        p = self._rng.randrange(self._free_count)
+        if self.owns is not None:
+            for _ in range(256):
+                if self.owns(self._format(self._value_at(p))):
+                    break
+                p = self._rng.randrange(self._free_count)
+            else:
+                raise NoCodesLeft()
+        code = self._take(p)
+        expires = self._clock() + self.reservation_ttl
+        token = secrets.token_urlsafe(12)
+        self._reserved[code] = (expires, token)
+        self._expiry.append((expires, code))
+        return self._format(code), token
+
+    def claim(self, code, token=None) -> bool:
+        """
+        Code als belegt markieren (erster create_or_join im Raum).
+        Klappt auch für Codes, die nie reserviert wurden (Code direkt eingetippt).
+        False, wenn der Code nicht ins Schema passt – der Raum wird dann nicht
+        verwaltet – oder wenn er für jemand anderen reserviert ist (falsches
+        bzw. kein Token); die Reservierung bleibt dann bestehen.
+        """
+        c = self._parse(code)
+        if c is None:
+            return False
+        self._purge()
+        if c in self._in_use:
+            return True
+        reservation = self._reserved.get(c)
+        if reservation is not None:
+            if not isinstance(token, str) or not secrets.compare_digest(token, reservation[1]):
+                return False
+            del self._reserved[c]
+        else:
+            if not self._is_free(c):
+                return False
+            self._take(self._pos.get(c, c))
+        self._in_use.add(c)
+        return True
+
+    def is_reserved(self, code) -> bool:
+        c = self._parse(code)
+        self._purge()
+        return c is not None and c in self._reserved
+
+    def release(self, code):
+        """Raum gelöscht bzw. Reservierung verfallen lassen -> Code wieder frei."""
+        c = self._parse(code)
+        if c is None:
+            return
+        if c in self._in_use:
+            self._in_use.discard(c)
+        elif self._reserved.pop(c, None) is None:
+            return
+        self._put(c)
+
+    def available(self) -> int:
+        self._purge()
+        return self._free_count
+
+    def in_use(self) -> int:
+        """Anzahl belegter Codes (= Räume, die dieser Prozess verwaltet)."""
+        return len(self._in_use)
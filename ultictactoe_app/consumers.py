@@ -1,31 +1,48 @@
 # ultictactoe_app/consumers.py
-import random
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.layers import get_channel_layer
+from django.conf import settings
+import asyncio
 import json
+import logging
+import random
 import re
-
-# Raum -> {players: {channel_name: nickname}, host: channel_name|None}
-rooms = {}
-# game = []
-
-
-# Gewinn-Linien für 3x3
-LINES = [
-    (0,1,2),(3,4,5),(6,7,8),  # Reihen
-    (0,3,6),(1,4,7),(2,5,8),  # Spalten
-    (0,4,8),(2,4,6),          # Diagonalen
-]
-
-def _winner_in(arr):
-    """
-    arr: Liste der Länge 9 mit Werten "X", "O" oder None.
-    Gibt (winner, line) zurück, z. B. ("X", (0,1,2)) oder (None, None).
-    """
-    for a, b, c in LINES:
-        v = arr[a]
-        if v and v == arr[b] == arr[c]:
-            return v, (a, b, c)
-    return None, None
+import time
+from urllib.parse import parse_qs
+
+from .actors import RoomSerializer
+from . import analysis
+from .bot import BotLimit, BotPlayer, Position
+from .cluster import Membership
+from .codes import CodeAllocator, NoCodesLeft
+from .engine import IllegalMove, masks_from_cells, mask_result
+from .expiry import RoomReaper
+from .history import HistoryWriter
+from .matchmaking import Matchmaker
+from .metrics import Counter, Gauge, Histogram, log_event
+from . import protocol
+from .recovery import Snapshotter, recover
+from .resume import EventLog, make_token, read_token
+from .spectators import SpectatorHub, SpectatorLimit
+from .store import load_store
+from chat_app.consumers import TokenBucket
+from user_app import ratings
+
+# Raum-Code -> rooms.Room, je nach settings.ROOM_STORE im Prozess oder in Redis
+room_store = load_store(getattr(settings, "ROOM_STORE", {}))
+
+# alle Befehle eines Raums nacheinander (Lesen/Ändern über await-Punkte hinweg)
+room_commands = RoomSerializer()
+
+# gestartet über manage.py runworkers -> nur Räume/Codes, die diesem Worker gehören
+membership = Membership.from_env()
+
+code_allocator = CodeAllocator(
+    length=getattr(settings, "ROOM_CODE_LENGTH", 4),
+    reservation_ttl=getattr(settings, "ROOM_CODE_RESERVATION_TTL", 120),
+    owns=membership.owns if membership else None,
+)
 
 def small_result(cells: dict):
     """
@@ -35,21 +52,12 @@ def small_result(cells: dict):
       ("draw", None, None)   -> alle 9 Felder belegt, kein Gewinner
       ("ongoing", None, None)-> noch nicht entschieden
     """
-    arr = [cells.get(i) for i in range(9)]  # index 0..8
-    w, line = _winner_in(arr)
-    if w:
-        return "win", w, line
-    if all(v in ("X", "O") for v in arr):
-        return "draw", None, None
-    return "ongoing", None, None
+    x, o = masks_from_cells(cells)
+    return mask_result(x, o)
 
 def _is_big_finished(rm, big_idx): #rm ist room
-    # direkt aus finished_fields lesen (schnell)
-    if big_idx in rm.get("finished_fields", {}):
-        return True
-    # falls noch nicht eingetragen: aktuellen Zustand berechnen
-    st, _, _ = small_result(rm.get("board", {}).get(big_idx, {}))
-    return st in ("win", "draw")
+    # steht direkt im großen Brett (Bitmaske), nichts neu berechnen
+    return rm.game.is_finished(big_idx)
 
 
 def big_board_winner(finished_fields: dict):
@@ -61,15 +69,9 @@ def big_board_winner(finished_fields: dict):
       ("O", (2,4,6))  -> O hat gewonnen
       (None, None)    -> noch kein Gesamtsieg
     """
-    arr = [
-        finished_fields.get(i) if finished_fields.get(i) in ("X", "O") else None
-        for i in range(9)
-    ]
-    # nutzt deine bestehende LINES-Logik
-    for a, b, c in LINES:
-        v = arr[a]
-        if v and v == arr[b] == arr[c]:
-            return v, (a, b, c)
+    state, w, line = small_result(finished_fields)  # "D" zählt für niemanden
+    if state == "win":
+        return w, line
     return None, None
 
 def is_global_draw(finished_fields: dict) -> bool:
@@ -85,17 +87,389 @@ def is_global_draw(finished_fields: dict) -> bool:
 
 
 
+def legal_hex(mask: int) -> str:
+    # 81 Bit passen nicht in eine JS-Zahl -> Hex-String, im Client BigInt("0x" + …)
+    return format(mask, "x")
+
+
+def game_snapshot(game) -> dict:
+    """Kompletter Spielstand für joined/state/Resync-Antworten."""
+    return {
+        "v": game.version,
+        "board": game.cells(),
+        "currentPlayer": game.current,
+        "finished_fields": [{"big": b, "winner": w} for b, w in game.finished_fields().items()],
+        "big_field_to_click": game.forced if game.forced >= 0 else "",
+        "legal": legal_hex(game.legal_mask()),
+    }
+
+
+def frame(kind: str, payload: dict, binary: bytes = None) -> dict:
+    """
+    Gruppen-Event mit fertig serialisiertem Frame: json.dumps läuft einmal
+    beim Sender statt einmal pro Empfänger. Die Handler reichen "text"
+    (bzw. "bytes" für Binär-Clients) nur noch durch.
+    """
+    event = {"type": kind, "text": json.dumps(payload)}
+    if binary is not None:
+        event["bytes"] = binary
+    return event
+
+
+def spectator_state(room) -> dict:
+    return {
+        "event": "state",
+        "room": room.code,
+        "phase": room.phase,
+        "spectator": True,
+        "your_symbol": None,
+        "players": room.players,
+        "symbols": room.symbols,
+        "names_by_symbol": room.names_by_symbol(),
+        **game_snapshot(room.game),
+    }
+
+
+async def _spectator_snapshot(code):
+    # einmal pro Fan-out-Runde gebaut, egal wie viele Zuschauer hinterher sind
+    room = await room_store.get(code, fresh=True)
+    if not room:
+        return None
+    return room.game.version, frame("state", spectator_state(room), protocol.encode_state(room.game))
+
+
+# Zuschauer laufen über einen eigenen Fan-out (spectators.py), nicht über die Spieler-Gruppe
+spectator_hub = SpectatorHub(
+    _spectator_snapshot,
+    per_room=getattr(settings, "SPECTATORS_PER_ROOM", 5000),
+    per_process=getattr(settings, "SPECTATORS_PER_PROCESS", 20000),
+    tick=getattr(settings, "SPECTATOR_TICK", 0.1),
+    relay=getattr(settings, "SPECTATOR_RELAY", False),
+)
+
+
+# Bot-Sitz: steht wie ein Spieler in room.players/room.symbols, nur mit festem Schlüssel
+BOT_ID = "bot"
+
+bot_player = BotPlayer(
+    workers=getattr(settings, "BOT_WORKERS", 2),
+    max_games=getattr(settings, "BOT_MAX_GAMES", 20),
+    budget_ms=getattr(settings, "BOT_MOVE_MS", 500),
+    max_budget_ms=getattr(settings, "BOT_MAX_MOVE_MS", 2000),
+    max_playouts=getattr(settings, "BOT_MAX_PLAYOUTS", 200_000),
+    hint_slots=getattr(settings, "HINT_SLOTS", 1),
+)
+_bot_tasks = set()
+
+# Partien/Züge in die DB – gepuffert, der Zug wartet nie auf ein INSERT
+history = HistoryWriter(
+    batch_size=getattr(settings, "HISTORY_BATCH_SIZE", 500),
+    interval=getattr(settings, "HISTORY_FLUSH_INTERVAL", 0.5),
+    max_queue=getattr(settings, "HISTORY_MAX_QUEUE", 50_000),
+    block=getattr(settings, "HISTORY_BLOCK", 1.0),
+    enabled=getattr(settings, "HISTORY_ENABLED", True),
+)
+
+# Snapshots laufender Räume für den Neustart (recovery.py)
+snapshots = Snapshotter(
+    history,
+    lambda code: room_store.get(code, fresh=True),
+    interval=getattr(settings, "SNAPSHOT_INTERVAL", 5.0),
+    bot_id=BOT_ID,
+)
+_recovery = None
+
+
+async def _expire_room(code, phase, version):
+    """Vom RoomReaper: Raum war `phase`-TTL lang unbenutzt -> löschen, Code freigeben."""
+    async with room_commands.hold(code):
+        room = await room_store.get(code, fresh=True)
+        if room is None:
+            code_allocator.release(code)
+            bot_player.unseat(code)
+            return False
+        if room.phase != phase or (version is not None and room.game.version != version):
+            # in einem anderen Worker benutzt -> weiter beobachten
+            reaper.touch(code, room.phase, room.game.version)
+            return False
+        await room_store.delete(code)
+        code_allocator.release(code)
+        bot_player.unseat(code)
+        snapshots.mark(code)
+        room_events.drop(code)
+    ROOMS_EXPIRED.labels(phase).inc()
+    log_event("room_expired", logging.INFO, room=code, phase=phase)
+    await get_channel_layer().group_send(f"game_{code}", frame("room.closed", {
+        "event": "error", "message": "Raum wurde wegen Inaktivität geschlossen.",
+    }))
+    return True
+
+
+# Leerlauf-TTL pro Phase (Sekunden); ein Timer-Rad für alle Räume (expiry.py)
+reaper = RoomReaper(
+    getattr(settings, "ROOM_TTL", {"lobby": 1800, "starting": 900, "playing": 900, "finished": 300}),
+    _expire_room,
+    tick=getattr(settings, "ROOM_REAPER_TICK", 1.0),
+)
+
+# nummerierte Gruppen-Events pro Raum für Resume nach Verbindungsabbruch (resume.py)
+room_events = EventLog(size=getattr(settings, "RESUME_LOG_SIZE", 64))
+RESUME_TTL = getattr(settings, "RESUME_TOKEN_TTL", 3600)
+
+HINT_MS = min(getattr(settings, "HINT_MS", 200), bot_player.max_budget_ms)
+HINT_RATE = getattr(settings, "HINT_RATE", 0.5)     # Hints pro Sekunde und Verbindung (Dauer)
+HINT_BURST = getattr(settings, "HINT_BURST", 3)
+
+
+async def play_move(layer, room, symbol, big, small):
+    """
+    Zug prüfen + eintragen + an Spieler und Zuschauer senden.
+    Gleicher Weg für Menschen und Bot; wirft IllegalMove.
+    """
+    by = "bot" if room.symbols.get(BOT_ID) == symbol else "human"
+    try:
+        delta = await room_store.apply_move(room.code, symbol, big, small)
+    except IllegalMove:
+        MOVES.labels("illegal", by).inc()
+        raise
+    MOVES.labels("ok", by).inc()
+
+    if room.game.version != delta.version:
+        # veraltete Kopie aus dem Cache (Reset in einem anderen Worker) -> für game_id neu lesen
+        room = await room_store.get(room.code, fresh=True) or room
+    await history.move(room, delta)
+    snapshots.mark(room.code)
+    reaper.touch(room.code, "finished" if delta.winner else room.phase, delta.version)
+
+    # Nur das Delta broadcasten: Zug, ggf. neu entschiedenes Großfeld,
+    # nächstes Pflichtfeld, wer dran ist + Version für Lückenerkennung
+    move = {
+        "event": "move",
+        "v": delta.version,
+        "big": delta.big,
+        "small": delta.small,
+        "symbol": delta.symbol,
+        "currentPlayer": delta.current,
+        # nur das in diesem Zug entschiedene Großfeld ({big, winner}) oder null
+        "finished": {"big": delta.finished[0], "winner": delta.finished[1]} if delta.finished else None,
+        "big_field_to_click": delta.next_big if delta.next_big >= 0 else "",
+        # alle Züge, die der Nächste machen darf (Bit big*9+small)
+        "legal": legal_hex(delta.legal),
+    }
+    group = f"game_{room.code}"
+    event = room_events.stamp(room.code, frame("game.move", move, protocol.encode_move(move)))
+    await layer.group_send(group, event)
+    spectator_hub.publish(room.code, delta.version, event)
+
+    # 2) Falls Gesamtsieg / globaler Draw
+    if delta.winner:
+        over = {
+            "event": "game_over",
+            "winner": delta.winner,                              # "X" / "O" / "D"
+            "line": list(delta.line) if delta.line else None     # große Sieglinie
+        }
+        event = room_events.stamp(room.code, frame("game.over", over, protocol.encode_game_over(over)))
+        await layer.group_send(group, event)
+        spectator_hub.publish(room.code, delta.version, event)
+        schedule_rating(room, delta.winner)
+    elif room.symbols.get(BOT_ID) == delta.current:
+        schedule_bot(layer, room.code)
+    return delta
+
+
+async def recover_rooms(layer):
+    """Einmal pro Prozess, vor der ersten Verbindung: Räume aus Snapshots zurückholen."""
+    global _recovery
+    if not getattr(settings, "RECOVER_ROOMS", True) or not history.enabled:
+        return
+    if _recovery is None:
+        _recovery = asyncio.get_running_loop().create_task(_recover(layer))
+    await asyncio.shield(_recovery)
+
+
+async def _recover(layer):
+    owns = membership.owns if membership else None
+    for room in await recover(room_store, BOT_ID, _recovered_room, owns):
+        if room.symbols.get(BOT_ID) == room.game.current:
+            schedule_bot(layer, room.code)
+
+
+def _recovered_room(room):
+    code_allocator.claim(room.code)
+    snapshots.recovered(room.code)
+    reaper.touch(room.code, room.phase, room.game.version)
+    if BOT_ID in room.symbols:
+        try:
+            bot_player.seat(room.code)
+        except BotLimit:
+            log_event("recovery_bot_limit", logging.WARNING, room=room.code)
+
+
+async def _start_quick_match(a, b, waited_a, waited_b):
+    """Matchmaker hat zwei Spieler gepaart: Raum direkt im Spiel anlegen, beide hinschicken."""
+    try:
+        code, token = code_allocator.reserve()
+    except NoCodesLeft:
+        for t in (a, b):
+            await t.player.unmatched("Gerade sind alle Raum-Codes vergeben.")
+        return
+    name_b = b.nickname if b.nickname != a.nickname else f"{b.nickname} (2)"
+    players = [(a, a.nickname, waited_a), (b, name_b, waited_b)]
+    random.shuffle(players)
+    (tx, name_x, waited_x), (to, name_o, waited_o) = players
+
+    async with room_commands.hold(code):
+        room, _ = await room_store.get_or_create(code)
+        code_allocator.claim(code, token)
+        # wie nach start_game: beide kommen über den Rejoin-Pfad (symbol_by_name) rein
+        room.phase = "starting"
+        room.symbol_by_name = {name_x: "X", name_o: "O"}
+        await room_store.save(room)
+        await room_store.reset_game(room, "starting")
+        history.game_started(room)
+        snapshots.mark(code)
+        reaper.touch(code, room.phase, room.game.version)
+
+    url = f"/play/lobby/{code}/"
+    await tx.player.matched(code, url, name_x, "X", name_o, waited_x)
+    await to.player.matched(code, url, name_o, "O", name_x, waited_o)
+
+
+# Schnelles Spiel (ws/quickplay/): Warteschlange nach Wertung, Fenster wächst mit der Wartezeit
+matchmaker = Matchmaker(
+    _start_quick_match,
+    bucket=getattr(settings, "MATCH_BUCKET", 50),
+    window=getattr(settings, "MATCH_WINDOW", 100),
+    widen=getattr(settings, "MATCH_WIDEN", 25.0),
+    max_window=getattr(settings, "MATCH_MAX_WINDOW", 800),
+    tick=getattr(settings, "MATCH_TICK", 0.5),
+)
+
+
+# Elo nach Spielende – nur Mensch gegen Mensch, beide eingeloggt
+RATINGS_ENABLED = getattr(settings, "RATINGS_ENABLED", True)
+_rating_tasks = set()
+
+
+def schedule_rating(room, winner):
+    x, o = room.user_ids.get("X"), room.user_ids.get("O")
+    if not RATINGS_ENABLED or x is None or o is None or x == o or BOT_ID in room.symbols:
+        return
+    task = asyncio.get_running_loop().create_task(_rate_game(room.code, x, o, winner))
+    _rating_tasks.add(task)
+    task.add_done_callback(_rating_tasks.discard)
+
+
+async def _rate_game(code, x, o, winner):
+    try:
+        rows = await database_sync_to_async(ratings.record_result)(x, o, winner)
+    except Exception as e:
+        log_event("rating_failed", logging.ERROR, room=code, error=repr(e))
+        return
+    ratings.apply_result(rows)
+    RATED_GAMES.inc()
+    log_event("rated", room=code, ratings={uid: round(r) for uid, _, r in rows})
+
+
+def schedule_bot(layer, code):
+    task = asyncio.get_running_loop().create_task(_bot_turn(layer, code))
+    _bot_tasks.add(task)
+    task.add_done_callback(_bot_tasks.discard)
+
+
+async def _bot_turn(layer, code):
+    # 1) Stellung lesen (kurz unter dem Raum-Lock)
+    async with room_commands.hold(code):
+        room = await room_store.get(code, fresh=True)
+        symbol = room.symbols.get(BOT_ID) if room else None
+        if not symbol or room.game.winner or room.game.current != symbol:
+            return
+        version = room.game.version
+
+    # 2) Denken im Prozess-Pool – hier wird kein Lock gehalten
+    try:
+        move = await bot_player.think(code, room.game)
+    except Exception as e:
+        log_event("bot_error", logging.WARNING, room=code, error=repr(e))
+        return
+    if move is None:
+        return
+
+    # 3) Ziehen wie ein Spieler; hat sich inzwischen was geändert (Reset), verfällt der Zug
+    async with room_commands.hold(code):
+        room = await room_store.get(code, fresh=True)
+        if not room or room.game.version != version:
+            return
+        try:
+            await play_move(layer, room, symbol, *move)
+        except IllegalMove:
+            pass
+
+
+# --- Metriken (siehe metrics.py, /metrics) ---
+
+# Action-Namen kommen vom Client -> nur bekannte als Label, sonst "unknown"
+KNOWN_ACTIONS = frozenset((
+    "create_or_join", "start_game", "add_bot", "remove_bot", "game_move", "reset",
+    "get_state", "sync", "resume", "spectate", "hint",
+))
+DEBUG_SAMPLE = getattr(settings, "LOG_DEBUG_SAMPLE", 0.01)   # Anteil der Debug-Logs im Zug-Pfad
+
+ACTIONS = Counter("ultictactoe_actions_total", "WebSocket-Befehle pro Action", labels=("action",))
+ACTION_SECONDS = Histogram("ultictactoe_action_seconds",
+                           "Dauer pro Action inkl. Warten auf den Raum-Lock", labels=("action",))
+MOVES = Counter("ultictactoe_moves_total", "Züge nach Ergebnis", labels=("result", "by"))
+CONNECTIONS = Gauge("ultictactoe_connections", "offene WebSockets", labels=("kind",))
+Gauge("ultictactoe_rooms", "belegte Raum-Codes in diesem Prozess", fn=code_allocator.in_use)
+Gauge("ultictactoe_room_queue_rooms", "Räume mit laufendem/wartendem Befehl",
+      fn=lambda: room_commands.stats()["busy_rooms"])
+Gauge("ultictactoe_room_queue_depth", "laufende + wartende Befehle über alle Räume",
+      fn=lambda: room_commands.stats()["queued"])
+Gauge("ultictactoe_room_queue_max_depth", "höchste je gesehene Queue-Tiefe eines Raums",
+      fn=lambda: room_commands.max_depth)
+Counter("ultictactoe_room_commands_total", "ausgeführte Raum-Befehle", fn=lambda: room_commands.commands)
+Gauge("ultictactoe_spectators", "Zuschauer in diesem Prozess", fn=lambda: spectator_hub.count)
+Counter("ultictactoe_spectator_frames_total", "an Zuschauer gesendete Einzel-Frames",
+        fn=lambda: spectator_hub.frames_sent)
+Counter("ultictactoe_spectator_snapshots_total", "zusammengefasste Zuschauer-Updates",
+        fn=lambda: spectator_hub.snapshots_sent)
+Gauge("ultictactoe_bot_games", "Räume mit Bot", fn=lambda: len(bot_player.games))
+Counter("ultictactoe_bot_playouts_total", "MCTS-Playouts des Bots", fn=lambda: bot_player.playouts)
+HINTS = Counter("ultictactoe_hints_total", "Hint-Anfragen nach Ergebnis", labels=("result",))
+Gauge("ultictactoe_hints_running", "laufende Analysen (Hint-Kontingent)", fn=lambda: bot_player.hints_running)
+Gauge("ultictactoe_history_queue", "noch nicht geschriebene Partien/Züge", fn=lambda: history.depth)
+Counter("ultictactoe_history_moves_total", "in die DB geschriebene Züge", fn=lambda: history.written["move"])
+Counter("ultictactoe_history_games_total", "in die DB geschriebene Partien", fn=lambda: history.written["game"])
+Counter("ultictactoe_history_waits_total", "Züge, die auf Platz im vollen Puffer warten mussten",
+        fn=lambda: history.waits)
+Counter("ultictactoe_history_dropped_total", "verworfene Züge (Puffer blieb voll)", fn=lambda: history.dropped)
+Counter("ultictactoe_history_errors_total", "wegen Schreibfehlern verworfene Einträge", fn=lambda: history.errors)
+Counter("ultictactoe_snapshots_total", "geschriebene Raum-Snapshots", fn=lambda: snapshots.snapshots)
+Gauge("ultictactoe_reaper_rooms", "Räume mit Leerlauf-Timer", fn=lambda: len(reaper))
+Gauge("ultictactoe_matchmaking_waiting", "Spieler in der Warteschlange", fn=lambda: matchmaker.waiting)
+Counter("ultictactoe_matches_total", "gepaarte Spiele (schnelles Spiel)", fn=lambda: matchmaker.matches)
+ROOMS_EXPIRED = Counter("ultictactoe_rooms_expired_total", "wegen Leerlauf gelöschte Räume", labels=("phase",))
+RESUMES = Counter("ultictactoe_resumes_total", "Resume-Versuche nach Ergebnis", labels=("result",))
+Counter("ultictactoe_resume_replayed_total", "beim Resume nachgeschickte Events", fn=lambda: room_events.replayed)
+Gauge("ultictactoe_event_log_rooms", "Räume mit Event-Log (Resume)", fn=lambda: len(room_events))
+RATED_GAMES = Counter("ultictactoe_rated_games_total", "gewertete Partien (Elo)")
+Gauge("ultictactoe_leaderboard_players", "Spieler im Ranglisten-Index", fn=lambda: len(ratings._board))
+
+
 def generate_unique_code():
-    # probiere, bis ein freier 4-stelliger Code gefunden ist
-    # Achtung: bei >~9000 belegten Codes kann das dauern – dann besser Redis-Set benutzen
-    while True:
-        code = f"{random.randint(0, 9999):04d}"
-        if code not in rooms:  # frei?
-            return code
+    # freien Code aus dem Pool ziehen (O(1)) und reservieren, bis der erste
+    # create_or_join (mit dem Token) kommt – zwei Clients bekommen nie denselben Code.
+    # Rückgabe: (code, token)
+    return code_allocator.reserve()
 
 class LobbyAllocatorConsumer(AsyncWebsocketConsumer):
     async def connect(self):
+        await recover_rooms(self.channel_layer)   # erst alte Codes belegen, dann neue vergeben
         await self.accept()
+        CONNECTIONS.labels("lobby").inc()
+
+    async def disconnect(self, code):
+        CONNECTIONS.labels("lobby").dec()
 
     async def receive(self, text_data):
         try:
@@ -104,8 +478,75 @@ class LobbyAllocatorConsumer(AsyncWebsocketConsumer):
             return
 
         if data.get("action") == "request_code":
-            code = generate_unique_code()
-            await self.send(text_data=json.dumps({"event": "code_allocated", "code": code}))
+            try:
+                code, token = generate_unique_code()
+            except NoCodesLeft:
+                await self.send(text_data=json.dumps({"event": "error", "message": "Gerade sind alle Raum-Codes vergeben."}))
+                return
+            # Token kommt mit dem ersten create_or_join zurück ("reservation")
+            await self.send(text_data=json.dumps({"event": "code_allocated", "code": code, "reservation": token}))
+
+
+class QuickPlayConsumer(AsyncWebsocketConsumer):
+    """
+    { "action": "queue", "nickname": "Alice" }  -> "queued", später "match" mit url
+    { "action": "cancel" }                      -> raus aus der Warteschlange
+    """
+
+    async def connect(self):
+        await recover_rooms(self.channel_layer)
+        self.ticket = None
+        await self.accept()
+        CONNECTIONS.labels("quickplay").inc()
+
+    async def disconnect(self, code):
+        CONNECTIONS.labels("quickplay").dec()
+        if self.ticket:
+            matchmaker.leave(self.ticket)
+            self.ticket = None
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or "{}")
+        except json.JSONDecodeError:
+            return
+        action = data.get("action")
+
+        if action == "queue":
+            if self.ticket:
+                return
+            nickname = (data.get("nickname") or "Spieler").strip()[:50] or "Spieler"
+            rating = await self._rating()
+            await self.send(text_data=json.dumps({"event": "queued", "rating": rating}))
+            # None, wenn sofort gepaart (matched() ist dann schon gelaufen)
+            self.ticket = await matchmaker.join(self, nickname, rating)
+        elif action == "cancel":
+            if self.ticket:
+                matchmaker.leave(self.ticket)
+                self.ticket = None
+            await self.send(text_data=json.dumps({"event": "cancelled"}))
+
+    async def _rating(self):
+        user = self.scope.get("user")
+        if user is None or not user.is_authenticated:
+            return ratings.DEFAULT_RATING   # Gäste starten in der Mitte
+        return await database_sync_to_async(ratings.rating_for)(user.pk)
+
+    async def unmatched(self, message):
+        self.ticket = None
+        await self.send(text_data=json.dumps({"event": "error", "message": message}))
+
+    async def matched(self, code, url, nickname, symbol, opponent, waited):
+        self.ticket = None
+        await self.send(text_data=json.dumps({
+            "event": "match",
+            "code": code,
+            "url": url,
+            "nickname": nickname,        # ggf. angepasst, falls beide gleich heißen
+            "symbol": symbol,
+            "opponent": opponent,
+            "waited_ms": round(waited * 1000),
+        }))
 
 
 def norm_room(name: str) -> str:
@@ -118,480 +559,582 @@ class GameLobbyConsumer(AsyncWebsocketConsumer):
         raw_room = self.scope["url_route"]["kwargs"]["room_name"]
         self.room = norm_room(raw_room)
         self.group = f"game_{self.room}"
+        # vor allem, was schiefgehen kann – disconnect() liest beides
+        self.spectator = False
+        self.watching = False
 
-        await self.channel_layer.group_add(self.group, self.channel_name)
-        await self.accept()
+        await recover_rooms(self.channel_layer)
+
+        # Binärformat (protocol.py) per Subprotokoll oder ?proto=bin, sonst JSON
+        subprotocol = None
+        self.binary = False
+        if protocol.SUBPROTOCOL in self.scope.get("subprotocols", []):
+            self.binary, subprotocol = True, protocol.SUBPROTOCOL
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        if query.get("proto") == ["bin"]:
+            self.binary = True
 
-    # async def disconnect(self, code):
-    #     # Spieler austragen; Raum löschen, wenn leer
-    #     room = rooms.get(self.room)
-    #     if room and self.channel_name in room["players"]:
-    #         del room["players"][self.channel_name]
-    #         await self._broadcast_players()
-    #         if not room["players"]:
-    #             rooms.pop(self.room, None)
+        # ?role=spectator -> nur zuschauen, kommt nie in die Spieler-Gruppe
+        self.spectator = query.get("role") == ["spectator"]
+
+        # höchstens ein Hint gleichzeitig, dazu ein Token-Bucket pro Verbindung
+        self._hint_running = False
+        self._hint_bucket = TokenBucket(HINT_RATE, HINT_BURST)
+
+        if not self.spectator:
+            await self.channel_layer.group_add(self.group, self.channel_name)
+        await self.accept(subprotocol=subprotocol)
+        self.kind = "spectator" if self.spectator else "player"
+        CONNECTIONS.labels(self.kind).inc()
+
+        if self.spectator:
+            await self._spectate()
 
-    #     await self.channel_layer.group_discard(self.group, self.channel_name)
     async def disconnect(self, code):
+        kind = getattr(self, "kind", None)
+        if kind:
+            CONNECTIONS.labels(kind).dec()
+        if self.spectator:
+            # Zuschauer ändern den Raum nicht -> kein Raum-Lock nötig
+            if self.watching:
+                await spectator_hub.unwatch(self.room, self)
+            return
+
         # immer erst aus der Gruppe raus
         await self.channel_layer.group_discard(self.group, self.channel_name)
 
-        room = rooms.get(self.room)
+        async with room_commands.hold(self.room):
+            await self._leave()
+
+    async def _leave(self):
+        room = await room_store.get(self.room, fresh=True)
         if not room:
             return
 
-        phase = room.get("phase", "lobby")
-
         # >>> neu: während Redirect/Spiel NICHT aufräumen
-        if phase in ("starting", "playing"):
+        if room.phase in ("starting", "playing"):
             return
         # <<<
 
         # Lobby: Spieler austragen und ggf. Raum löschen
-        room["players"].pop(self.channel_name, None)
-        room.get("symbols", {}).pop(self.channel_name, None)
-
-        if room["players"]:
-            await self._broadcast_players()
+        room.players.pop(self.channel_name, None)
+        sym = room.symbols.pop(self.channel_name, None)
+        room.user_ids.pop(sym, None)
+
+        if any(ch != BOT_ID for ch in room.players):
+            await room_store.save(room)
+            await self._broadcast_players(room)
+            reaper.touch(self.room, room.phase, room.game.version)
         else:
-            rooms.pop(self.room, None)
+            # nur noch der Bot (oder niemand) -> Raum weg
+            await room_store.delete(self.room)
+            code_allocator.release(self.room)
+            bot_player.unseat(self.room)
+            snapshots.mark(self.room)
+            reaper.forget(self.room)
+            room_events.drop(self.room)
+
+    def _seat_user(self, room, symbol):
+        """Eingeloggten User fürs Elo an sein Symbol hängen (Gäste: Eintrag weg)."""
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
+            room.user_ids[symbol] = user.pk
+        else:
+            room.user_ids.pop(symbol, None)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """
         Erwartet JSON:
         { "action": "create_or_join", "nickname": "Alice" }
+        oder (Binär-Clients) einen Frame aus protocol.py.
         """
+        if bytes_data is not None:
+            action, data = protocol.decode_client(bytes_data)
+        else:
+            try:
+                data = json.loads(text_data or "{}")
+            except json.JSONDecodeError:
+                return
+            action = data.get("action")
+        await self.handle_action(action, data)
+
+    async def handle_action(self, action, data):
+        """Eine Spiel-Action ausführen (auch vom Multiplex-Consumer benutzt)."""
+        name = action if action in KNOWN_ACTIONS else "unknown"
+        ACTIONS.labels(name).inc()
+        log_event("action", sample=DEBUG_SAMPLE, room=self.room, action=action)
+        started = time.perf_counter()
         try:
-            data = json.loads(text_data or "{}")
-        except json.JSONDecodeError:
-            return
-
-        action = data.get("action")
+            if self.spectator or action == "spectate":
+                # Zuschauer laufen nie durch die Spieler-Befehlsqueue
+                await self._handle_spectator(action, data)
+            elif action == "hint":
+                # Suche läuft im Bot-Pool und ohne Raum-Lock – blockiert keine Züge
+                await self._hint()
+            else:
+                # Befehle für denselben Raum nie verschränkt ausführen
+                async with room_commands.hold(self.room):
+                    await self._handle(action, data)
+        finally:
+            ACTION_SECONDS.labels(name).observe(time.perf_counter() - started)
 
+    async def _handle(self, action, data):
         MAX_PLAYERS = 2  # dein Limit
-        print("Action: ", action)
 
         if action == "create_or_join":
             nickname = (data.get("nickname") or "Spieler").strip() or "Spieler"
 
-            if self.room not in rooms:
-                rooms[self.room] = {
-                    "players": {}, "host": None,
-                    "board": {i: {} for i in range(9)},
-                    "phase": "lobby", "currentPlayer": "X",
-                    "big_field_to_click": "", "finished_fields": {},
-                    "symbols": {},
-                }
-
-            room = rooms[self.room]
+            room, created = await room_store.get_or_create(self.room)
+            if created and not code_allocator.claim(self.room, data.get("reservation")):   # Reservierung einlösen
+                if code_allocator.is_reserved(self.room):
+                    # Code gehört gerade einem anderen Client, der ihn angefordert hat
+                    await room_store.delete(self.room)
+                    await self.send(text_data=json.dumps({
+                        "event": "error", "message": "Dieser Raum-Code ist gerade reserviert."
+                    }))
+                    return
 
             # >>> neu: Rejoin-Pfad, wenn Spiel im Gange / Redirect
-            if room.get("phase") in ("starting", "playing") and "symbol_by_name" in room:
-                desired = room["symbol_by_name"].get(nickname)
+            if room.phase in ("starting", "playing"):
+                desired = room.symbol_by_name.get(nickname)
                 if desired in ("X", "O"):
                     # alten Channel für dieses Symbol entfernen
-                    for ch, s in list(room["symbols"].items()):
+                    for ch, s in list(room.symbols.items()):
                         if s == desired:
-                            room["symbols"].pop(ch, None)
-                            room["players"].pop(ch, None)
+                            room.symbols.pop(ch, None)
+                            room.players.pop(ch, None)
                     # aktuellen Channel setzen
-                    room["players"][self.channel_name] = nickname
-                    room["symbols"][self.channel_name] = desired
+                    room.players[self.channel_name] = nickname
+                    room.symbols[self.channel_name] = desired
+                    self._seat_user(room, desired)
                     # Host beibehalten, falls noch keiner
-                    if room["host"] is None:
-                        room["host"] = self.channel_name
-
-                    # vollständige Bestätigung zurück
-                    names_by_symbol = {
-                        s: room["players"].get(ch, "")
-                        for ch, s in room["symbols"].items() if s in ("X","O")
-                    }
-                    await self._broadcast_players()
-                    await self.send(text_data=json.dumps({
-                        "event": "joined",
-                        "room": self.room,
-                        "you_are_host": (room["host"] == self.channel_name),
-                        "your_id": self.channel_name,
-                        "phase": room.get("phase"),
-                        "your_symbol": room["symbols"][self.channel_name],
-                        "board": [(int(b), int(s), v)
-                                for b, cells in room["board"].items()
-                                for s, v in cells.items()],
-                        "currentPlayer": room.get("currentPlayer", "X"),
-                        "players": room["players"],
-                        "symbols": room["symbols"],
-                        "names_by_symbol": names_by_symbol,
-                    }))
+                    if room.host is None:
+                        room.host = self.channel_name
+
+                    await room_store.save(room)
+                    reaper.touch(self.room, room.phase, room.game.version)
+                    await self._broadcast_players(room)
+                    await self._send_joined(room)
                     return
             # <<< Rejoin-Pfad Ende
 
             # --- normaler Lobby-Join wie gehabt (MAX_PLAYERS etc.) ---
-            # MAX_PLAYERS = 2
-            if len(room["players"]) >= MAX_PLAYERS:
+            if len(room.players) >= MAX_PLAYERS:
                 await self.send(text_data=json.dumps({
                     "event":"error","message":f"Lobby ist voll (max. {MAX_PLAYERS})."
                 }))
                 return
 
-            room["players"][self.channel_name] = nickname
-            if room["host"] is None:
-                room["host"] = self.channel_name
+            room.players[self.channel_name] = nickname
+            if room.host is None:
+                room.host = self.channel_name
 
-            sym = room["symbols"].get(self.channel_name)
-            if sym is None:
-                taken = set(room["symbols"].values())
-                sym = "X" if "X" not in taken else ("O" if "O" not in taken else None)
+            if self.channel_name not in room.symbols:
+                sym = room.free_symbol()
                 if not sym:
                     await self.send(text_data=json.dumps({"event":"error","message":"Es sind bereits 2 Spieler verbunden."}))
                     return
-                room["symbols"][self.channel_name] = sym
+                room.symbols[self.channel_name] = sym
+            self._seat_user(room, room.symbols[self.channel_name])
 
-            await self._broadcast_players()
-
-            names_by_symbol = {
-                s: room["players"].get(ch, "")
-                for ch, s in room["symbols"].items() if s in ("X","O")
-            }
-            await self.send(text_data=json.dumps({
-                "event": "joined",
-                "room": self.room,
-                "you_are_host": (room["host"] == self.channel_name),
-                "your_id": self.channel_name,
-                "phase": room.get("phase", "lobby"),
-                "your_symbol": room["symbols"][self.channel_name],
-                "board": [(int(b), int(s), v)
-                        for b, cells in room["board"].items()
-                        for s, v in cells.items()],
-                "currentPlayer": room.get("currentPlayer","X"),
-                "players": room["players"],
-                "symbols": room["symbols"],
-                "names_by_symbol": names_by_symbol,
-            }))
+            await room_store.save(room)
+            reaper.touch(self.room, room.phase, room.game.version)
+            await self._broadcast_players(room)
+            await self._send_joined(room)
 
         elif action == "start_game":
-            room = rooms.get(self.room)
+            room = await room_store.get(self.room, fresh=True)
             if not room: return
-            if room["host"] != self.channel_name:
+            if room.host != self.channel_name:
                 await self.send(text_data=json.dumps({"event":"error","message":"Nur der Host darf starten."}))
                 return
-            if len(room["players"]) < 2:
+            if len(room.players) < 2:
                 await self.send(text_data=json.dumps({"event":"error","message":"Mindestens 2 Spieler nötig."}))
                 return
 
             # >>> neu:
-            room["phase"] = "starting"
-            room["symbol_by_name"] = {}
-            for ch, sym in room.get("symbols", {}).items():
-                nick = room["players"].get(ch)
-                if nick and sym in ("X","O"):
-                    room["symbol_by_name"][nick] = sym
+            room.phase = "starting"
+            room.symbol_by_name = {}
+            for ch, sym in room.symbols.items():
+                nick = room.players.get(ch)
+                if nick and sym in ("X","O") and ch != BOT_ID:   # Bot macht keinen Rejoin
+                    room.symbol_by_name[nick] = sym
             # <<<
 
             # Board & Status für Spiel vorbereiten
-            room["board"] = {i: {} for i in range(9)}
-            room["currentPlayer"] = "X"
+            await room_store.save(room)
+            await room_store.reset_game(room, "starting")
+            history.game_started(room)
+            snapshots.mark(self.room)
+            reaper.touch(self.room, room.phase, room.game.version)
 
             game_url = f"/play/lobby/{self.room}/"
             await self.channel_layer.group_send(
                 self.group,
-                {"type": "game.start", "url": game_url, "board": []}
+                room_events.stamp(self.room, frame("game.start", {"event": "start", "url": game_url})),
             )
-      
+            if room.symbols.get(BOT_ID) == room.game.current:
+                schedule_bot(self.channel_layer, self.room)
+
+        elif action in ("add_bot", "remove_bot"):
+            room = await room_store.get(self.room, fresh=True)
+            if not room: return
+            if room.host != self.channel_name:
+                await self.send(text_data=json.dumps({"event":"error","message":"Nur der Host darf den Bot verwalten."}))
+                return
+            if room.phase != "lobby":
+                await self.send(text_data=json.dumps({"event":"error","message":"Das Spiel läuft schon."}))
+                return
+
+            if action == "remove_bot":
+                room.players.pop(BOT_ID, None)
+                room.symbols.pop(BOT_ID, None)
+                bot_player.unseat(self.room)
+            else:
+                if BOT_ID not in room.players:
+                    sym = room.free_symbol()
+                    if len(room.players) >= MAX_PLAYERS or not sym:
+                        await self.send(text_data=json.dumps({"event":"error","message":f"Lobby ist voll (max. {MAX_PLAYERS})."}))
+                        return
+                    try:
+                        bot_player.seat(self.room, data.get("budget_ms"))
+                    except BotLimit as e:
+                        await self.send(text_data=json.dumps({"event":"error","message":e.message}))
+                        return
+                    room.players[BOT_ID] = "Bot"
+                    room.symbols[BOT_ID] = sym
+
+            await room_store.save(room)
+            reaper.touch(self.room, room.phase, room.game.version)
+            await self._broadcast_players(room)
+
         elif action == "game_move":
-            room = rooms.get(self.room)
+            room = await room_store.get(self.room)
             if not room:
                 return
-            # if room.get("phase") != "playing":
-            #     await self.send(text_data=json.dumps({"event":"error","message":"Spiel läuft nicht."}))
-            #     return
 
-            # Field to click in rooms speichern und dann prüfen, ob Big gleich ist. Wenn ja go, sonst nichts
-            
-            my_symbol = room.get("symbols", {}).get(self.channel_name)
+            my_symbol = room.symbols.get(self.channel_name)
             if my_symbol is None:
                 await self.send(text_data=json.dumps({"event": "error", "message": "Du bist nicht in diesem Spiel."}))
                 return
 
-            if my_symbol != room.get("currentPlayer", "X"):
-                await self.send(text_data=json.dumps({"event": "error", "message": "Du bist nicht dran."}))
-                return
-
-            
-            big_field_to_click = room["big_field_to_click"]
-            print("Jetzt anklicken: ", big_field_to_click)
-            
-
             try:
                 big = int(data.get("big"))
                 small = int(data.get("small"))
             except (TypeError, ValueError):
                 await self.send(text_data=json.dumps({"event":"error","message":"Ungültiger Zug."}))
                 return
-            if not (0 <= big <= 8 and 0 <= small <= 8):
-                await self.send(text_data=json.dumps({"event":"error","message":"Außerhalb des Boards."}))
-                return
-            
-            if big_field_to_click == "" or big == big_field_to_click: #Prüfen ob das angeklickte Feld auch das richtige war
-
-                board = room.setdefault("board", {i: {} for i in range(9)})   # dict→dict
-                current_player = room.setdefault("currentPlayer", "X")
-
-                finished_fields = room["finished_fields"]
-                print("Finished_fields: ", finished_fields)
-
-                if big in finished_fields:
-                    print("FELD IST BELEGT")
-                    await self.send(text_data=json.dumps({"event":"error","message":"Das große Feld ist bereits belegt."}))
-                    return
 
-                if small in board[big]:
-                    await self.send(text_data=json.dumps({"event":"error","message":"Feld bereits belegt."}))
-                    return
-
-                # Zug eintragen
-                board[big][small] = current_player
-                
-
-
-                state, small_win, small_line = small_result(board[big])
-
-
-                if state == "win":
-                    # txt = small_win + " hat das feld "+ big + " gewonnen"
-                    print(small_win , " hat das feld ", big , " gewonnen")
-                    # kleines Feld 'big' ist gewonnen von small_win ("X"/"O")
-                    # -> hier kannst du z. B. markieren oder ein Event senden
-                    room["finished_fields"][big] = small_win
-                    # await self.channel_layer.group_send(... "small_over" ...)
-                    pass
-                elif state == "draw":
-                    # kleines Feld 'big' ist unentschieden
-                    # print(small_win + " endet unentschieden")
-                    room["finished_fields"][big] = "D"
-                    pass
-                else:
-                    # "ongoing" – noch kein Abschluss
-                    pass
-                
-                print("Board: ", room["board"])
-                next_big = small
-
-                # Spieler wechseln und persistieren
-                room["currentPlayer"] = "O" if current_player == "X" else "X"
-
-
-                if _is_big_finished(room, next_big):
-                    # Ziel-Großfeld ist fertig -> freier Zug
-                    room["big_field_to_click"] = ""
-                else:
-                    room["big_field_to_click"] = next_big
-
-
-                winner, big_line = big_board_winner(room["finished_fields"])
-
-                # Optional: globales Unentschieden (alle 9 großfelder fertig, aber kein Sieger)
-                if not winner and is_global_draw(room["finished_fields"]):
-                    winner, big_line = "D", None
-                    room["phase"] = "finished"
-                    room["big_field_to_click"] = ""
-                else:
-                    if winner:
-                        room["phase"] = "finished"
-                        room["big_field_to_click"] = ""
-
-               
-                # room["big_field_to_click"] = next_big
-                print("Im nächsten Zug anklicken: ", room["big_field_to_click"])
-
-                # Inkrementell broadcasten (kein Dict serialisieren)
-                finished_fields_list = [
-                    {"big": int(b), "winner": w}
-                    for b, w in room.get("finished_fields", {}).items()
-                ]
-
-                await self.channel_layer.group_send(
-                    self.group,
-                    {
-                        "type": "game.move",
-                        "big": int(big),
-                        "small": int(small),
-                        "symbol": current_player,
-                        "currentPlayer": room["currentPlayer"],
-                        "finished_fields": finished_fields_list,  # <--- LISTE statt Dict
-                    },
-                )
-
-                # 2) Falls Gesamtsieg / globaler Draw
-                if winner:
-                    await self.channel_layer.group_send(
-                        self.group,
-                        {
-                            "type": "game.over",
-                            "winner": winner,                            # "X" / "O" / "D"
-                            "line": list(big_line) if big_line else None # große Sieglinie
-                        },
-                    )
+            # Prüfen + Eintragen + Senden (Zug, Feldzwang, belegt, Sieg)
+            try:
+                delta = await play_move(self.channel_layer, room, my_symbol, big, small)
+            except IllegalMove as e:
+                await self.send(text_data=json.dumps({"event":"error","message":e.message}))
+                return
 
-            else:
-                print("Klick ins richtige Feld!")
+            log_event("move", sample=DEBUG_SAMPLE, room=self.room, big=big, small=small,
+                      next_big=delta.next_big, v=delta.version)
 
         elif action == "reset":
-            room = rooms.get(self.room)
+            room = await room_store.get(self.room, fresh=True)
             if not room:
                 return
 
             # Spiellogik zurücksetzen
-            room["board"] = {i: {} for i in range(9)}
-            room["finished_fields"] = {}
-            room["big_field_to_click"] = ""
-            room["currentPlayer"] = "X"
-            room["phase"] = "playing"
+            await room_store.reset_game(room, "playing")
+            history.game_started(room)
+            snapshots.mark(self.room)
+            reaper.touch(self.room, room.phase, room.game.version)
 
             # Broadcast an alle Spieler
-            await self.channel_layer.group_send(
-                self.group,
-                {
-                    "type": "game.reset",
-                    "board": [],
-                    "currentPlayer": room["currentPlayer"],
-                    "finished_fields": [],
-                    "big_field_to_click": room["big_field_to_click"],
-                    "message": "Spiel wurde neugestartet.",
-                }
-            )
+            reset = {
+                "event": "reset",
+                "v": room.game.version,
+                "message": "Spiel wurde neugestartet.",
+                "board": [],
+                "currentPlayer": room.game.current,
+                "finished_fields": [],
+                "big_field_to_click": "",
+                "legal": legal_hex(room.game.legal_mask()),
+            }
+            event = room_events.stamp(self.room, frame("game.reset", reset, protocol.encode_reset(reset)))
+            await self.channel_layer.group_send(self.group, event)
+            spectator_hub.publish(self.room, room.game.version, event)
+            if room.symbols.get(BOT_ID) == room.game.current:
+                schedule_bot(self.channel_layer, self.room)
         elif action == "get_state":
-            room = rooms.get(self.room)
+            room = await room_store.get(self.room, fresh=True)
             if not room:
                 await self.send(text_data=json.dumps({"event": "error", "message": "Raum existiert nicht."}))
                 return
 
-            # Symbol->Name Abbildung frisch ableiten
-            names_by_symbol = {}
-            for ch, s in room["symbols"].items():
-                if s in ("X", "O"):
-                    names_by_symbol[s] = room["players"].get(ch, "")
+            await self._send_state(room)
 
-            await self.send(text_data=json.dumps({
-                "event": "state",
-                "room": self.room,
-                "phase": room.get("phase", "lobby"),
-                "your_id": self.channel_name,
-                "your_symbol": room["symbols"].get(self.channel_name),  # kann None sein, wenn diese Verbindung nur „Zuschauen“ ist
-                "players": room["players"],
-                "symbols": room["symbols"],
-                "names_by_symbol": names_by_symbol,
-                "board": [(int(b), int(s), v)
-                        for b, cells in room["board"].items()
-                        for s, v in cells.items()],
-                "currentPlayer": room.get("currentPlayer", "X"),
-            }))
+        elif action == "sync":
+            # Client hat eine Lücke in "v" bemerkt -> nur die fehlenden Züge schicken
+            room = await room_store.get(self.room, fresh=True)
+            if not room:
+                await self.send(text_data=json.dumps({"event": "error", "message": "Raum existiert nicht."}))
+                return
+            await self._send_moves_since(room, data.get("since"))
+
+        elif action == "resume":
+            await self._resume(data)
 
 
         # Weitere Actions (start/move/leave) kommen später
-        
-    # def checkWin():
-    #     return
-
-    # async def _broadcast_players(self):
-    #     room = rooms.get(self.room)
-    #     if not room:
-    #         return
-    #     players = [
-    #         {"id": ch, "name": nick, "is_host": (ch == room["host"])}
-    #         for ch, nick in room["players"].items()
-    #     ]
-    #     await self.channel_layer.group_send(
-    #         self.group,
-    #         {"type": "players.update", "players": players, "count": len(players)}
-    #     )
-    async def _broadcast_players(self):
-        room = rooms.get(self.room)
+
+    async def _send_moves_since(self, room, since):
+        try:
+            since = int(since)
+        except (TypeError, ValueError):
+            since = -1
+
+        moves = room.game.moves_since(since)
+        if moves is None or self.binary:
+            # Reset dazwischen oder unbekannte Version -> kompletter Stand;
+            # binär ist der komplette Stand (~32 Byte) ohnehin kleiner als eine Zugliste
+            await self._send_state(room)
+            return
+
+        game = room.game
+        await self.send(text_data=json.dumps({
+            "event": "moves",
+            "since": since,
+            "v": game.version,
+            "moves": moves,
+            "currentPlayer": game.current,
+            "finished_fields": [{"big": b, "winner": w} for b, w in game.finished_fields().items()],
+            "big_field_to_click": game.forced if game.forced >= 0 else "",
+            "legal": legal_hex(game.legal_mask()),
+        }))
+
+    async def _resume(self, data):
+        """
+        { "action": "resume", "token": ..., "epoch": ..., "seq": N, "v": V }
+        Channel still austauschen (kein players.update) und nur Verpasstes schicken.
+        Klappt es nicht (Token, Lobby-Phase, Raum weg), kommt "resume_failed" –
+        der Client macht dann das normale create_or_join.
+        """
+        claims = read_token(data.get("token"), RESUME_TTL)
+        room = await room_store.get(self.room, fresh=True) if claims and claims[0] == self.room else None
+        # in der Lobby hat _leave den Spieler beim Abbruch schon ausgetragen -> normaler Join
+        if not room or room.phase not in ("starting", "playing") or room.symbol_by_name.get(claims[1]) != claims[2]:
+            RESUMES.labels("failed").inc()
+            await self.send(text_data=json.dumps({"event": "resume_failed"}))
+            return
+        _, nickname, symbol = claims
+
+        for ch, s in list(room.symbols.items()):
+            if s == symbol and ch != self.channel_name:
+                room.symbols.pop(ch, None)
+                room.players.pop(ch, None)
+                if room.host == ch:
+                    room.host = self.channel_name
+        room.players[self.channel_name] = nickname
+        room.symbols[self.channel_name] = symbol
+        self._seat_user(room, symbol)
+        if room.host is None:
+            room.host = self.channel_name
+        await room_store.save(room)
+        reaper.touch(self.room, room.phase, room.game.version)
+
+        missed = None if self.binary else room_events.since(self.room, data.get("epoch"), data.get("seq"))
+        await self.send(text_data=json.dumps({
+            "event": "resumed",
+            "your_id": self.channel_name,
+            "your_symbol": symbol,
+            "you_are_host": room.host == self.channel_name,
+            "epoch": room_events.epoch,
+            "seq": room_events.latest(self.room),
+            "replayed": None if missed is None else len(missed),
+        }))
+        if missed is None:
+            # Log reicht nicht (anderer Worker, zu alt) -> Züge seit "v" bzw. kompletter Stand
+            RESUMES.labels("sync").inc()
+            await self._send_moves_since(room, data.get("v"))
+            return
+        RESUMES.labels("replay").inc()
+        for text in missed:
+            await self.send(text_data=text)
+
+    async def _handle_spectator(self, action, data):
+        if action == "spectate":
+            if not self.spectator:
+                # bisherige Verbindung wechselt auf Zuschauen
+                await self.channel_layer.group_discard(self.group, self.channel_name)
+                self.spectator = True
+                CONNECTIONS.labels(self.kind).dec()
+                self.kind = "spectator"
+                CONNECTIONS.labels(self.kind).inc()
+            if not self.watching:
+                await self._spectate()
+        elif action in ("get_state", "sync"):
+            # Zuschauer bekommen immer den kompletten Stand, keine Zuglisten
+            room = await room_store.get(self.room, fresh=True)
+            if not room:
+                await self.send(text_data=json.dumps({"event": "error", "message": "Raum existiert nicht."}))
+                return
+            await self._send_spectator_state(room)
+        elif action is not None:
+            await self.send(text_data=json.dumps({"event": "error", "message": "Zuschauer können nicht mitspielen."}))
+
+    async def _hint(self):
+        if self._hint_running:
+            HINTS.labels("busy").inc()
+            await self.send(text_data=json.dumps({"event": "error", "message": "Analyse läuft noch."}))
+            return
+        wait = self._hint_bucket.take(time.monotonic())
+        if wait:
+            HINTS.labels("limited").inc()
+            await self.send(text_data=json.dumps({
+                "event": "error", "message": "Zu viele Hinweise – kurz warten.", "retry_after": round(wait, 2),
+            }))
+            return
+        room = await room_store.get(self.room, fresh=True)
+        if not room or room.game.winner:
+            return
+        version = room.game.version
+        self._hint_running = True
+        try:
+            result = await bot_player.hint(analysis.hint, Position.from_game(room.game).to_tuple(), HINT_MS)
+        except BotLimit as e:
+            HINTS.labels("no_slot").inc()
+            await self.send(text_data=json.dumps({"event": "error", "message": e.message}))
+            return
+        finally:
+            self._hint_running = False
+        HINTS.labels("ok").inc()
+        await self.send(text_data=json.dumps({"event": "hint", "v": version, **result}))
+
+    async def _spectate(self):
+        room = await room_store.get(self.room, fresh=True)
         if not room:
+            await self.send(text_data=json.dumps({"event": "error", "message": "Raum existiert nicht."}))
+            await self.close()
+            return
+        try:
+            await spectator_hub.watch(self.room, self, room.game.version)
+        except SpectatorLimit as e:
+            await self.send(text_data=json.dumps({"event": "error", "message": e.message}))
+            await self.close()
             return
+        self.watching = True
+        await self._send_spectator_state(room)
 
-        players = [
-            {"id": ch, "name": nick, "is_host": (ch == room["host"])}
-            for ch, nick in room["players"].items()
-        ]
+    async def _send_spectator_state(self, room):
+        if self.binary:
+            await self.send(bytes_data=protocol.encode_state(room.game))
+        else:
+            await self.send(text_data=json.dumps(spectator_state(room)))
 
-        # Symbol -> Name vorbereiten
-        names_by_symbol = {}
-        for ch, s in room.get("symbols", {}).items():
-            if s in ("X", "O"):
-                names_by_symbol[s] = room["players"].get(ch, "")
+    async def _send_joined(self, room):
+        # vollständige Bestätigung zurück (Join und Rejoin)
+        if self.binary:
+            # Lobby-Teil als JSON, Spielstand als STATE-Frame hinterher
+            await self.send(text_data=json.dumps({
+                "event": "joined",
+                "room": self.room,
+                "you_are_host": (room.host == self.channel_name),
+                "your_id": self.channel_name,
+                "phase": room.phase,
+                "your_symbol": room.symbols[self.channel_name],
+                "players": room.players,
+                "symbols": room.symbols,
+                "names_by_symbol": room.names_by_symbol(),
+                **self._resume_info(room),
+            }))
+            await self.send(bytes_data=protocol.encode_state(room.game))
+            return
+        await self.send(text_data=json.dumps({
+            "event": "joined",
+            "room": self.room,
+            "you_are_host": (room.host == self.channel_name),
+            "your_id": self.channel_name,
+            "phase": room.phase,
+            "your_symbol": room.symbols[self.channel_name],
+            "players": room.players,
+            "symbols": room.symbols,
+            "names_by_symbol": room.names_by_symbol(),
+            **self._resume_info(room),
+            **game_snapshot(room.game),
+        }))
+
+    def _resume_info(self, room):
+        # Token fürs Wiederverbinden + Stand des Event-Logs (ab hier zählt "seq")
+        return {
+            "resume_token": make_token(self.room, room.players[self.channel_name], room.symbols[self.channel_name]),
+            "epoch": room_events.epoch,
+            "seq": room_events.latest(self.room),
+        }
+
+    async def _send_state(self, room):
+        if self.binary:
+            await self.send(bytes_data=protocol.encode_state(room.game))
+            return
+        await self.send(text_data=json.dumps({
+            "event": "state",
+            "room": self.room,
+            "phase": room.phase,
+            "your_id": self.channel_name,
+            "your_symbol": room.symbols.get(self.channel_name),  # kann None sein, wenn diese Verbindung nur „Zuschauen“ ist
+            "players": room.players,
+            "symbols": room.symbols,
+            "names_by_symbol": room.names_by_symbol(),
+            **game_snapshot(room.game),
+        }))
+
+    async def _broadcast_players(self, room):
+        players = room.player_list()
 
         await self.channel_layer.group_send(
             self.group,
-            {
-                "type": "players.update",
+            room_events.stamp(self.room, frame("players.update", {
+                "event": "player_list",
                 "players": players,
                 "count": len(players),
-                "symbols": room.get("symbols", {}),       # <— neu
-                "names_by_symbol": names_by_symbol,       # <— neu
-            }
+                "symbols": room.symbols,                      # <— neu
+                "names_by_symbol": room.names_by_symbol(),    # <— neu
+            })),
         )
 
 
+    def _check_epoch(self, event):
+        # Event aus einem anderen Worker -> lokales Event-Log des Raums ist lückenhaft
+        epoch = event.get("epoch")
+        if epoch is not None and epoch != room_events.epoch:
+            room_events.foreign(self.room)
 
-    # async def players_update(self, event):
-    #     await self.send(text_data=json.dumps({
-    #         "event": "player_list",
-    #         "players": event["players"],  # [{id, name, is_host}, ...]
-    #         "count": event.get("count"),
-    #     }))
+    async def _forward(self, event):
+        # Frame wurde schon beim Sender serialisiert (siehe frame())
+        self._check_epoch(event)
+        if self.binary and "bytes" in event:
+            await self.send(bytes_data=event["bytes"])
+        else:
+            await self.send(text_data=event["text"])
 
     async def players_update(self, event):
-        await self.send(text_data=json.dumps({
-            "event": "player_list",
-            "players": event["players"],
-            "count": event.get("count"),
-            "symbols": event.get("symbols", {}),
-            "names_by_symbol": event.get("names_by_symbol", {}),
-        }))
+        await self._forward(event)
 
     async def game_start(self, event):
-        await self.send(text_data=json.dumps({
-            "event": "start",
-            "url": event["url"]
-        }))
-
-    # async def game_move(self, event):
-    #     await self.send(text_data=json.dumps({
-    #         "event": "move",
-    #         "big": event["big"],
-    #         "small": event["small"],
-    #         "symbol": event["symbol"],
-    #         "currentPlayer": event["currentPlayer"],
-    #         "finished_fields": event["finished_fields"],
-    #     }))
+        await self._forward(event)
 
     async def game_move(self, event):
-        await self.send(text_data=json.dumps({
-            "event": "move",
-            "big": event["big"],
-            "small": event["small"],
-            "symbol": event["symbol"],
-            "currentPlayer": event["currentPlayer"],
-            # event["finished_fields"] ist jetzt eine Liste von {big, winner}
-            "finished_fields": event.get("finished_fields", []),
-        }))
+        await self._forward(event)
 
     async def game_over(self, event):
-        await self.send(text_data=json.dumps({
-            "event": "game_over",
-            "winner": event["winner"],   # "X" / "O" / "D"
-            "line": event["line"],       # [a,b,c] auf dem großen Brett oder null
-        }))
-    
-   
+        await self._forward(event)
+
     async def game_reset(self, event):
-        await self.send(text_data=json.dumps({
-            "event": "reset",
-            "message": event.get("message"),
-            "board": event.get("board", []),
-            "currentPlayer": event.get("currentPlayer", "X"),
-            "finished_fields": event.get("finished_fields", []),
-            "big_field_to_click": event.get("big_field_to_click", ""),
-        }))
+        await self._forward(event)
+
+    async def room_closed(self, event):
+        await self._forward(event)
+
+    # Chat/Tippen laufen über dieselbe Gruppe, kommen aber nur bei /ws/play/ an (multiplex.py)
+    async def chat_batch(self, event):
+        pass
+
+    async def presence_typing(self, event):
+        pass
 
-    
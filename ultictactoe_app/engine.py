@@ -0,0 +1,311 @@
+# ultictactoe_app/engine.py
+"""
+Bitboard-Engine für Ultimate Tic-Tac-Toe.
+
+Jedes kleine Feld und das große Brett werden als zwei 9-Bit-Masken
+gespeichert (eine pro Spieler), Bit i steht für Zelle i (0..8).
+Sieg / Unentschieden wird über vorberechnete Tabellen mit 512 Einträgen
+entschieden – keine Listen, keine Schleifen über LINES pro Zug.
+
+Bewusst ohne Django-Import, damit man die Engine einzeln testen und
+benchmarken kann.
+"""
+
+# Gewinn-Linien für 3x3
+LINES = (
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),  # Reihen
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),  # Spalten
+    (0, 4, 8), (2, 4, 6),             # Diagonalen
+)
+LINE_MASKS = tuple((1 << a) | (1 << b) | (1 << c) for a, b, c in LINES)
+
+FULL = 0x1FF  # alle 9 Zellen belegt
+
+# 81-Bit-Masken über das ganze Brett, Bit big*9+small
+ALL_CELLS = (1 << 81) - 1
+BOARD_BITS = tuple(FULL << (9 * b) for b in range(9))   # alle Zellen von Großfeld b
+
+
+def _first_line(mask):
+    for i, lm in enumerate(LINE_MASKS):
+        if mask & lm == lm:
+            return i
+    return -1
+
+
+# WIN_LINE[mask] -> Index in LINES der ersten vollständigen Linie, sonst -1
+WIN_LINE = tuple(_first_line(m) for m in range(512))
+
+# CELL_LINES[i] -> (Linien-Index, Maske) aller Linien, die durch Zelle i gehen
+CELL_LINES = tuple(
+    tuple((li, LINE_MASKS[li]) for li, line in enumerate(LINES) if i in line)
+    for i in range(9)
+)
+
+
+def _line_through(mask: int, cell: int):
+    """Nur die 2–4 Linien durch die gerade gesetzte Zelle prüfen."""
+    for li, lm in CELL_LINES[cell]:
+        if mask & lm == lm:
+            return LINES[li]
+    return None
+
+
+def mask_result(x: int, o: int):
+    """
+    x, o: 9-Bit-Masken der beiden Spieler für ein 3x3-Feld.
+    Rückgabe (wie small_result):
+      ("win", "X", (0,4,8))  -> Spieler X hat gewonnen (mit Linie)
+      ("draw", None, None)   -> alle 9 Felder belegt, kein Gewinner
+      ("ongoing", None, None)-> noch nicht entschieden
+    """
+    lx = WIN_LINE[x]
+    lo = WIN_LINE[o]
+    if lx >= 0 and (lo < 0 or lx <= lo):
+        return "win", "X", LINES[lx]
+    if lo >= 0:
+        return "win", "O", LINES[lo]
+    if x | o == FULL:
+        return "draw", None, None
+    return "ongoing", None, None
+
+
+def legal_cells(mask: int):
+    """81-Bit-Maske -> [(big, small), …]"""
+    out = []
+    while mask:
+        low = mask & -mask
+        c = low.bit_length() - 1
+        out.append((c // 9, c % 9))
+        mask ^= low
+    return out
+
+
+def masks_from_cells(cells: dict):
+    """{small: "X"/"O"} -> (x_mask, o_mask)"""
+    x = o = 0
+    for i, v in cells.items():
+        if v == "X":
+            x |= 1 << int(i)
+        elif v == "O":
+            o |= 1 << int(i)
+    return x, o
+
+
+class IllegalMove(Exception):
+    """Zug ist nicht erlaubt; die Nachricht geht so an den Client."""
+
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class MoveDelta:
+    """
+    Was sich durch einen Zug geändert hat:
+      big, small, symbol -> der Zug selbst
+      finished           -> neu entschiedenes Großfeld als (big, "X"/"O"/"D") oder None
+      next_big           -> erzwungenes Großfeld für den nächsten Zug, -1 = freie Wahl
+      current            -> wer jetzt dran ist
+      winner, line       -> "X"/"O"/"D" + große Sieglinie, wenn das Spiel vorbei ist
+      version            -> Raum-Version nach diesem Zug (siehe GameState.version)
+      legal              -> 81-Bit-Maske der Züge, die der nächste Spieler machen darf
+    """
+
+    __slots__ = ("big", "small", "symbol", "finished", "next_big", "current", "winner", "line", "version",
+                 "legal")
+
+    def __init__(self, big, small, symbol, finished, next_big, current, winner, line, version, legal=0):
+        self.big = big
+        self.small = small
+        self.symbol = symbol
+        self.finished = finished
+        self.next_big = next_big
+        self.current = current
+        self.winner = winner
+        self.line = line
+        self.version = version
+        self.legal = legal
+
+
+class GameState:
+    """
+    Komplettes Spiel: 9 kleine Felder + großes Brett + wer dran ist.
+
+    x[big] / o[big]   -> Masken der kleinen Felder
+    meta_x / meta_o   -> gewonnene Großfelder
+    meta_d            -> unentschiedene Großfelder
+    current           -> "X" / "O"
+    forced            -> Großfeld, in das gespielt werden muss, -1 = freie Wahl
+    winner, line      -> None während das Spiel läuft, sonst "X"/"O"/"D" (+ Linie)
+    moves             -> gespielte Züge als Zellindex big*9+small (1 Byte pro Zug)
+    base              -> Raum-Version, bei der dieses Spiel begonnen hat
+    free              -> 81-Bit-Maske: leere Zellen in noch offenen Großfeldern,
+                         wird pro Zug nachgeführt (siehe legal_mask)
+
+    version = base + Anzahl Züge; steigt über Resets hinweg monoton, damit
+    Clients Lücken erkennen und gezielt nachfordern können.
+    """
+
+    __slots__ = ("x", "o", "meta_x", "meta_o", "meta_d", "current", "forced", "winner", "line",
+                 "moves", "base", "free")
+
+    def __init__(self, base: int = 0):
+        self.x = [0] * 9
+        self.o = [0] * 9
+        self.meta_x = 0
+        self.meta_o = 0
+        self.meta_d = 0
+        self.current = "X"
+        self.forced = -1
+        self.winner = None
+        self.line = None
+        self.moves = bytearray()
+        self.base = base
+        self.free = ALL_CELLS
+
+    def rebuild(self):
+        """free neu berechnen, nachdem x/o/meta_* direkt gesetzt wurden (z. B. aus Redis)."""
+        done = self.meta_x | self.meta_o | self.meta_d
+        free = 0
+        for big in range(9):
+            if not done >> big & 1:
+                free |= (FULL & ~(self.x[big] | self.o[big])) << (9 * big)
+        self.free = free
+
+    def legal_mask(self) -> int:
+        """Alle erlaubten Züge als 81-Bit-Maske (Bit big*9+small), 0 wenn vorbei."""
+        if self.winner is not None:
+            return 0
+        if self.forced >= 0:
+            return self.free & BOARD_BITS[self.forced]
+        return self.free
+
+    def is_legal(self, big: int, small: int) -> bool:
+        return 0 <= big <= 8 and 0 <= small <= 8 and bool(self.legal_mask() >> (big * 9 + small) & 1)
+
+    @property
+    def version(self) -> int:
+        return self.base + len(self.moves)
+
+    def apply_move(self, big: int, small: int, symbol: str = None) -> MoveDelta:
+        """
+        Prüft den Zug, trägt ihn ein und gibt ein MoveDelta zurück.
+        symbol: wer zieht (None = wer gerade dran ist).
+        Wirft IllegalMove, ohne den Zustand zu verändern.
+        """
+        if self.winner is not None:
+            raise IllegalMove("Das Spiel ist bereits beendet.")
+        if symbol is None:
+            symbol = self.current
+        elif symbol != self.current:
+            raise IllegalMove("Du bist nicht dran.")
+        if not (0 <= big <= 8 and 0 <= small <= 8):
+            raise IllegalMove("Außerhalb des Boards.")
+        cell = big * 9 + small
+        if not self.legal_mask() >> cell & 1:
+            # nur im Fehlerfall genauer nachsehen, warum
+            if self.forced != -1 and big != self.forced:
+                raise IllegalMove("Klick ins richtige Feld!")
+            if self.is_finished(big):
+                raise IllegalMove("Das große Feld ist bereits belegt.")
+            raise IllegalMove("Feld bereits belegt.")
+        big_bit = 1 << big
+        bit = 1 << small
+        self.free &= ~(1 << cell)
+
+        if symbol == "X":
+            mask = self.x[big] = self.x[big] | bit
+        else:
+            mask = self.o[big] = self.o[big] | bit
+
+        finished = None
+        if _line_through(mask, small):
+            finished = (big, symbol)
+            if symbol == "X":
+                self.meta_x |= big_bit
+                meta = self.meta_x
+            else:
+                self.meta_o |= big_bit
+                meta = self.meta_o
+            self.free &= ~BOARD_BITS[big]
+            # großes Brett: wieder nur die Linien durch dieses Großfeld
+            line = _line_through(meta, big)
+            if line:
+                self.winner, self.line = symbol, line
+        elif self.x[big] | self.o[big] == FULL:
+            finished = (big, "D")
+            self.meta_d |= big_bit
+            self.free &= ~BOARD_BITS[big]
+
+        if finished and self.winner is None and self.meta_x | self.meta_o | self.meta_d == FULL:
+            self.winner = "D"
+
+        if self.winner is not None or (self.meta_x | self.meta_o | self.meta_d) >> small & 1:
+            self.forced = -1    # Ziel-Großfeld ist fertig -> freier Zug
+        else:
+            self.forced = small
+
+        self.current = "O" if symbol == "X" else "X"
+        self.moves.append(big * 9 + small)
+        return MoveDelta(big, small, symbol, finished, self.forced,
+                         self.current, self.winner, self.line, self.version, self.legal_mask())
+
+    def moves_since(self, version: int):
+        """
+        Züge nach `version` als [(big, small, "X"/"O"), …].
+        None, wenn version nicht in dieses Spiel fällt (Reset dazwischen) –
+        dann braucht der Client den kompletten Stand.
+        """
+        if not (self.base <= version <= self.version):
+            return None
+        start = version - self.base
+        return [
+            (m // 9, m % 9, "X" if i % 2 == 0 else "O")
+            for i, m in enumerate(self.moves[start:], start)
+        ]
+
+    def cell(self, big: int, small: int):
+        bit = 1 << small
+        if self.x[big] & bit:
+            return "X"
+        if self.o[big] & bit:
+            return "O"
+        return None
+
+    def is_occupied(self, big: int, small: int) -> bool:
+        return bool((self.x[big] | self.o[big]) >> small & 1)
+
+    def is_finished(self, big: int) -> bool:
+        return bool((self.meta_x | self.meta_o | self.meta_d) >> big & 1)
+
+    def small_result(self, big: int):
+        return mask_result(self.x[big], self.o[big])
+
+    def finished_fields(self) -> dict:
+        """{big_index: "X"/"O"/"D"} – nur für Ausgaben an den Client."""
+        out = {}
+        for big in range(9):
+            bit = 1 << big
+            if self.meta_x & bit:
+                out[big] = "X"
+            elif self.meta_o & bit:
+                out[big] = "O"
+            elif self.meta_d & bit:
+                out[big] = "D"
+        return out
+
+    def cells(self):
+        """Belegte Zellen als [(big, small, "X"/"O"), …] für JSON-Antworten."""
+        out = []
+        for big in range(9):
+            x, o = self.x[big], self.o[big]
+            if not (x | o):
+                continue
+            for small in range(9):
+                bit = 1 << small
+                if x & bit:
+                    out.append((big, small, "X"))
+                elif o & bit:
+                    out.append((big, small, "O"))
+        return out
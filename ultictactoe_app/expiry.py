@@ -0,0 +1,143 @@
+# ultictactoe_app/expiry.py
+"""
+Verlassene Räume aufräumen.
+
+Ein hierarchisches Timer-Rad für alle Räume statt einem Task pro Raum:
+  Ebene 0: 64 Slots à 1 Tick, Ebene 1: 64 Slots à 64 Ticks, Ebene 2: à 4096 Ticks.
+Eintragen ist O(1), pro Tick wird nur ein Slot abgearbeitet (plus ab und
+zu ein Slot der höheren Ebene, der eine Ebene tiefer einsortiert wird).
+
+Aktivität (touch) verschiebt nur die Deadline im Dict – der alte Eintrag
+bleibt im Rad und setzt sich beim Fälligwerden neu, falls der Raum
+inzwischen benutzt wurde. Nur wenn die neue Deadline *früher* liegt
+(z. B. Phase "finished" mit kurzer TTL), kommt ein zusätzlicher Eintrag.
+"""
+import asyncio
+import logging
+import time
+
+from .metrics import log_event
+
+
+class TimerWheel:
+    def __init__(self, slots: int = 64, levels: int = 3):
+        self.slots = slots
+        self.now = 0    # aktueller Tick
+        self._span = [slots ** i for i in range(levels + 1)]   # Ticks pro Slot je Ebene (+ Gesamtspanne)
+        self._wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def schedule(self, key, tick: int):
+        """key bei Tick `tick` (absolut) fällig werden lassen."""
+        self._count += 1
+        self._insert(tick, key)
+
+    def _insert(self, tick, key):
+        # zu weit weg -> erst mal in den letzten Slot der obersten Ebene, wird beim Kaskadieren neu einsortiert
+        at = max(self.now + 1, min(tick, self.now + self._span[-1] - 1))
+        delta = at - self.now
+        for level in range(len(self._wheels)):
+            if delta < self._span[level + 1]:
+                self._wheels[level][(at // self._span[level]) % self.slots].append((tick, key))
+                return
+
+    def advance(self, to_tick: int):
+        """Bis `to_tick` weiterdrehen; Rückgabe: fällige Keys in Fälligkeitsreihenfolge."""
+        due = []
+        while self.now < to_tick:
+            self.now += 1
+            t = self.now
+            # höhere Ebenen eine Ebene tiefer einsortieren, wenn ihr Slot dran ist
+            for level in range(len(self._wheels) - 1, 0, -1):
+                if t % self._span[level] == 0:
+                    slot = self._wheels[level][(t // self._span[level]) % self.slots]
+                    entries = slot[:]
+                    slot.clear()
+                    for tick, key in entries:
+                        if tick <= t:
+                            due.append(key)
+                            self._count -= 1
+                        else:
+                            self._insert(tick, key)
+            slot = self._wheels[0][t % self.slots]
+            if slot:
+                keep = []
+                for tick, key in slot:
+                    if tick <= t:
+                        due.append(key)
+                        self._count -= 1
+                    else:
+                        keep.append((tick, key))   # zu weit weg eingetragen, nächste Runde
+                slot[:] = keep
+        return due
+
+
+class RoomReaper:
+    """
+    Leerlauf pro Raum verfolgen und nach der TTL der aktuellen Phase
+    on_expire(code, phase, version) aufrufen (async). Ein Task für alle Räume.
+
+    ttl: {"lobby": s, "starting": s, "playing": s, "finished": s}
+    """
+
+    def __init__(self, ttl: dict, on_expire, tick: float = 1.0, clock=time.monotonic):
+        self.ttl = ttl
+        self.on_expire = on_expire
+        self.tick = tick
+        self._clock = clock
+        self._t0 = clock()
+        self.wheel = TimerWheel()
+        self._rooms = {}    # code -> [fällig_tick, eingetragen_tick, phase, version]
+        self._task = None
+        self.expired = 0
+
+    def _now_tick(self):
+        return int((self._clock() - self._t0) / self.tick)
+
+    def touch(self, code, phase, version=None):
+        """Raum wurde benutzt. version: Spielstand dabei (erkennt Aktivität in anderen Workern)."""
+        ttl = self.ttl.get(phase)
+        if ttl is None:
+            return
+        deadline = self._now_tick() + max(1, int(ttl / self.tick))
+        entry = self._rooms.get(code)
+        if entry is None:
+            self._rooms[code] = [deadline, deadline, phase, version]
+            self.wheel.schedule(code, deadline)
+        else:
+            entry[0], entry[2], entry[3] = deadline, phase, version
+            if deadline < entry[1]:
+                entry[1] = deadline
+                self.wheel.schedule(code, deadline)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def forget(self, code):
+        # Eintrag im Rad bleibt, läuft beim Fälligwerden ins Leere
+        self._rooms.pop(code, None)
+
+    def __len__(self):
+        return len(self._rooms)
+
+    async def _run(self):
+        while self._rooms:
+            await asyncio.sleep(self.tick)
+            now = self._now_tick()
+            for code in self.wheel.advance(now):
+                entry = self._rooms.get(code)
+                if entry is None or entry[1] > now:
+                    continue   # vergessen bzw. veralteter Doppel-Eintrag
+                if entry[0] > now:
+                    # zwischendurch benutzt -> zur neuen Deadline wieder eintragen
+                    entry[1] = entry[0]
+                    self.wheel.schedule(code, entry[0])
+                    continue
+                del self._rooms[code]
+                try:
+                    if await self.on_expire(code, entry[2], entry[3]):
+                        self.expired += 1
+                except Exception as e:
+                    log_event("room_expire_failed", logging.ERROR, room=code, error=repr(e))
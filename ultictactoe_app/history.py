@@ -0,0 +1,255 @@
+# ultictactoe_app/history.py
+"""
+Partien und Züge in die Datenbank schreiben, ohne den Zug-Pfad zu bremsen.
+
+Der Consumer legt nur ein kleines Tupel in einen Puffer im Speicher
+(O(1), kein await auf die DB). Ein Hintergrund-Task sammelt, was sich
+angesammelt hat, und schreibt es gebündelt in einer Transaktion
+(bulk_create) – bei SQLite ein fsync pro Batch statt pro Zug.
+
+    history.game_started(room)        # Start / Reset
+    history.move(room, delta)         # nach jedem gültigen Zug
+    history.snapshot(…) / drop_snapshot(code)   # Raum-Snapshots für recovery.py
+    await history.flush()             # z. B. vor dem Beenden / in Tests
+
+Gegendruck: ist der Puffer voll (max_queue), wartet move() bis zu
+`block` Sekunden, dass der Writer Platz schafft. Kommt die DB gar nicht
+hinterher, wird verworfen und gezählt (ultictactoe_history_dropped_total)
+– das Spiel selbst läuft immer weiter, nur die Historie fehlt dann.
+"""
+import asyncio
+import collections
+import logging
+import time
+import uuid
+from datetime import datetime, timezone
+
+from channels.db import database_sync_to_async
+from django.db import transaction
+
+from .metrics import Histogram, log_event
+
+# Puffer-Einträge: (Art, Daten)
+_GAME, _MOVE, _OVER, _SNAP, _UNSNAP = "game", "move", "over", "snap", "unsnap"
+
+
+class HistoryWriter:
+    def __init__(self, batch_size=500, interval=0.5, max_queue=50_000, block=1.0, enabled=True):
+        self.batch_size = batch_size   # Einträge pro Transaktion
+        self.interval = interval       # spätestens so oft (s) wird geschrieben
+        self.max_queue = max_queue
+        self.block = block             # max. Wartezeit (s) bei vollem Puffer
+        self.enabled = enabled
+
+        self._queue = collections.deque()
+        self._wake = None              # asyncio.Event: "Batch voll" / flush()
+        self._space = None             # asyncio.Event: wieder Platz im Puffer
+        self._task = None
+        self._idle = None              # asyncio.Event: Puffer leer geschrieben
+
+        # Zähler für /metrics
+        self.written = {_GAME: 0, _MOVE: 0, _OVER: 0, _SNAP: 0, _UNSNAP: 0}
+        self.dropped = 0
+        self.waits = 0
+        self.errors = 0                # verworfene Einträge (Schreibfehler)
+
+    @property
+    def depth(self):
+        return len(self._queue)
+
+    # --- aus dem Consumer ----------------------------------------------------------
+
+    def game_started(self, room):
+        """Neue Partie im Raum (nach reset_game – room.game_id ist schon gesetzt)."""
+        if not self.enabled or not room.game_id:
+            return
+        # Schnelles Spiel: noch niemand verbunden -> Namen aus symbol_by_name
+        names = {s: n for n, s in room.symbol_by_name.items()}
+        names.update(room.names_by_symbol())
+        # Start/Ende werden nie verworfen: ohne Game-Zeile hängen die Züge in der Luft
+        self._push((_GAME, (room.game_id, room.code, names.get("X", ""), names.get("O", ""), _now())))
+
+    async def move(self, room, delta):
+        """Gültigen Zug vormerken. Wartet nur, wenn der Puffer voll ist."""
+        if not self.enabled or not room.game_id:
+            return
+        if len(self._queue) >= self.max_queue:
+            self.waits += 1
+            if not await self._wait_for_space():
+                self.dropped += 1
+                # unter Überlast kommt das pro Zug -> nur Stichprobe loggen, Zähler ist exakt
+                log_event("history_dropped", logging.WARNING, sample=0.01, room=room.code, v=delta.version)
+                return
+        ply = delta.version - room.game.base
+        self._push((_MOVE, (room.game_id, ply, delta.big, delta.small, delta.symbol, _now())))
+        if delta.winner:
+            self._push((_OVER, (room.game_id, delta.winner, ply, _now())))
+
+    def snapshot(self, code, game_id, phase, symbol_by_name, bot, user_ids, base, moves):
+        """Stand eines laufenden Raums merken (ersetzt den vorigen Snapshot des Raums)."""
+        if self.enabled:
+            self._push((_SNAP, (code, game_id, phase, dict(symbol_by_name), bot, dict(user_ids), base,
+                                bytes(moves), _now())))
+
+    def drop_snapshot(self, code):
+        if self.enabled:
+            self._push((_UNSNAP, code))
+
+    async def flush(self):
+        """Alles bisher Gepufferte schreiben (wartet, bis der Writer fertig ist)."""
+        if not self._queue and (self._task is None or self._idle.is_set()):
+            return
+        self._ensure_task()
+        self._idle.clear()
+        self._wake.set()
+        await self._idle.wait()
+
+    # --- intern ---------------------------------------------------------------------
+
+    def _push(self, item):
+        self._queue.append(item)
+        self._ensure_task()
+        self._idle.clear()
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    async def _wait_for_space(self):
+        self._ensure_task()
+        self._wake.set()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.block
+        while len(self._queue) >= self.max_queue:
+            if loop.time() >= deadline:
+                return False
+            # Timer statt wait_for: weckt spätestens zur Deadline
+            self._space.clear()
+            timer = loop.call_at(deadline, self._space.set)
+            try:
+                await self._space.wait()
+            finally:
+                timer.cancel()
+        return True
+
+    def _ensure_task(self):
+        if self._task is None or self._task.done():
+            self._wake = asyncio.Event()
+            self._space = asyncio.Event()
+            self._idle = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # spätestens nach `interval` schreiben, früher bei vollem Batch / flush()
+            timer = loop.call_later(self.interval, self._wake.set)
+            try:
+                await self._wake.wait()
+            finally:
+                timer.cancel()
+            self._wake.clear()
+            while self._queue:
+                n = min(len(self._queue), self.batch_size)
+                items = [self._queue.popleft() for _ in range(n)]
+                self._space.set()
+                started = time.perf_counter()
+                items = await self._write_batch(items)
+                FLUSH_SECONDS.observe(time.perf_counter() - started)
+                BATCH_SIZE.observe(n)
+                for kind, _ in items:
+                    self.written[kind] += 1
+            self._idle.set()
+
+    async def _write_batch(self, items):
+        """
+        Batch schreiben; Rückgabe: was davon in der DB ist. Schlägt er fehl,
+        einmal wiederholen (DB kurz gesperrt o. Ä.), danach Eintrag für
+        Eintrag – eine kaputte Zeile kostet dann nur sich selbst, nicht
+        alle Partien und Züge im Batch. Wiederholen ist harmlos, _write
+        erzeugt keine doppelten Zeilen.
+        """
+        error = None
+        for _ in range(2):
+            try:
+                await _write(items)
+                return items
+            except Exception as e:
+                error = e
+        if len(items) == 1:
+            self.errors += 1
+            log_event("history_write_failed", logging.ERROR, items=1, error=repr(error))
+            return []
+        ok = []
+        for item in items:
+            try:
+                await _write([item])
+            except Exception as e:
+                # nicht endlos wiederholen – die Zeile wird verworfen
+                self.errors += 1
+                error = e
+                continue
+            ok.append(item)
+        if len(ok) < len(items):
+            log_event("history_write_failed", logging.ERROR, items=len(items) - len(ok), error=repr(error))
+        return ok
+
+    def stats(self):
+        return {
+            "queued": len(self._queue),
+            "written": dict(self.written),
+            "dropped": self.dropped,
+            "waits": self.waits,
+            "errors": self.errors,
+        }
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+@database_sync_to_async
+def _write(items):
+    from .models import Game, Move, RoomSnapshot
+
+    games, moves, overs, snaps = [], [], [], {}
+    for kind, data in items:
+        if kind == _GAME:
+            gid, room, x, o, at = data
+            games.append(Game(id=uuid.UUID(gid), room=room, x_name=x[:50], o_name=o[:50], started_at=at))
+        elif kind == _MOVE:
+            gid, ply, big, small, symbol, at = data
+            moves.append(Move(game_id=uuid.UUID(gid), ply=ply, big=big, small=small, symbol=symbol, played_at=at))
+        elif kind == _OVER:
+            overs.append(data)
+        elif kind == _SNAP:
+            # pro Raum zählt nur der letzte Stand im Batch
+            code, gid, phase, by_name, bot, user_ids, base, mv, at = data
+            snaps[code] = RoomSnapshot(code=code, game_id=uuid.UUID(gid), phase=phase, symbol_by_name=by_name,
+                                       bot=bot, user_ids=user_ids, base=base, moves=mv, plies=len(mv),
+                                       saved_at=at)
+        else:
+            snaps[data] = None
+
+    # Reihenfolge: Partien vor ihren Zügen; ignore_conflicts, damit ein
+    # wiederholter Batch keine doppelten Zeilen erzeugt
+    with transaction.atomic():
+        if games:
+            Game.objects.bulk_create(games, ignore_conflicts=True)
+        if moves:
+            Move.objects.bulk_create(moves, ignore_conflicts=True)
+        for gid, winner, ply, at in overs:
+            Game.objects.filter(id=uuid.UUID(gid)).update(winner=winner, moves=ply, finished_at=at)
+        gone = [code for code, snap in snaps.items() if snap is None]
+        if gone:
+            RoomSnapshot.objects.filter(code__in=gone).delete()
+        keep = [snap for snap in snaps.values() if snap is not None]
+        if keep:
+            RoomSnapshot.objects.bulk_create(
+                keep, update_conflicts=True, unique_fields=["code"],
+                update_fields=["game", "phase", "symbol_by_name", "bot", "user_ids", "base", "moves", "plies",
+                               "saved_at"],
+            )
+
+
+FLUSH_SECONDS = Histogram("ultictactoe_history_flush_seconds", "Dauer eines Schreib-Batches")
+BATCH_SIZE = Histogram("ultictactoe_history_batch_size", "Einträge pro Schreib-Batch",
+                       buckets=(1, 5, 10, 50, 100, 250, 500, 1000, 5000))
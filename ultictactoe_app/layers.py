@@ -0,0 +1,202 @@
+# ultictactoe_app/layers.py
+"""
+Channel Layer mit lokalem Kurzschluss (settings.CHANNEL_LAYERS).
+
+channels_redis schickt jedes group_send über Redis – auch wenn alle
+Mitglieder von game_<raum> im selben Prozess sitzen (mit Raum-Affinität,
+siehe cluster.py, der Normalfall). Das kostet pro Zug einen Redis-Roundtrip
+plus msgpack hin und zurück.
+
+HybridChannelLayer merkt sich, welche Channels dieses Prozesses in welcher
+Gruppe sind, und legt Nachrichten für sie direkt in den receive_buffer
+(dieselbe Queue, in die sonst die Nachrichten aus Redis wandern). Über
+Redis geht nur noch, was an Channels anderer Prozesse muss.
+
+Wer sonst noch in einer Gruppe ist, steht in einem kleinen Register in
+Redis (Hash <gruppe>:procs, Prozess -> Anzahl Mitglieder). Das Ergebnis
+("andere Prozesse in der Gruppe?") wird pro Gruppe bis zu `registry_ttl`
+Sekunden gecacht, ein rein lokaler Zug kostet also keinen Roundtrip.
+Damit ein neu beigetretener Prozess trotzdem sofort Events bekommt, meldet
+jeder Prozess, der einer Gruppe beitritt oder sie ganz verlässt, das per
+PUBLISH auf <prefix>:registry; alle anderen werfen daraufhin ihren
+Cache-Eintrag weg. Gecacht wird nur, solange dieses Abo steht – reißt es
+ab, fragt group_send wieder jedes Mal nach, bis es neu verbunden ist. Die
+TTL ist nur noch die Absicherung, falls eine Meldung doch verloren geht.
+Übrig bleibt das Fenster zwischen PUBLISH und Zustellung (~ ein Roundtrip).
+
+Die Redis-Gruppe selbst (Sorted Set) bleibt vollständig, andere Prozesse
+erreichen unsere Channels weiter über Redis. Stirbt ein Prozess, bleibt
+sein Register-Eintrag bis group_expiry stehen – dann geht eben wieder
+Redis mit, verloren geht nichts.
+"""
+import asyncio
+import logging
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    from channels_redis.core import RedisChannelLayer
+except ImportError:
+    raise ImproperlyConfigured("HybridChannelLayer braucht channels-redis (pip install channels-redis).")
+
+from .metrics import Counter, Gauge, log_event
+
+DELIVERIES = Counter("ultictactoe_layer_deliveries_total", "Gruppen-Zustellungen pro Channel",
+                     labels=("path",))
+_LOCAL = DELIVERIES.labels("local")
+_REMOTE = DELIVERIES.labels("remote")
+
+
+def _local_ratio():
+    total = _LOCAL.value + _REMOTE.value
+    return _LOCAL.value / total if total else 0.0
+
+
+Gauge("ultictactoe_layer_local_ratio", "Anteil der Zustellungen ohne Redis", fn=_local_ratio)
+
+
+class HybridChannelLayer(RedisChannelLayer):
+    def __init__(self, *args, registry_ttl=5.0, clock=time.monotonic, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.registry_ttl = registry_ttl
+        self._clock = clock
+        self.local_groups = {}   # gruppe -> set(lokale Channels)
+        self._remote = {}        # gruppe -> (gültig bis, andere Prozesse in der Gruppe?)
+        self._listeners = []     # ein Abo-Task pro Redis-Shard
+        self._subscribed = set() # Shards, deren Abo gerade steht
+        self._invalidations = 0  # zählt jede Meldung (auch während HGETALL noch läuft)
+
+    def _is_local(self, channel):
+        return "!" in channel and self.non_local_name(channel).endswith(self.client_prefix + "!")
+
+    def _registry_key(self, group):
+        return self._group_key(group) + b":procs"
+
+    @property
+    def _registry_channel(self):
+        return f"{self.prefix}:registry"
+
+    # --- Cache-Invalidierung ---------------------------------------------------------
+
+    def _ensure_listeners(self):
+        if self.registry_ttl > 0 and not self._listeners:
+            loop = asyncio.get_running_loop()
+            self._listeners = [loop.create_task(self._listen(i)) for i in range(self.ring_size)]
+
+    async def _listen(self, index):
+        while True:
+            pubsub = self.connection(index).pubsub()
+            try:
+                await pubsub.subscribe(self._registry_channel)
+                async for msg in pubsub.listen():
+                    if msg["type"] == "subscribe":
+                        self._subscribed.add(index)
+                    elif msg["type"] == "message":
+                        self._invalidations += 1
+                        self._remote.pop(msg["data"].decode(), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log_event("layer_registry_listen_failed", logging.WARNING, shard=index, error=repr(e))
+            finally:
+                # Meldungen können verpasst worden sein -> Cache taugt nicht mehr
+                self._subscribed.discard(index)
+                self._remote.clear()
+                await pubsub.aclose()
+            await asyncio.sleep(1.0)
+
+    def _stop_listeners(self):
+        for task in self._listeners:
+            task.cancel()
+        self._listeners = []
+
+    # --- Mitgliedschaft --------------------------------------------------------------
+
+    async def group_add(self, group, channel):
+        if not self._is_local(channel):
+            await super().group_add(group, channel)
+            return
+        assert self.require_valid_group_name(group), "Group name not valid"
+        assert self.require_valid_channel_name(channel), "Channel name not valid"
+        self._ensure_listeners()
+        members = self.local_groups.setdefault(group, set())
+        fresh = channel not in members
+        joined = not members
+        self._remote.pop(group, None)
+        members.add(channel)
+        # Gruppe + Register in einem Roundtrip
+        connection = self.connection(self.consistent_hash(group))
+        pipe = connection.pipeline()
+        pipe.zadd(self._group_key(group), {channel: time.time()})
+        pipe.expire(self._group_key(group), self.group_expiry)
+        if fresh:
+            pipe.hincrby(self._registry_key(group), self.client_prefix, 1)
+        pipe.expire(self._registry_key(group), self.group_expiry)
+        if joined:
+            pipe.publish(self._registry_channel, group)   # Caches der anderen Prozesse leeren
+        await pipe.execute()
+
+    async def group_discard(self, group, channel):
+        members = self.local_groups.get(group)
+        if members is None or channel not in members:
+            await super().group_discard(group, channel)
+            return
+        assert self.require_valid_group_name(group), "Group name not valid"
+        members.discard(channel)
+        self._remote.pop(group, None)
+        connection = self.connection(self.consistent_hash(group))
+        pipe = connection.pipeline()
+        pipe.zrem(self._group_key(group), channel)
+        if members:
+            pipe.hincrby(self._registry_key(group), self.client_prefix, -1)
+        else:
+            del self.local_groups[group]
+            pipe.hdel(self._registry_key(group), self.client_prefix)
+            pipe.publish(self._registry_channel, group)
+        await pipe.execute()
+
+    async def _has_remote(self, group):
+        now = self._clock()
+        cached = self._remote.get(group)
+        if cached is not None and now < cached[0]:
+            return cached[1]
+        index = self.consistent_hash(group)
+        seen = self._invalidations
+        procs = await self.connection(index).hgetall(self._registry_key(group))
+        me = self.client_prefix.encode()
+        others = any(p != me and int(n) > 0 for p, n in procs.items())
+        # nur cachen, wenn das Abo steht und während HGETALL keine Meldung kam
+        if self.registry_ttl > 0 and index in self._subscribed and seen == self._invalidations:
+            self._remote[group] = (now + self.registry_ttl, others)
+        return others
+
+    # --- Senden ----------------------------------------------------------------------
+
+    async def group_send(self, group, message):
+        members = self.local_groups.get(group)
+        if not members:
+            await super().group_send(group, message)
+            return
+        assert self.require_valid_group_name(group), "Group name not valid"
+        for channel in list(members):
+            # eigene Kopie pro Empfänger, wie nach msgpack aus Redis
+            self.receive_buffer[channel].put_nowait(dict(message))
+        _LOCAL.inc(len(members))
+        if await self._has_remote(group):
+            await super().group_send(group, message)
+
+    def _map_channel_keys_to_connection(self, channel_names, message):
+        # nur von group_send benutzt: lokale Mitglieder haben ihre Nachricht schon
+        remote = [c for c in channel_names if not self._is_local(c)]
+        _REMOTE.inc(len(remote))
+        return super()._map_channel_keys_to_connection(remote, message)
+
+    async def flush(self):
+        self.local_groups.clear()
+        self._remote.clear()
+        await super().flush()
+
+    async def close_pools(self):
+        self._stop_listeners()
+        await super().close_pools()
@@ -0,0 +1,66 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ultictactoe_app import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Mikro-Benchmarks für Spielregeln, Code-Vergabe und Consumer-Roundtrips "
+        "(ultictactoe_app.benchmarks). Mit --save als JSON-Baseline speichern, "
+        "mit --compare gegen eine Baseline prüfen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("cases", nargs="*", help="nur Fälle, deren Name das enthält (z. B. roundtrip)")
+        parser.add_argument("--scale", type=int, default=1, help="Wiederholungen vervielfachen")
+        parser.add_argument("--save", metavar="PFAD", help="Ergebnis als JSON-Baseline speichern")
+        parser.add_argument("--compare", metavar="PFAD", help="gegen diese Baseline vergleichen")
+        parser.add_argument("--repeat", type=int, default=3, help="jeden Fall so oft messen (weniger Rauschen)")
+        parser.add_argument("--threshold", type=float, default=0.15,
+                            help="erlaubte Verlangsamung (Minimum) gegenüber der Baseline, 0.15 = 15%%, "
+                                 "dazu kommt das gemessene Rauschen des Falls (höchstens noch einmal so viel)")
+        parser.add_argument("--list", action="store_true", help="nur die Fälle auflisten")
+
+    def handle(self, *args, **opts):
+        if opts["list"]:
+            for name in benchmarks.CASES:
+                self.stdout.write(name)
+            return
+
+        baseline = None
+        if opts["compare"]:
+            try:
+                with open(opts["compare"]) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Baseline nicht lesbar: {e}")
+
+        self.stdout.write(f"{'Fall':<30}{'Median µs':>12}{'Min µs':>10}{'p95 µs':>10}{'Rauschen':>10}")
+
+        def progress(name, r):
+            per = f"  (für {r['per']} Aufrufe)" if "per" in r else ""
+            self.stdout.write(f"{name:<30}{r['median_us']:>12.2f}{r['min_us']:>10.2f}{r['p95_us']:>10.2f}"
+                              f"{r['noise']:>10.1%}{per}")
+
+        result = benchmarks.run(opts["cases"], max(1, opts["scale"]), progress, repeat=opts["repeat"])
+
+        if opts["save"]:
+            with open(opts["save"], "w") as f:
+                json.dump(result, f, indent=2)
+            self.stdout.write(f"Baseline gespeichert: {opts['save']}")
+
+        if baseline is None:
+            return
+        rows = benchmarks.compare(result, baseline, opts["threshold"])
+        self.stdout.write(f"\nVergleich mit {opts['compare']} (Minimum, Schwelle {opts['threshold']:.0%} + Rauschen):")
+        for name, b, c, change, limit, regressed in rows:
+            mark = "REGRESSION" if regressed else ""
+            noise = max(baseline["results"][name].get("noise", 0.0), result["results"][name].get("noise", 0.0))
+            if noise > opts["threshold"]:
+                mark += " (verrauscht – mit höherem --repeat wiederholen)"
+            self.stdout.write(f"{name:<30}{b:>10.2f} -> {c:>10.2f}  {change:+7.1%}  (max {limit:+.0%})  {mark}")
+        bad = [r[0] for r in rows if r[5]]
+        if bad:
+            raise CommandError(f"{len(bad)} Fall/Fälle langsamer als erlaubt: {', '.join(bad)}")
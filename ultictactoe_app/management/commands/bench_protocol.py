@@ -0,0 +1,66 @@
+import json
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from ultictactoe_app import protocol
+from ultictactoe_app.consumers import game_snapshot
+from ultictactoe_app.engine import GameState
+
+
+def _sample_game(moves, seed=1):
+    """Zufällige, aber reproduzierbare Partie mit `moves` Zügen (oder bis Spielende)."""
+    rng = random.Random(seed)
+    game = GameState()
+    delta = None
+    for _ in range(moves):
+        if game.winner:
+            break
+        legal = [(b, s) for b in range(9) for s in range(9)
+                 if game.forced in (-1, b) and not game.is_finished(b) and not game.is_occupied(b, s)]
+        delta = game.apply_move(*rng.choice(legal))
+    return game, delta
+
+
+class Command(BaseCommand):
+    help = "Vergleicht JSON- und Binärformat (protocol.py): Zeit pro Encode/Decode und Bytes pro Frame."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=20000, help="Wiederholungen pro Messung")
+        parser.add_argument("--moves", type=int, default=40, help="Züge der Beispielpartie")
+
+    def handle(self, *args, **opts):
+        number = opts["number"]
+        game, d = _sample_game(opts["moves"])
+
+        # so wie es durch den Channel-Layer kommt / an den Client geht
+        move_event = {
+            "type": "game.move", "v": d.version, "big": d.big, "small": d.small,
+            "symbol": d.symbol, "currentPlayer": d.current,
+            "finished": {"big": d.finished[0], "winner": d.finished[1]} if d.finished else None,
+            "big_field_to_click": d.next_big if d.next_big >= 0 else "",
+        }
+        move_json = {"event": "move", **{k: v for k, v in move_event.items() if k != "type"}}
+        request_json = json.dumps({"action": "game_move", "big": d.big, "small": d.small})
+        request_bin = bytes([protocol.OP_C_MOVE, d.big, d.small])
+        state_json = {"event": "state", **game_snapshot(game)}
+
+        cases = [
+            ("move  (server->client)",
+             lambda: json.dumps(move_json), lambda: protocol.encode_move(move_event),
+             len(json.dumps(move_json)), len(protocol.encode_move(move_event))),
+            ("move  (client->server)",
+             lambda: json.loads(request_json), lambda: protocol.decode_client(request_bin),
+             len(request_json), len(request_bin)),
+            ("state (full board)",
+             lambda: json.dumps(state_json), lambda: protocol.encode_state(game),
+             len(json.dumps(state_json)), len(protocol.encode_state(game))),
+        ]
+
+        self.stdout.write(f"Beispielpartie: {len(game.moves)} Züge, {number} Wiederholungen\n")
+        self.stdout.write(f"{'Frame':<24}{'JSON µs':>10}{'Bin µs':>10}{'JSON B':>9}{'Bin B':>8}")
+        for name, fj, fb, bj, bb in cases:
+            tj = timeit.timeit(fj, number=number) / number * 1e6
+            tb = timeit.timeit(fb, number=number) / number * 1e6
+            self.stdout.write(f"{name:<24}{tj:>10.2f}{tb:>10.2f}{bj:>9}{bb:>8}")
@@ -0,0 +1,165 @@
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from ultictactoe_app.cluster import FrontRouter, write_ring
+
+
+class Command(BaseCommand):
+    help = (
+        "Startet N Daphne-Worker und davor einen Router, der jeden Raum immer zum selben "
+        "Worker schickt (ultictactoe_app.cluster). SIGUSR1 = Worker dazu, SIGUSR2 = letzten "
+        "Worker auslaufen lassen."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--bind", default="127.0.0.1", help="Adresse des Routers")
+        parser.add_argument("--port", type=int, default=8000, help="Port des Routers")
+        parser.add_argument("--base-port", type=int, default=8100, help="Worker i hört auf base-port + i")
+        parser.add_argument("--pin-ttl", type=float, default=120.0,
+                            help="s, so lange bleibt ein Raum nach der letzten Verbindung beim alten Worker")
+        parser.add_argument("--drain", type=float, default=900.0,
+                            help="s, so lange darf ein Worker beim Herunterfahren noch Räume zu Ende spielen")
+
+    def handle(self, *args, **opts):
+        asyncio.run(Supervisor(self, opts).run())
+
+
+class Supervisor:
+    def __init__(self, cmd, opts):
+        self.cmd = cmd
+        self.opts = opts
+        self.router = FrontRouter(pin_ttl=opts["pin_ttl"])
+        self.ring_file = os.path.join(tempfile.gettempdir(), f"ultictactoe-ring-{os.getpid()}.json")
+        self.procs = {}          # worker -> Process
+        self.draining = set()
+        self._next = 0
+        self._stop = None
+
+    def log(self, msg):
+        self.cmd.stdout.write(msg)
+
+    def _publish(self, nodes=None):
+        write_ring(self.ring_file, self.router.ring.nodes if nodes is None else nodes)
+
+    async def run(self):
+        self._stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self._stop.set)
+        loop.add_signal_handler(signal.SIGUSR1, lambda: loop.create_task(self.add_worker()))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: loop.create_task(self.retire_worker()))
+
+        self._publish()
+        await asyncio.gather(*(self.add_worker() for _ in range(self.opts["workers"])))
+        server = await self.router.serve(self.opts["bind"], self.opts["port"])
+        self.log(f"Router auf {self.opts['bind']}:{self.opts['port']}, Worker: {sorted(self.procs)}")
+
+        sweeper = loop.create_task(self._sweep())
+        await self._stop.wait()
+        sweeper.cancel()
+        server.close()
+        for proc in self.procs.values():
+            if proc.returncode is None:
+                proc.terminate()
+        await asyncio.gather(*(p.wait() for p in self.procs.values()))
+        try:
+            os.remove(self.ring_file)
+        except OSError:
+            pass
+
+    async def _spawn(self, worker, port):
+        env = dict(os.environ, ULTICTACTOE_WORKER=worker, ULTICTACTOE_RING_FILE=self.ring_file)
+        return await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "daphne", "-b", "127.0.0.1", "-p", str(port),
+            "ultictactoe.asgi:application", env=env, cwd=str(settings.BASE_DIR),
+        )
+
+    async def add_worker(self):
+        worker, port = f"w{self._next}", self.opts["base_port"] + self._next
+        self._next += 1
+        await self._start(worker, port)
+
+    async def _start(self, worker, port, delay=1.0):
+        proc = self.procs[worker] = await self._spawn(worker, port)
+        if not await _wait_port("127.0.0.1", port, proc):
+            # kein toter Eintrag in procs (retire_worker/Shutdown), später nochmal probieren
+            if proc.returncode is None:
+                proc.terminate()
+            await proc.wait()
+            if self.procs.get(worker) is proc:
+                del self.procs[worker]
+            self.log(f"{worker} startet nicht (Port {port}), neuer Versuch in {delay:g}s")
+            asyncio.get_running_loop().create_task(self._retry(worker, port, delay))
+            return
+        # erst den Ring für die Worker, dann den Router -> ein neuer Worker
+        # kennt seine Räume, bevor die erste Verbindung kommt
+        self._publish(self.router.ring.nodes | {worker})
+        self.router.add(worker, ("127.0.0.1", port))
+        self.log(f"{worker} bereit auf Port {port} ({len(self.router.ring.nodes)} Worker)")
+        asyncio.get_running_loop().create_task(self._watch(worker, port))
+
+    async def _retry(self, worker, port, delay):
+        await asyncio.sleep(delay)
+        if not self._stop.is_set() and worker not in self.procs:
+            await self._start(worker, port, min(delay * 2, 30.0))
+
+    async def _watch(self, worker, port):
+        proc = self.procs[worker]
+        code = await proc.wait()
+        if self._stop.is_set():
+            return
+        self.router.remove(worker)
+        self._publish()
+        if worker in self.draining:
+            self.draining.discard(worker)
+            del self.procs[worker]
+            self.log(f"{worker} beendet")
+            return
+        # abgestürzt: Räume verteilen sich auf die anderen, Neustart übernimmt wieder seinen Teil
+        self.log(f"{worker} abgestürzt (Exit {code}), Neustart")
+        await asyncio.sleep(1.0)
+        if not self._stop.is_set():
+            await self._start(worker, port)
+
+    async def retire_worker(self):
+        live = sorted((w for w in self.procs if w not in self.draining), key=lambda w: int(w[1:]))
+        if len(live) <= 1:
+            return
+        worker = live[-1]
+        self.draining.add(worker)
+        self.router.drain(worker)   # keine neuen Räume mehr
+        self._publish()
+        self.log(f"{worker} läuft aus")
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.opts["drain"]
+        while self.router.connections.get(worker) and loop.time() < deadline:
+            await asyncio.sleep(1.0)
+        proc = self.procs.get(worker)
+        if proc and proc.returncode is None:
+            proc.terminate()
+
+    async def _sweep(self):
+        while True:
+            await asyncio.sleep(self.opts["pin_ttl"])
+            self.router.sweep()
+
+
+async def _wait_port(host, port, proc, timeout=30.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while loop.time() < deadline and proc.returncode is None:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+        except OSError:
+            await asyncio.sleep(0.2)
+            continue
+        writer.close()
+        return True
+    return False
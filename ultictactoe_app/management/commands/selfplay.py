@@ -0,0 +1,72 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Spielt viele Partien ohne WebSocket gegeneinander (NumPy-Batches, Prozess-Pool) "
+        "und schreibt sie kompakt in eine Datei (Format: ultictactoe_app.batch.Batch.encode)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--games", type=int, default=100_000, help="Anzahl Partien insgesamt")
+        parser.add_argument("--batch", type=int, default=4096, help="Partien pro Batch")
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Prozesse")
+        parser.add_argument("--policy", choices=("random", "greedy"), default="random",
+                            help="random = Zufall, greedy = kleines Feld gewinnen, wenn möglich")
+        parser.add_argument("--out", default="selfplay.bin", help="Ausgabedatei ('-' = nicht speichern)")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **opts):
+        try:
+            from ultictactoe_app.batch import play_batch
+        except ImportError:
+            raise CommandError("selfplay braucht numpy (pip install numpy, siehe requirements.txt).")
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        total, size = opts["games"], max(1, opts["batch"])
+        jobs = [(min(size, total - i), opts["policy"], opts["seed"] + n)
+                for n, i in enumerate(range(0, total, size))]
+
+        counts, moves, openings, done = [0, 0, 0], 0, [0] * 81, 0
+        out = None if opts["out"] == "-" else open(opts["out"], "wb")
+        start = time.perf_counter()
+        interrupted = False
+        pool = ProcessPoolExecutor(max_workers=max(1, opts["workers"]))
+        try:
+            futures = [pool.submit(play_batch, *job) for job in jobs]
+            # Ergebnisse wegschreiben, sobald ein Batch fertig ist (nicht alles im Speicher sammeln)
+            for fut in as_completed(futures):
+                data, c, m, op = fut.result()
+                if out:
+                    out.write(data)
+                counts = [a + b for a, b in zip(counts, c)]
+                openings = [a + b for a, b in zip(openings, op)]
+                moves += m
+                done += sum(c)
+        except KeyboardInterrupt:
+            # Strg+C: fertige Batches behalten, Rest verwerfen
+            interrupted = True
+        finally:
+            pool.shutdown(wait=not interrupted, cancel_futures=True)
+            if out:
+                out.close()
+        elapsed = time.perf_counter() - start
+
+        if interrupted:
+            self.stderr.write("abgebrochen, Zusammenfassung nur für die fertigen Batches")
+        if not done:
+            self.stdout.write("keine Partien gespielt")
+            return
+
+        self.stdout.write(f"{done} Partien in {elapsed:.2f}s -> {done / max(elapsed, 1e-9):,.0f} Partien/s "
+                          f"({moves / max(elapsed, 1e-9):,.0f} Züge/s)")
+        self.stdout.write(f"X {counts[0] / done:.1%}  O {counts[1] / done:.1%}  "
+                          f"Unentschieden {counts[2] / done:.1%}  Ø {moves / done:.1f} Züge")
+        top = sorted(range(81), key=lambda c: openings[c], reverse=True)[:5]
+        self.stdout.write("Häufigste Eröffnungen (big, small): " + ", ".join(
+            f"({c // 9}, {c % 9}) {openings[c] / done:.1%}" for c in top))
+        if out:
+            self.stdout.write(f"geschrieben: {opts['out']}")
@@ -0,0 +1,164 @@
+# ultictactoe_app/matchmaking.py
+"""
+Schnelles Spiel: Warteschlange, die ähnlich starke Spieler zusammenbringt.
+
+Index: Wertung in Buckets (z. B. 50 Punkte breit), pro Bucket die
+Wartenden in Ankunftsreihenfolge (dict = FIFO), dazu die sortierte Liste
+der nicht-leeren Buckets. Einen Gegner suchen heißt: die Buckets im
+Suchfenster ansehen und jeweils nur den am längsten Wartenden nehmen –
+Aufwand ~ Fensterbreite / Bucketbreite, unabhängig davon, wie viele
+Spieler warten.
+
+Das Suchfenster wächst mit der Wartezeit (window + widen * Sekunden,
+höchstens max_window). Ein Tick-Task probiert regelmäßig pro Bucket den
+ältesten Wartenden (der hat das breiteste Fenster) – ebenfalls nicht
+pro Spieler.
+
+Die Warteschlange lebt im Prozess: Spieler auf verschiedenen Workern
+finden sich nicht.
+"""
+import asyncio
+import bisect
+import logging
+import time
+
+from .metrics import Histogram, log_event
+
+DEFAULT_RATING = 1500
+
+
+class Ticket:
+    __slots__ = ("player", "nickname", "rating", "joined", "bucket")
+
+    def __init__(self, player, nickname, rating, joined):
+        self.player = player          # Consumer (oder irgendwas, das on_match versteht)
+        self.nickname = nickname
+        self.rating = rating
+        self.joined = joined
+        self.bucket = None
+
+
+class Matchmaker:
+    def __init__(self, on_match, bucket=50, window=100, widen=25.0, max_window=800,
+                 tick=0.5, clock=time.monotonic):
+        self.on_match = on_match      # async (ticket_a, ticket_b, waited_a, waited_b)
+        self.bucket_width = bucket
+        self.window = window          # Startfenster (± Wertungspunkte)
+        self.widen = widen            # + Punkte pro Sekunde Wartezeit
+        self.max_window = max_window
+        self.tick = tick
+        self._clock = clock
+        self._buckets = {}            # bucket -> {ticket: None} (FIFO)
+        self._order = []              # sortierte nicht-leere Buckets
+        self._task = None
+        self.waiting = 0
+        self.matches = 0
+
+    def __len__(self):
+        return self.waiting
+
+    def _window(self, ticket, now):
+        return min(self.max_window, self.window + self.widen * (now - ticket.joined))
+
+    # --- Index ------------------------------------------------------------------------
+
+    def _add(self, ticket):
+        b = ticket.bucket = int(ticket.rating // self.bucket_width)
+        queue = self._buckets.get(b)
+        if queue is None:
+            queue = self._buckets[b] = {}
+            bisect.insort(self._order, b)
+        queue[ticket] = None
+        self.waiting += 1
+
+    def _remove(self, ticket):
+        queue = self._buckets.get(ticket.bucket)
+        if queue is None or ticket not in queue:
+            return False
+        del queue[ticket]
+        self.waiting -= 1
+        if not queue:
+            del self._buckets[ticket.bucket]
+            del self._order[bisect.bisect_left(self._order, ticket.bucket)]
+        return True
+
+    def _find(self, ticket, now):
+        """Gegner im Fenster von ticket mit der nächsten Wertung (je Bucket nur der Älteste)."""
+        w = self._window(ticket, now)
+        lo = bisect.bisect_left(self._order, int((ticket.rating - w) // self.bucket_width))
+        hi = bisect.bisect_right(self._order, int((ticket.rating + w) // self.bucket_width))
+        best, best_dist = None, None
+        for b in self._order[lo:hi]:
+            # nur der Älteste im Bucket zählt (ticket selbst übersprungen)
+            for other in self._buckets[b]:
+                if other is not ticket:
+                    break
+            else:
+                continue
+            dist = abs(other.rating - ticket.rating)
+            if dist <= w and (best is None or dist < best_dist):
+                best, best_dist = other, dist
+        return best
+
+    # --- API --------------------------------------------------------------------------
+
+    async def join(self, player, nickname, rating=DEFAULT_RATING):
+        """
+        In die Warteschlange; passt schon jemand, wird sofort gepaart.
+        Rückgabe: Ticket (wartet) oder None (sofort gepaart, nichts mehr zu verlassen).
+        """
+        now = self._clock()
+        ticket = Ticket(player, nickname, rating, now)
+        other = self._find(ticket, now)
+        if other is not None:
+            self._remove(other)
+            await self._pair(other, ticket, now)
+            return None
+        self._add(ticket)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return ticket
+
+    def leave(self, ticket):
+        return self._remove(ticket)
+
+    async def _pair(self, a, b, now):
+        self.matches += 1
+        waited_a, waited_b = now - a.joined, now - b.joined
+        TIME_TO_MATCH.observe(waited_a)
+        TIME_TO_MATCH.observe(waited_b)
+        try:
+            await self.on_match(a, b, waited_a, waited_b)
+        except Exception as e:
+            log_event("match_failed", logging.ERROR, a=a.nickname, b=b.nickname, error=repr(e))
+
+    async def _run(self):
+        while self._buckets:
+            await asyncio.sleep(self.tick)
+            now = self._clock()
+            # pro Bucket nur der Älteste – der hat das breiteste Fenster
+            for b in list(self._order):
+                queue = self._buckets.get(b)
+                if not queue:
+                    continue
+                oldest = next(iter(queue))
+                other = self._find(oldest, now)
+                if other is not None:
+                    self._remove(oldest)
+                    self._remove(other)
+                    await self._pair(oldest, other, now)
+
+    def stats(self):
+        child = TIME_TO_MATCH.labels()
+        return {
+            "waiting": self.waiting,
+            "buckets": len(self._order),
+            "matches": self.matches,
+            "p50_s": child.quantile(0.5),
+            "p90_s": child.quantile(0.9),
+            "p99_s": child.quantile(0.99),
+        }
+
+
+TIME_TO_MATCH = Histogram("ultictactoe_time_to_match_seconds", "Wartezeit bis zum Gegner (schnelles Spiel)",
+                          buckets=(0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300))
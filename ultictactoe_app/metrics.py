@@ -0,0 +1,204 @@
+# ultictactoe_app/metrics.py
+"""
+Kleine Instrumentierung ohne Zusatzpakete.
+
+Metriken (Prometheus-Textformat unter /metrics, siehe views.Metrics):
+  Counter    -> zählt nur hoch
+  Gauge      -> aktueller Wert (set/inc/dec) oder per Callback berechnet
+  Histogram  -> feste Buckets, daraus lassen sich p50/p99 ablesen
+
+    ACTIONS = Counter("ultictactoe_actions_total", "…", labels=("action",))
+    ACTIONS.labels("game_move").inc()
+
+Alles läuft im Event-Loop-Thread, also ohne Locks. Jeder Prozess hat
+seine eigenen Werte (bei mehreren Workern je Worker abfragen).
+
+Logging: log_event() statt print() – prüft zuerst das Level (billig),
+dann die Stichprobe, und formatiert erst, wenn wirklich geschrieben wird.
+"""
+import bisect
+import logging
+import random
+
+logger = logging.getLogger("ultictactoe_app")
+
+REGISTRY = []
+
+# Sekunden; von 0,1 ms bis 2,5 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class _Value:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def dec(self, n=1):
+        self.value -= n
+
+    def set(self, v):
+        self.value = v
+
+
+class _Buckets:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # letzter = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v):
+        self.counts[bisect.bisect_left(self.bounds, v)] += 1
+        self.sum += v
+        self.count += 1
+
+    def quantile(self, q):
+        """Obergrenze des Buckets, in den das q-Quantil fällt (grob, für stats())."""
+        if not self.count:
+            return 0.0
+        target, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return self.bounds[i] if i < len(self.bounds) else float("inf")
+        return float("inf")
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help, labels=(), fn=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.fn = fn                 # Callback statt gespeicherter Werte
+        self._children = {}
+        REGISTRY.append(self)
+
+    def _new(self):
+        return _Value()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new()
+        return child
+
+    # ohne Labels direkt benutzbar
+    def inc(self, n=1):
+        self.labels().inc(n)
+
+    def _label_str(self, values, extra=()):
+        pairs = list(zip(self.label_names, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def samples(self):
+        if self.fn is not None:
+            yield self.name, "", self.fn()
+            return
+        for values, child in self._children.items():
+            yield self.name, self._label_str(values), child.value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{labels} {_num(v)}" for name, labels, v in self.samples()]
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, v):
+        self.labels().set(v)
+
+    def dec(self, n=1):
+        self.labels().dec(n)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help, labels)
+
+    def _new(self):
+        return _Buckets(self.buckets)
+
+    def observe(self, v):
+        self.labels().observe(v)
+
+    def samples(self):
+        for values, b in self._children.items():
+            cum = 0
+            for bound, c in zip(self.buckets + (float("inf"),), b.counts):
+                cum += c
+                le = "+Inf" if bound == float("inf") else _num(bound)
+                yield f"{self.name}_bucket", self._label_str(values, (("le", le),)), cum
+            yield f"{self.name}_sum", self._label_str(values), b.sum
+            yield f"{self.name}_count", self._label_str(values), b.count
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _num(v):
+    if isinstance(v, float):
+        if v != v:
+            return "NaN"
+        if v in (float("inf"), float("-inf")):
+            return "+Inf" if v > 0 else "-Inf"
+        return repr(v)
+    return str(v)
+
+
+def render() -> str:
+    """Alle Metriken im Prometheus-Textformat."""
+    out = []
+    for m in REGISTRY:
+        try:
+            out.append(m.render())
+        except Exception:
+            logger.exception("metric %s failed", m.name)
+    return "\n".join(out) + "\n"
+
+
+# --- Logging ----------------------------------------------------------------------
+
+class _Fields:
+    """Wird erst beim tatsächlichen Schreiben zu Text."""
+
+    __slots__ = ("event", "fields")
+
+    def __init__(self, event, fields):
+        self.event = event
+        self.fields = fields
+
+    def __str__(self):
+        return " ".join([f"event={self.event}"] + [f"{k}={v!r}" for k, v in self.fields.items()])
+
+
+def log_event(event: str, level=logging.DEBUG, sample: float = 1.0, **fields):
+    """
+    Strukturiertes Log: event=… key=… ; `sample` < 1 schreibt nur jeden n-ten
+    Aufruf (zufällig), gedacht für Debug-Ausgaben im Zug-Pfad.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    if sample < 1.0 and random.random() >= sample:
+        return
+    logger.log(level, "%s", _Fields(event, fields), extra={"event": event, "fields": fields})
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Game',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('room', models.CharField(db_index=True, max_length=90)),
+                ('x_name', models.CharField(blank=True, max_length=50)),
+                ('o_name', models.CharField(blank=True, max_length=50)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('winner', models.CharField(blank=True, choices=[('X', 'X'), ('O', 'O'), ('D', 'Unentschieden')], max_length=1)),
+                ('moves', models.PositiveSmallIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Move',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ply', models.PositiveSmallIntegerField()),
+                ('big', models.PositiveSmallIntegerField()),
+                ('small', models.PositiveSmallIntegerField()),
+                ('symbol', models.CharField(max_length=1)),
+                ('played_at', models.DateTimeField()),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='move_set', to='ultictactoe_app.game')),
+            ],
+            options={
+                'ordering': ['game', 'ply'],
+                'constraints': [models.UniqueConstraint(fields=('game', 'ply'), name='unique_move_ply')],
+            },
+        ),
+    ]
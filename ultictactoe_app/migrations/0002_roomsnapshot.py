@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-18 15:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultictactoe_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomSnapshot',
+            fields=[
+                ('code', models.CharField(max_length=90, primary_key=True, serialize=False)),
+                ('phase', models.CharField(max_length=10)),
+                ('symbol_by_name', models.JSONField(default=dict)),
+                ('bot', models.CharField(blank=True, max_length=1)),
+                ('base', models.PositiveIntegerField()),
+                ('moves', models.BinaryField()),
+                ('plies', models.PositiveSmallIntegerField()),
+                ('saved_at', models.DateTimeField()),
+                ('game', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='snapshots', to='ultictactoe_app.game')),
+            ],
+        ),
+    ]
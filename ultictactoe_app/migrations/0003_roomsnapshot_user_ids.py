@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 16:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ultictactoe_app', '0002_roomsnapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomsnapshot',
+            name='user_ids',
+            field=models.JSONField(default=dict),
+        ),
+    ]
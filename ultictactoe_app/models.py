@@ -1,3 +1,70 @@
 from django.db import models
 
-# Create your models here.
+# Geschrieben wird nur über den Write-Behind-Puffer in history.py –
+# nie direkt aus dem Zug-Pfad der Consumer.
+
+
+class Game(models.Model):
+    """Eine Partie in einem Raum (jeder Start/Reset ist eine neue Partie)."""
+
+    RESULTS = [("X", "X"), ("O", "O"), ("D", "Unentschieden")]
+
+    # die ID vergibt der Server schon beim Start (Room.game_id), damit Züge
+    # sofort darauf zeigen können, ohne auf das INSERT zu warten
+    id = models.UUIDField(primary_key=True, editable=False)
+    room = models.CharField(max_length=90, db_index=True)
+    x_name = models.CharField(max_length=50, blank=True)
+    o_name = models.CharField(max_length=50, blank=True)
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    winner = models.CharField(max_length=1, choices=RESULTS, blank=True)
+    moves = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-started_at"]
+
+    def __str__(self):
+        return f"{self.room} {self.x_name} vs {self.o_name} ({self.winner or '…'})"
+
+
+class Move(models.Model):
+    """Ein Zug; ply zählt ab 1 innerhalb der Partie."""
+
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name="move_set")
+    ply = models.PositiveSmallIntegerField()
+    big = models.PositiveSmallIntegerField()
+    small = models.PositiveSmallIntegerField()
+    symbol = models.CharField(max_length=1)
+    played_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["game", "ply"]
+        constraints = [
+            models.UniqueConstraint(fields=["game", "ply"], name="unique_move_ply"),
+        ]
+
+    def __str__(self):
+        return f"{self.game_id} #{self.ply} {self.symbol} ({self.big}, {self.small})"
+
+
+class RoomSnapshot(models.Model):
+    """
+    Kompakter Stand eines laufenden Raums (recovery.py). Gibt es nur für
+    Räume mit laufender Partie – nach Spielende / Raum weg wird er gelöscht.
+    Was nach dem Snapshot noch gezogen wurde, steht in Move (ply > plies).
+    """
+
+    code = models.CharField(max_length=90, primary_key=True)
+    # Game-Zeile kann im selben Batch erst nach dem Snapshot kommen -> ohne DB-Constraint
+    game = models.ForeignKey(Game, on_delete=models.DO_NOTHING, db_constraint=False, related_name="snapshots")
+    phase = models.CharField(max_length=10)
+    symbol_by_name = models.JSONField(default=dict)
+    bot = models.CharField(max_length=1, blank=True)      # Symbol des Bots oder ""
+    user_ids = models.JSONField(default=dict)             # wie Room.user_ids, fürs Elo nach Spielende
+    base = models.PositiveIntegerField()
+    moves = models.BinaryField()                          # 1 Byte pro Zug wie GameState.moves
+    plies = models.PositiveSmallIntegerField()
+    saved_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.code} ({self.plies} Züge)"
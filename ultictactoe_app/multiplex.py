@@ -0,0 +1,116 @@
+# ultictactoe_app/multiplex.py
+"""
+Spiel, Chat und Anwesenheit über *einen* WebSocket pro Spieler (/ws/play/<raum>/).
+
+Frames sind mit dem Stream markiert:
+  Client -> Server  {"stream": "game",     "payload": {"action": "game_move", ...}}
+                    {"stream": "chat",     "payload": {"message": "gg"}}
+                    {"stream": "presence", "payload": {"typing": true}}
+  Server -> Client  {"stream": "game" | "chat" | "presence", "payload": {...}}
+Binär-Frames (protocol.py) sind immer Stream "game" und laufen unverändert durch.
+
+Alles hängt an der einen Gruppe game_<raum>: Chat-Batches und Tippen
+gehen an dieselbe Gruppe wie die Züge – eine Gruppenmitgliedschaft und
+ein Socket pro Spieler statt zwei. Die Spiel-Logik ist GameLobbyConsumer,
+die Chat-Logik chat_app.consumers.ChatStream; hier wird nur verteilt.
+
+Chat gibt es nur für Spieler im Raum (nach create_or_join), Zuschauer
+sind nicht in der Gruppe.
+"""
+import json
+
+from chat_app.consumers import MAX_FRAME, ChatStream
+
+from .consumers import GameLobbyConsumer, frame
+
+_GAME = '{"stream":"game","payload":'
+_PRESENCE = '{"stream":"presence","payload":'
+
+
+class PlayConsumer(GameLobbyConsumer):
+    async def connect(self):
+        self.nickname = None
+        self.chat = None
+        await super().connect()
+        if not self.spectator:
+            self.chat = ChatStream(self.channel_layer, self.group, self._send_chat)
+            await self.chat.open()
+
+    async def disconnect(self, code):
+        if self.chat:
+            self.chat.close()
+        await super().disconnect(code)
+
+    # --- raus ------------------------------------------------------------------------
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        # alles, was GameLobbyConsumer schickt, ist Stream "game"; der fertige
+        # JSON-Text wird nur eingerahmt, nicht neu serialisiert
+        if text_data is not None:
+            text_data = _GAME + text_data + "}"
+        await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+
+    async def _send_raw(self, text):
+        await super().send(text_data=text)
+
+    async def _send_chat(self, obj):
+        await self._send_raw(json.dumps({"stream": "chat", "payload": obj}))
+
+    async def players_update(self, event):
+        self._check_epoch(event)
+        await self._send_raw(_PRESENCE + event["text"] + "}")
+
+    async def chat_batch(self, event):
+        if self.chat:
+            await self.chat.deliver(event)
+
+    async def presence_typing(self, event):
+        if event.get("sender") != self.channel_name:
+            await self._send_raw(_PRESENCE + event["text"] + "}")
+
+    async def _send_joined(self, room):
+        self.nickname = room.players.get(self.channel_name)
+        await super()._send_joined(room)
+
+    # --- rein ------------------------------------------------------------------------
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            await super().receive(bytes_data=bytes_data)
+            return
+        if text_data is None or len(text_data) > MAX_FRAME:
+            await self.send(text_data=json.dumps({"event": "error", "message": "Frame zu groß."}))
+            return
+        try:
+            data = json.loads(text_data)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(data, dict):
+            return
+        stream, payload = data.get("stream"), data.get("payload")
+        if not isinstance(payload, dict):
+            payload = {}
+
+        if stream == "game":
+            await self.handle_action(payload.get("action"), payload)
+        elif stream == "chat":
+            await self._chat(payload)
+        elif stream == "presence":
+            await self._presence(payload)
+
+    async def _chat(self, payload):
+        if not self.chat or not self.nickname:
+            await self._send_chat({"error": "Erst dem Raum beitreten."})
+            return
+        if isinstance(payload.get("message"), str):
+            payload = {"message": f"{self.nickname}: {payload['message']}"}
+        await self.chat.receive(payload)
+
+    async def _presence(self, payload):
+        # "tippt gerade" – gleiches Token-Budget wie der Chat, Überschuss wird still verworfen
+        if not self.chat or not self.nickname or self.chat.allow():
+            return
+        event = frame("presence.typing", {"event": "typing", "name": self.nickname,
+                                          "typing": bool(payload.get("typing"))})
+        event["sender"] = self.channel_name
+        await self.channel_layer.group_send(self.group, event)
@@ -0,0 +1,119 @@
+# ultictactoe_app/protocol.py
+"""
+Binäres Wire-Format für ws/game/<room>/ (Alternative zu JSON).
+
+Aushandeln per Subprotokoll "ultictactoe.bin" oder ?proto=bin in der URL.
+Züge, Spielstand, Spielende und Reset gehen dann als bytes_data-Frames
+mit festem Aufbau raus; seltene Lobby-Events (joined, player_list, start,
+error) bleiben JSON-Textframes. Alle Zahlen Big-Endian.
+
+Die Maske der erlaubten Züge ("legal" im JSON) steht nicht im Binärformat:
+Binär-Clients haben das komplette Brett und können sie aus Brett + next
+selbst bilden (leere Zellen in offenen Großfeldern, ggf. nur in next).
+
+Server -> Client
+  0x01 STATE      !B I B B B + 21 Byte Brett + 3 Byte großes Brett
+                  op, v, current (0=X, 1=O), forced (0..8, 0xFF = frei),
+                  winner (0 = läuft, 1 = X, 2 = O, 3 = D)
+                  Brett: 81 Zellen à 2 Bit (0 leer, 1 X, 2 O), Zelle big*9+small,
+                  little-endian gepackt; großes Brett: 9 Zellen à 2 Bit (3 = D)
+  0x02 MOVE       !B I B B B B
+                  op, v, cell (big*9+small), flags (Bit0: Symbol O, Bit1: jetzt dran O),
+                  next (0..8, 0xFF = frei), finished (0xFF oder big | winner << 4)
+  0x03 GAME_OVER  !B B B      op, winner (1/2/3), line (Index in LINES, 0xFF = keine)
+  0x04 RESET      !B I B      op, v, current
+
+Client -> Server
+  0x10 MOVE       !B B B      op, big, small
+  0x11 SYNC       !B I        op, since
+  0x12 GET_STATE  !B
+  0x13 RESET      !B
+"""
+import struct
+
+from .engine import LINES
+
+SUBPROTOCOL = "ultictactoe.bin"
+
+OP_STATE = 0x01
+OP_MOVE = 0x02
+OP_GAME_OVER = 0x03
+OP_RESET = 0x04
+
+OP_C_MOVE = 0x10
+OP_C_SYNC = 0x11
+OP_C_GET_STATE = 0x12
+OP_C_RESET = 0x13
+
+FREE = 0xFF
+
+_STATE = struct.Struct("!BIBBB")
+_MOVE = struct.Struct("!BIBBBB")
+_GAME_OVER = struct.Struct("!BBB")
+_RESET = struct.Struct("!BIB")
+
+_SYMBOL = {"X": 1, "O": 2, "D": 3}
+
+# SPREAD[m]: Bit i der 9-Bit-Maske -> Bit 2*i (für 2-Bit-Zellen)
+SPREAD = tuple(sum(((m >> i) & 1) << (2 * i) for i in range(9)) for m in range(512))
+
+
+def encode_state(game) -> bytes:
+    packed = 0
+    for big in range(8, -1, -1):
+        packed = (packed << 18) | SPREAD[game.x[big]] | (SPREAD[game.o[big]] << 1)
+    meta = SPREAD[game.meta_x] | (SPREAD[game.meta_o] << 1) | (SPREAD[game.meta_d] * 3)
+    return (
+        _STATE.pack(
+            OP_STATE, game.version,
+            0 if game.current == "X" else 1,
+            game.forced if game.forced >= 0 else FREE,
+            _SYMBOL.get(game.winner, 0),
+        )
+        + packed.to_bytes(21, "little")
+        + meta.to_bytes(3, "little")
+    )
+
+
+def encode_move(event: dict) -> bytes:
+    """event: der game.move-Dict aus dem Channel-Layer."""
+    fin = event.get("finished")
+    nxt = event.get("big_field_to_click")
+    return _MOVE.pack(
+        OP_MOVE, event["v"],
+        event["big"] * 9 + event["small"],
+        (event["symbol"] == "O") | ((event["currentPlayer"] == "O") << 1),
+        FREE if nxt in ("", None) else nxt,
+        FREE if not fin else fin["big"] | (_SYMBOL[fin["winner"]] << 4),
+    )
+
+
+def encode_game_over(event: dict) -> bytes:
+    line = event.get("line")
+    return _GAME_OVER.pack(
+        OP_GAME_OVER, _SYMBOL[event["winner"]],
+        LINES.index(tuple(line)) if line else FREE,
+    )
+
+
+def encode_reset(event: dict) -> bytes:
+    return _RESET.pack(OP_RESET, event.get("v") or 0, 0 if event.get("currentPlayer", "X") == "X" else 1)
+
+
+def decode_client(data: bytes):
+    """
+    Client-Frame -> (action, data) wie beim JSON-Pfad, damit derselbe
+    Handler beide Formate bedient. Unbekanntes/kaputtes -> (None, {}).
+    """
+    if not data:
+        return None, {}
+    op = data[0]
+    if op == OP_C_MOVE and len(data) == 3:
+        return "game_move", {"big": data[1], "small": data[2]}
+    if op == OP_C_SYNC and len(data) == 5:
+        return "sync", {"since": struct.unpack_from("!I", data, 1)[0]}
+    if op == OP_C_GET_STATE:
+        return "get_state", {}
+    if op == OP_C_RESET:
+        return "reset", {}
+    return None, {}
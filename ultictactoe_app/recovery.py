@@ -0,0 +1,148 @@
+# ultictactoe_app/recovery.py
+"""
+Laufende Räume über einen Neustart (Deploy, Absturz) retten.
+
+Snapshotter: merkt sich, welche Räume sich geändert haben (O(1) pro Zug),
+und schreibt alle `interval` Sekunden nur für diese einen kompakten
+Snapshot (RoomSnapshot: Phase, Name -> Symbol, Bot, User-IDs, Züge als Bytes) über
+den Write-Behind-Puffer aus history.py. Räume ohne laufende Partie
+verlieren ihren Snapshot – die Tabelle enthält nur Live-Räume.
+
+recover(): beim Start Snapshots + die Züge danach (Move mit ply > plies)
+laden, Spiele nachspielen und in den Store legen. Aufwand ~ Anzahl
+laufender Partien, nicht Länge der Historie. Spieler kommen über den
+normalen Rejoin-Pfad (symbol_by_name) wieder rein.
+
+Was beim Absturz noch im Puffer lag (max. HISTORY_FLUSH_INTERVAL), fehlt.
+"""
+import asyncio
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.db.models import F
+
+from .engine import GameState, IllegalMove
+from .metrics import Gauge, log_event
+from .rooms import Room
+
+LIVE_PHASES = ("starting", "playing")
+
+
+class Snapshotter:
+    def __init__(self, history, load, interval=5.0, bot_id="bot"):
+        self.history = history
+        self.load = load             # async code -> Room | None
+        self.interval = interval
+        self.bot_id = bot_id
+        self._dirty = set()
+        self._saved = set()          # Räume mit Snapshot in der DB
+        self._task = None
+        self.snapshots = 0
+
+    def mark(self, code):
+        """Raum hat sich geändert (Zug, Start, Reset, gelöscht)."""
+        if not self.history.enabled:
+            return
+        self._dirty.add(code)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def recovered(self, code):
+        self._saved.add(code)
+
+    async def _run(self):
+        while self._dirty:
+            await asyncio.sleep(self.interval)
+            await self.save_dirty()
+
+    async def save_dirty(self):
+        codes, self._dirty = self._dirty, set()
+        for code in codes:
+            room = await self.load(code)
+            if room is not None and room.game_id and room.phase in LIVE_PHASES and not room.game.winner:
+                self.history.snapshot(code, room.game_id, room.phase, room.symbol_by_name,
+                                      room.symbols.get(self.bot_id, ""), room.user_ids, room.game.base,
+                                      room.game.moves)
+                self._saved.add(code)
+                self.snapshots += 1
+            elif code in self._saved:
+                self.history.drop_snapshot(code)
+                self._saved.discard(code)
+
+
+@database_sync_to_async
+def _load():
+    from .models import Move, RoomSnapshot
+
+    snaps = list(RoomSnapshot.objects.all())
+    # nur der Schwanz nach dem jeweiligen Snapshot (Index auf game, ply)
+    tails = {}
+    rows = (Move.objects.filter(ply__gt=F("game__snapshots__plies"))
+            .order_by("game_id", "ply").values_list("game_id", "ply", "big", "small"))
+    for gid, ply, big, small in rows:
+        tails.setdefault(gid, []).append((ply, big, small))
+    return snaps, tails
+
+
+def _rebuild(snap, tail, bot_id):
+    """RoomSnapshot + Züge danach -> Room (ohne Spieler-Channels, die sind weg)."""
+    room = Room(snap.code)
+    room.phase = snap.phase
+    room.symbol_by_name = dict(snap.symbol_by_name)
+    room.game_id = snap.game_id.hex
+    room.user_ids = dict(snap.user_ids)   # sonst wird die Partie nach dem Neustart nicht gewertet
+    if snap.bot:
+        room.players[bot_id] = "Bot"
+        room.symbols[bot_id] = snap.bot
+
+    g = room.game = GameState(base=snap.base)
+    for cell in bytes(snap.moves):
+        g.apply_move(cell // 9, cell % 9)
+    for ply, big, small in tail:
+        if ply != len(g.moves) + 1:
+            break   # Lücke (Zug wurde unter Last verworfen) -> ab hier nichts mehr sicher
+        g.apply_move(big, small)
+    return room, len(tail)
+
+
+async def recover(store, bot_id="bot", on_room=None, owns=None):
+    """
+    Snapshots in den Store zurückspielen. on_room(room) wird für jeden
+    neu angelegten Raum aufgerufen (Code belegen, Bot setzen, …).
+    owns(code): nur eigene Räume holen (mehrere Worker, cluster.py).
+    Rückgabe: Liste der wiederhergestellten Räume.
+    """
+    started = time.perf_counter()
+    try:
+        snaps, tails = await _load()
+    except Exception as e:
+        log_event("recovery_failed", logging.ERROR, error=repr(e))
+        return []
+
+    rooms, moves = [], 0
+    for snap in snaps:
+        if owns is not None and not owns(snap.code):
+            continue
+        try:
+            room, n = _rebuild(snap, tails.get(snap.game_id, ()), bot_id)
+        except IllegalMove as e:
+            log_event("recovery_skipped", logging.WARNING, room=snap.code, error=e.message)
+            continue
+        moves += n
+        if room.game.winner or not await store.restore(room):
+            continue   # inzwischen vorbei bzw. gibt es schon (z. B. noch in Redis)
+        if on_room:
+            on_room(room)
+        rooms.append(room)
+
+    elapsed = time.perf_counter() - started
+    RECOVERED_ROOMS.set(len(rooms))
+    RECOVERY_SECONDS.set(elapsed)
+    log_event("recovered", logging.INFO, rooms=len(rooms), snapshots=len(snaps),
+              tail_moves=moves, ms=round(elapsed * 1000, 1))
+    return rooms
+
+
+RECOVERED_ROOMS = Gauge("ultictactoe_recovered_rooms", "beim Start wiederhergestellte Räume")
+RECOVERY_SECONDS = Gauge("ultictactoe_recovery_seconds", "Dauer der Wiederherstellung beim Start")
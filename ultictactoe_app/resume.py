@@ -0,0 +1,102 @@
+# ultictactoe_app/resume.py
+"""
+Wiederverbinden ohne Rejoin-Runde.
+
+Beim Join bekommt der Client ein Resume-Token (signiert, enthält Raum,
+Name und Symbol – kein Server-Zustand nötig, gilt in jedem Worker). Jedes
+Gruppen-Event eines Raums bekommt eine laufende Nummer "seq" und landet
+in einem kurzen Ringpuffer pro Raum. Kommt der Client mit Token + letzter
+seq zurück, wird nur sein Channel im Raum getauscht (kein players.update)
+und er bekommt genau die verpassten Frames – schon fertig serialisiert.
+
+Die Nummern gelten pro Prozess ("epoch"). Kommt ein Event aus einem
+anderen Worker an, ist der Puffer für den Raum nicht mehr vollständig
+und Resume fällt auf den Versions-Sync (moves_since) bzw. den kompletten
+Stand zurück. Mit Raum-Affinität (ein Raum = ein Worker) passiert das nicht.
+
+Clients verwerfen Frames mit seq <= zuletzt gesehener – zwischen
+Gruppenbeitritt und Replay kann ein Event doppelt ankommen.
+"""
+import uuid
+from collections import deque
+
+from django.core import signing
+
+SALT = "ultictactoe.resume"
+
+
+def make_token(code: str, nickname: str, symbol: str) -> str:
+    return signing.dumps({"r": code, "n": nickname, "s": symbol}, salt=SALT, compress=True)
+
+
+def read_token(token: str, max_age: float):
+    """Rückgabe: (code, nickname, symbol) oder None (kaputt/abgelaufen)."""
+    try:
+        claims = signing.loads(token or "", salt=SALT, max_age=max_age)
+    except signing.BadSignature:
+        return None
+    try:
+        return claims["r"], claims["n"], claims["s"]
+    except (KeyError, TypeError):
+        return None
+
+
+class EventLog:
+    def __init__(self, size: int = 64):
+        self.size = size
+        self.epoch = uuid.uuid4().hex[:8]
+        self._rooms = {}     # code -> [nächste seq, erste gültige seq, deque((seq, text))]
+        self.replayed = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._rooms)
+
+    def _log(self, code):
+        log = self._rooms.get(code)
+        if log is None:
+            log = self._rooms[code] = [1, 1, deque(maxlen=self.size)]
+        return log
+
+    def stamp(self, code: str, event: dict) -> dict:
+        """seq in den fertigen Frame schreiben und merken. Rückgabe: event (geändert)."""
+        log = self._log(code)
+        seq = log[0]
+        log[0] += 1
+        # '{...}' -> '{"seq":N,...}' ohne neu zu serialisieren
+        text = event["text"]
+        event["text"] = f'{{"seq":{seq},' + text[1:] if text != "{}" else f'{{"seq":{seq}}}'
+        event["epoch"] = self.epoch
+        log[2].append((seq, event["text"]))
+        return event
+
+    def latest(self, code: str) -> int:
+        log = self._rooms.get(code)
+        return log[0] - 1 if log else 0
+
+    def foreign(self, code: str):
+        """Event aus einem anderen Worker gesehen -> bisherige Nummern taugen nicht mehr zum Replay."""
+        log = self._log(code)
+        log[1] = log[0]
+        log[2].clear()
+
+    def since(self, code: str, epoch, seq):
+        """Frames nach seq oder None, wenn nicht (mehr) lückenlos vorhanden."""
+        log = self._rooms.get(code)
+        try:
+            seq = int(seq)
+        except (TypeError, ValueError):
+            seq = -1
+        if log is None or epoch != self.epoch or seq < log[1] - 1 or seq > log[0] - 1:
+            self.misses += 1
+            return None
+        entries = log[2]
+        if seq < log[0] - 1 and (not entries or entries[0][0] > seq + 1):
+            self.misses += 1
+            return None   # schon aus dem Ringpuffer gefallen
+        missed = [text for s, text in entries if s > seq]
+        self.replayed += len(missed)
+        return missed
+
+    def drop(self, code: str):
+        self._rooms.pop(code, None)
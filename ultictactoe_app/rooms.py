@@ -0,0 +1,60 @@
+# ultictactoe_app/rooms.py
+"""
+Raum-Zustand als feste Objekte statt freier Dicts.
+
+Bei zehntausenden Räumen spart __slots__ pro Raum das Instanz-Dict,
+und alles, was früher mit setdefault() zusammengesucht wurde, ist
+hier einmal an einer Stelle definiert.
+"""
+import uuid
+
+from .engine import GameState
+
+
+class Room:
+    """
+    players         -> {channel_name: nickname}
+    host            -> channel_name | None
+    symbols         -> {channel_name: "X"/"O"}
+    symbol_by_name  -> {nickname: "X"/"O"}, wird beim Start gefüllt (Rejoin)
+    phase           -> "lobby" / "starting" / "playing" / "finished"
+    game            -> engine.GameState
+    game_id         -> ID der laufenden Partie in der Datenbank (history.py), "" vor dem Start
+    user_ids        -> {"X"/"O": user_id} eingeloggter Spieler (Wertung nach Spielende)
+    """
+
+    __slots__ = ("code", "players", "host", "symbols", "symbol_by_name", "phase", "game", "game_id", "user_ids",
+                 "__weakref__")
+
+    def __init__(self, code: str):
+        self.code = code
+        self.players = {}
+        self.host = None
+        self.symbols = {}
+        self.symbol_by_name = {}
+        self.phase = "lobby"
+        self.game = GameState()
+        self.game_id = ""
+        self.user_ids = {}
+
+    def names_by_symbol(self) -> dict:
+        """Symbol -> Name, z. B. {"X": "Alice", "O": "Bob"}"""
+        return {
+            s: self.players.get(ch, "")
+            for ch, s in self.symbols.items() if s in ("X", "O")
+        }
+
+    def player_list(self) -> list:
+        return [
+            {"id": ch, "name": nick, "is_host": (ch == self.host)}
+            for ch, nick in self.players.items()
+        ]
+
+    def free_symbol(self):
+        taken = set(self.symbols.values())
+        return "X" if "X" not in taken else ("O" if "O" not in taken else None)
+
+    def new_game(self):
+        # Version läuft weiter: der Reset selbst zählt als eine Änderung
+        self.game = GameState(base=self.game.version + 1)
+        self.game_id = uuid.uuid4().hex
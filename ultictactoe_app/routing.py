@@ -1,8 +1,12 @@
 from django.urls import re_path
 
-from .consumers import GameLobbyConsumer, LobbyAllocatorConsumer
+from .consumers import GameLobbyConsumer, LobbyAllocatorConsumer, QuickPlayConsumer
+from .multiplex import PlayConsumer
 
 websocket_urlpatterns = [
     re_path(r"ws/lobby/$", LobbyAllocatorConsumer.as_asgi()),  # <- NEU
+    re_path(r"ws/quickplay/$", QuickPlayConsumer.as_asgi()),
     re_path(r"ws/game/(?P<room_name>[^/]+)/$", GameLobbyConsumer.as_asgi()),
+    # Spiel + Chat + Anwesenheit auf einem Socket (stream-markierte Frames)
+    re_path(r"ws/play/(?P<room_name>[^/]+)/$", PlayConsumer.as_asgi()),
 ]
\ No newline at end of file
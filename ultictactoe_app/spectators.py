@@ -0,0 +1,208 @@
+# ultictactoe_app/spectators.py
+"""
+Zuschauer-Verteilung, getrennt vom Spieler-Pfad.
+
+Spieler-Befehle rufen nur publish() auf – das legt den fertigen Frame ab
+und weckt einen Fan-out-Task pro Raum (O(1), kein await). Der Task schickt
+an alle Zuschauer des Raums:
+  - genau eine Version hinterher  -> die Frames dieser Version (Delta)
+  - weiter hinterher              -> EIN Snapshot statt jedem einzelnen Zug
+Zwischen zwei Runden wartet er `tick` Sekunden, damit schnelle Züge
+zusammengefasst werden.
+
+Mehrere Worker: mit relay=True bekommt jeder Prozess genau EINEN Kanal im
+Channel-Layer (Gruppe "watch_<raum>"), über den Frames anderer Prozesse
+reinkommen – nicht ein Kanal pro Zuschauer. Das Relay startet beim ersten
+publish() oder watch(), auch in Workern ohne eigene Zuschauer (die
+Spieler können ja woanders zuschauen lassen).
+"""
+import asyncio
+
+
+class SpectatorLimit(Exception):
+    def __init__(self, message: str):
+        super().__init__(message)
+        self.message = message
+
+
+class _Watched:
+    __slots__ = ("viewers", "version", "latest", "wake", "task")
+
+    def __init__(self):
+        self.viewers = {}      # consumer -> zuletzt gesendete Version
+        self.version = -1      # neueste bekannte Version
+        self.latest = []       # Frames (text/bytes-Dicts) genau dieser Version
+        self.wake = asyncio.Event()
+        self.task = None
+
+
+class SpectatorHub:
+    """
+    snapshot: async (code) -> (version, frame) oder None; frame wie consumers.frame()
+    """
+
+    def __init__(self, snapshot, per_room=5000, per_process=20000, tick=0.1,
+                 relay=False, channel_layer=None):
+        self.snapshot = snapshot
+        self.per_room = per_room
+        self.per_process = per_process
+        self.tick = tick
+        self.relay = relay
+        self._layer = channel_layer
+        self._rooms = {}         # code -> _Watched
+        self.count = 0           # Zuschauer in diesem Prozess
+        self.frames_sent = 0
+        self.snapshots_sent = 0  # zusammengefasste Updates
+        self._relay_channel = None
+        self._relay_queue = None
+        self._relay_ready = None
+        self._relay_tasks = ()
+
+    # --- Zuschauer an-/abmelden ---
+
+    async def watch(self, code: str, consumer, version: int):
+        """consumer hat den Stand `version` schon bekommen (Snapshot beim Beitritt)."""
+        w = self._rooms.get(code)
+        if w is not None and len(w.viewers) >= self.per_room:
+            raise SpectatorLimit("Zu viele Zuschauer in diesem Raum.")
+        if self.count >= self.per_process:
+            raise SpectatorLimit("Gerade sind keine Zuschauerplätze frei.")
+        if w is None:
+            w = self._rooms[code] = _Watched()
+            if self.relay:
+                await self._start_relay()
+                await self._layer.group_add(f"watch_{code}", self._relay_channel)
+        w.viewers[consumer] = version
+        if version > w.version:
+            w.version = version
+        self.count += 1
+
+    async def unwatch(self, code: str, consumer):
+        w = self._rooms.get(code)
+        if w is None or w.viewers.pop(consumer, None) is None:
+            return
+        self.count -= 1
+        if not w.viewers:
+            self._rooms.pop(code, None)
+            w.wake.set()   # Task beendet sich
+            if self.relay and self._relay_channel:
+                await self._layer.group_discard(f"watch_{code}", self._relay_channel)
+
+    def viewers(self, code: str) -> int:
+        w = self._rooms.get(code)
+        return len(w.viewers) if w else 0
+
+    # --- Spieler-Pfad ---
+
+    def publish(self, code: str, version: int, event: dict, _relayed=False):
+        """Frame für Version `version` ablegen. Blockiert nie."""
+        if self.relay and not _relayed:
+            self._start_relay()
+            try:
+                self._relay_queue.put_nowait((code, version, event))
+            except asyncio.QueueFull:
+                pass   # Zuschauer anderer Worker holen sich dann einen Snapshot
+        w = self._rooms.get(code)
+        if w is None:
+            return
+        if version > w.version:
+            w.version = version
+            w.latest = [event]
+        elif version == w.version:
+            w.latest.append(event)   # z. B. game_over zur selben Version wie der letzte Zug
+        else:
+            return
+        w.wake.set()
+        if w.task is None or w.task.done():
+            w.task = asyncio.get_running_loop().create_task(self._fan_out(code, w))
+
+    # --- Fan-out ---
+
+    async def _fan_out(self, code, w):
+        while w.viewers:
+            await w.wake.wait()
+            w.wake.clear()
+            if self.tick:
+                await asyncio.sleep(self.tick)
+            if not w.viewers:
+                break
+
+            target, frames = w.version, list(w.latest)
+            snap = None
+            for consumer, last in list(w.viewers.items()):
+                if last >= target:
+                    continue
+                try:
+                    if last == target - 1 and frames:
+                        for f in frames:
+                            await self._send(consumer, f)
+                        self.frames_sent += len(frames)
+                        sent_version = target
+                    else:
+                        # zu weit hinterher -> ein Snapshot statt aller Einzelzüge
+                        if snap is None:
+                            snap = await self.snapshot(code)
+                            if snap is None:
+                                break
+                        await self._send(consumer, snap[1])
+                        self.snapshots_sent += 1
+                        sent_version = max(target, snap[0])
+                except Exception:
+                    await self.unwatch(code, consumer)
+                    continue
+                if consumer in w.viewers:
+                    w.viewers[consumer] = sent_version
+
+    @staticmethod
+    async def _send(consumer, event):
+        if consumer.binary and "bytes" in event:
+            await consumer.send(bytes_data=event["bytes"])
+        else:
+            await consumer.send(text_data=event["text"])
+
+    # --- Relay zwischen Workern ---
+
+    def _start_relay(self):
+        """Queue sofort (publish darf nicht warten), Kanal + Tasks im Hintergrund. Rückgabe: Task zum Abwarten."""
+        if self._relay_ready is None:
+            self._relay_queue = asyncio.Queue(maxsize=10000)
+            self._relay_ready = asyncio.get_running_loop().create_task(self._open_relay())
+        return self._relay_ready
+
+    async def _open_relay(self):
+        if self._layer is None:
+            from channels.layers import get_channel_layer
+            self._layer = get_channel_layer()
+        self._relay_channel = await self._layer.new_channel("watch.")
+        loop = asyncio.get_running_loop()
+        self._relay_tasks = (loop.create_task(self._relay_out()), loop.create_task(self._relay_in()))
+
+    async def _relay_out(self):
+        while True:
+            code, version, event = await self._relay_queue.get()
+            msg = {"type": "watch.frame", "room": code, "v": version,
+                   "origin": self._relay_channel, "text": event["text"]}
+            if "bytes" in event:
+                msg["bytes"] = event["bytes"]
+            try:
+                await self._layer.group_send(f"watch_{code}", msg)
+            except Exception:
+                pass
+
+    async def _relay_in(self):
+        while True:
+            msg = await self._layer.receive(self._relay_channel)
+            if msg.get("origin") == self._relay_channel:
+                continue
+            event = {"text": msg["text"]}
+            if "bytes" in msg:
+                event["bytes"] = msg["bytes"]
+            self.publish(msg["room"], msg["v"], event, _relayed=True)
+
+    def stats(self) -> dict:
+        return {
+            "spectators": self.count,
+            "watched_rooms": len(self._rooms),
+            "frames_sent": self.frames_sent,
+            "snapshots_sent": self.snapshots_sent,
+        }
@@ -0,0 +1,491 @@
+# ultictactoe_app/store.py
+"""
+Wo der Raum-Zustand liegt.
+
+InMemoryRoomStore  -> wie bisher: ein Dict im Prozess (ein Daphne-Worker)
+RedisRoomStore     -> kompakter Hash pro Raum in Redis, Züge atomar per
+                      Lua-Script, dazu ein kleiner lokaler Read-Through-Cache.
+                      Damit können beide Spieler eines Raums auf
+                      unterschiedlichen Workern landen.
+
+Auswahl über settings.ROOM_STORE (Aufbau wie CHANNEL_LAYERS):
+    ROOM_STORE = {
+        "BACKEND": "ultictactoe_app.store.RedisRoomStore",
+        "CONFIG": {"url": "redis://127.0.0.1:6379/1"},
+    }
+"""
+import importlib
+import json
+import time
+import weakref
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .engine import LINES, GameState, IllegalMove, MoveDelta
+from .rooms import Room
+
+
+class RoomStore:
+    """
+    Schnittstelle für alle Backends. Lobby-Daten (players, symbols, …) werden
+    am Room-Objekt geändert und mit save() zurückgeschrieben; das Spielbrett
+    ändert sich nur über apply_move() / reset_game().
+    """
+
+    async def get(self, code: str, fresh: bool = False):
+        """
+        Room oder None.
+        fresh=True: garantiert den aktuellen Stand (z. B. für state/joined),
+        sonst darf ein Backend kurz gecachte Daten liefern.
+        """
+        raise NotImplementedError
+
+    async def get_or_create(self, code: str):
+        """Rückgabe: (room, created)"""
+        raise NotImplementedError
+
+    async def save(self, room: Room):
+        """players, host, symbols, symbol_by_name und phase zurückschreiben."""
+        raise NotImplementedError
+
+    async def reset_game(self, room: Room, phase: str):
+        """Neues, leeres Spiel im Raum starten."""
+        raise NotImplementedError
+
+    async def apply_move(self, code: str, symbol: str, big: int, small: int) -> MoveDelta:
+        """Zug atomar prüfen und eintragen. Wirft IllegalMove."""
+        raise NotImplementedError
+
+    async def delete(self, code: str):
+        raise NotImplementedError
+
+    async def restore(self, room: Room) -> bool:
+        """Raum nach einem Neustart wieder anlegen (recovery.py); False, wenn es ihn schon gibt."""
+        raise NotImplementedError
+
+
+class InMemoryRoomStore(RoomStore):
+    def __init__(self):
+        self.rooms = {}   # code -> Room
+
+    async def get(self, code, fresh=False):
+        return self.rooms.get(code)
+
+    async def get_or_create(self, code):
+        room = self.rooms.get(code)
+        if room is not None:
+            return room, False
+        room = self.rooms[code] = Room(code)
+        return room, True
+
+    async def save(self, room):
+        pass  # das Objekt IST der Zustand
+
+    async def reset_game(self, room, phase):
+        room.new_game()
+        room.phase = phase
+
+    async def apply_move(self, code, symbol, big, small):
+        room = self.rooms.get(code)
+        if room is None:
+            raise IllegalMove("Raum existiert nicht.")
+        delta = room.game.apply_move(big, small, symbol)
+        if delta.winner:
+            room.phase = "finished"
+        return delta
+
+    async def delete(self, code):
+        self.rooms.pop(code, None)
+
+    async def restore(self, room):
+        if room.code in self.rooms:
+            return False
+        self.rooms[room.code] = room
+        return True
+
+
+# --- Redis ---
+
+# Fehlercodes aus dem Lua-Script -> Meldungen wie in engine.GameState.apply_move
+_ERRORS = {
+    "missing": "Raum existiert nicht.",
+    "over": "Das Spiel ist bereits beendet.",
+    "turn": "Du bist nicht dran.",
+    "range": "Außerhalb des Boards.",
+    "forced": "Klick ins richtige Feld!",
+    "big_done": "Das große Feld ist bereits belegt.",
+    "cell_done": "Feld bereits belegt.",
+}
+
+# Raum anlegen, falls es ihn noch nicht gibt. ARGV = Feld/Wert-Paare
+_CREATE_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 1 then return 0 end
+redis.call('HSET', KEYS[1], unpack(ARGV))
+return 1
+"""
+
+# Lobby-Daten nur schreiben, wenn seit dem Lesen niemand den Raum geändert hat.
+# KEYS = Raum-Hash; ARGV = erwartete ver, meta, phase
+# Rückgabe: {1, neue ver} | {0, aktuelle ver, meta, phase} | {-1} (Raum weg)
+_SAVE_LUA = """
+local s = redis.call('HMGET', KEYS[1], 'ver', 'meta', 'phase')
+if not s[1] then return {-1} end
+if s[1] ~= ARGV[1] then return {0, tonumber(s[1]), s[2], s[3]} end
+redis.call('HSET', KEYS[1], 'meta', ARGV[2], 'phase', ARGV[3])
+return {1, redis.call('HINCRBY', KEYS[1], 'ver', 1)}
+"""
+
+_META_DICTS = ("players", "symbols", "symbol_by_name", "user_ids")
+_SAVE_RETRIES = 5
+
+
+def _merge(base: dict, mine: dict, theirs: dict) -> dict:
+    """
+    Dreiwege-Merge der Lobby-Daten: was wir seit dem Lesen geändert haben
+    (base -> mine), wird auf den aktuellen Stand in Redis (theirs) übertragen.
+    Zwei gleichzeitige Joins behalten so beide Spieler.
+    """
+    out = dict(theirs)
+    for name in _META_DICTS:
+        b, m, t = base.get(name, {}), mine.get(name, {}), dict(theirs.get(name, {}))
+        for k in b.keys() | m.keys():
+            if k not in m:
+                t.pop(k, None)
+            elif b.get(k) != m[k]:
+                t[k] = m[k]
+        out[name] = t
+    for name in ("host", "phase"):
+        if mine.get(name) != base.get(name):
+            out[name] = mine.get(name)
+    return out
+
+
+# Ein Zug, komplett serverseitig (gleiche Regeln wie GameState.apply_move).
+# Nur Arithmetik statt bit.*, damit das Script auch im Test-Redis läuft.
+# KEYS = Raum-Hash, Zug-Liste (1 Byte pro Zug); ARGV = symbol, big, small
+_MOVE_LUA = """
+local POW = {1, 2, 4, 8, 16, 32, 64, 128, 256}
+local LINES = {{0,1,2},{3,4,5},{6,7,8},{0,3,6},{1,4,7},{2,5,8},{0,4,8},{2,4,6}}
+local function has(mask, i) return math.floor(mask / POW[i + 1]) % 2 == 1 end
+local function line_through(mask, cell)
+  for i, l in ipairs(LINES) do
+    if (l[1] == cell or l[2] == cell or l[3] == cell)
+        and has(mask, l[1]) and has(mask, l[2]) and has(mask, l[3]) then
+      return i - 1
+    end
+  end
+  return -1
+end
+
+local key = KEYS[1]
+local sym, big, small = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local s = redis.call('HMGET', key, 'cur', 'forced', 'winner', 'mx', 'mo', 'md', 'base')
+if not s[1] then return {'err', 'missing'} end
+if s[3] ~= '' then return {'err', 'over'} end
+if sym ~= s[1] then return {'err', 'turn'} end
+if not big or not small or big < 0 or big > 8 or small < 0 or small > 8 then
+  return {'err', 'range'}
+end
+local forced = tonumber(s[2])
+if forced ~= -1 and big ~= forced then return {'err', 'forced'} end
+-- Großfelder sind disjunkt verteilt -> Summe = Vereinigung
+local mx, mo, md = tonumber(s[4]), tonumber(s[5]), tonumber(s[6])
+if has(mx + mo + md, big) then return {'err', 'big_done'} end
+local c = redis.call('HMGET', key, 'x' .. big, 'o' .. big)
+local x, o = tonumber(c[1]), tonumber(c[2])
+if has(x + o, small) then return {'err', 'cell_done'} end
+
+local mask
+if sym == 'X' then x = x + POW[small + 1]; mask = x else o = o + POW[small + 1]; mask = o end
+
+local fin, winner, line = '', '', -1
+if line_through(mask, small) >= 0 then
+  fin = sym
+  if sym == 'X' then mx = mx + POW[big + 1]; line = line_through(mx, big)
+  else mo = mo + POW[big + 1]; line = line_through(mo, big) end
+  if line >= 0 then winner = sym end
+elseif x + o == 511 then
+  fin = 'D'
+  md = md + POW[big + 1]
+end
+local done = mx + mo + md
+if fin ~= '' and winner == '' and done == 511 then winner = 'D' end
+local nxt = small
+if winner ~= '' or has(done, small) then nxt = -1 end
+local cur = 'X'
+if sym == 'X' then cur = 'O' end
+
+redis.call('HSET', key, 'x' .. big, x, 'o' .. big, o, 'mx', mx, 'mo', mo, 'md', md,
+           'cur', cur, 'forced', nxt, 'winner', winner, 'line', line)
+if winner ~= '' then redis.call('HSET', key, 'phase', 'finished') end
+local n = redis.call('APPEND', KEYS[2], string.char(big * 9 + small))
+local ver = redis.call('HINCRBY', key, 'ver', 1)
+
+-- erlaubte Züge für den Nächsten: freie Zellen pro Großfeld (81 Bit passen nicht in Lua-Zahlen)
+local legal = {0, 0, 0, 0, 0, 0, 0, 0, 0}
+if winner == '' then
+  local all = redis.call('HMGET', key, 'x0', 'o0', 'x1', 'o1', 'x2', 'o2', 'x3', 'o3', 'x4', 'o4',
+                         'x5', 'o5', 'x6', 'o6', 'x7', 'o7', 'x8', 'o8')
+  for b = 0, 8 do
+    if (nxt == -1 or nxt == b) and not has(done, b) then
+      legal[b + 1] = 511 - tonumber(all[2 * b + 1]) - tonumber(all[2 * b + 2])
+    end
+  end
+end
+return {'ok', fin, nxt, cur, winner, line, ver, tonumber(s[7]) + n, unpack(legal)}
+"""
+
+
+def _s(v):
+    return v.decode() if isinstance(v, bytes) else v
+
+
+def _game_fields(game: GameState) -> dict:
+    fields = {
+        "mx": game.meta_x, "mo": game.meta_o, "md": game.meta_d,
+        "cur": game.current, "forced": game.forced,
+        "winner": game.winner or "",
+        "line": LINES.index(game.line) if game.line else -1,
+        "base": game.base,
+    }
+    for i in range(9):
+        fields[f"x{i}"] = game.x[i]
+        fields[f"o{i}"] = game.o[i]
+    return fields
+
+
+def _meta(room: Room) -> str:
+    return json.dumps({
+        "players": room.players, "host": room.host,
+        "symbols": room.symbols, "symbol_by_name": room.symbol_by_name,
+        "user_ids": room.user_ids,
+    })
+
+
+def _snapshot(room: Room) -> dict:
+    """Lobby-Daten als unabhängige Kopie (Basis für _merge)."""
+    return {**json.loads(_meta(room)), "phase": room.phase}
+
+
+class RedisRoomStore(RoomStore):
+    """
+    Ein Hash pro Raum:
+      meta            -> JSON mit players/host/symbols/symbol_by_name/user_ids (ändert sich selten)
+      phase           -> "lobby"/"starting"/"playing"/"finished"
+      x0..x8, o0..o8  -> 9-Bit-Masken der kleinen Felder
+      mx, mo, md      -> großes Brett
+      cur, forced, winner, line
+      base            -> Raum-Version beim Start des aktuellen Spiels
+      gid             -> Room.game_id (Partie in der Datenbank)
+      ver             -> wird bei jeder Änderung hochgezählt (Cache-Abgleich,
+                         Compare-and-Set in save())
+    Dazu ein String "<key>:m" mit den Zügen des laufenden Spiels (1 Byte pro Zug).
+
+    client: fertiger redis.asyncio-Client (z. B. fakeredis.aioredis.FakeRedis
+            in Tests), sonst wird einer aus url gebaut.
+    cache_ttl: wie lange ein gelesener Raum lokal ohne Redis-Abfrage gilt;
+               danach (oder bei fresh=True) wird nur "ver" verglichen.
+
+    save() schreibt nur, wenn "ver" noch dem Stand beim Lesen entspricht.
+    Sonst hat ein anderer Worker den Raum inzwischen geändert: unsere
+    Änderungen werden auf dessen Stand gemergt (_merge) und neu versucht.
+    """
+
+    def __init__(self, url="redis://127.0.0.1:6379/0", client=None,
+                 prefix="ultictactoe:room:", cache_ttl=0.5, clock=time.monotonic):
+        if client is None:
+            try:
+                import redis.asyncio as aioredis
+            except ImportError:
+                raise ImproperlyConfigured("RedisRoomStore braucht das Paket redis (pip install redis).")
+            client = aioredis.from_url(url)
+        self.redis = client
+        self.prefix = prefix
+        self.cache_ttl = cache_ttl
+        self._clock = clock
+        self._cache = {}   # code -> (Room, ver, gelesen_um)
+        self._read = weakref.WeakKeyDictionary()   # Room -> (ver, Lobby-Daten beim Lesen)
+        self._create = client.register_script(_CREATE_LUA)
+        self._save = client.register_script(_SAVE_LUA)
+        self._move = client.register_script(_MOVE_LUA)
+
+    def _key(self, code):
+        return f"{self.prefix}{code}"
+
+    def _moves_key(self, code):
+        return f"{self.prefix}{code}:m"
+
+    def _remember(self, room, ver, snapshot=True):
+        self._cache[room.code] = (room, ver, self._clock())
+        if snapshot:
+            self._read[room] = (ver, _snapshot(room))
+        elif room in self._read:
+            # nur die Version nachziehen (Zug): Lobby-Basis bleibt, wie sie gelesen wurde
+            self._read[room] = (ver, self._read[room][1])
+
+    @staticmethod
+    def _decode(code, d: dict, moves) -> Room:
+        room = Room(code)
+        meta = json.loads(d.get("meta") or "{}")
+        room.players = meta.get("players", {})
+        room.host = meta.get("host")
+        room.symbols = meta.get("symbols", {})
+        room.symbol_by_name = meta.get("symbol_by_name", {})
+        room.user_ids = meta.get("user_ids", {})
+        room.phase = d.get("phase", "lobby")
+
+        g = room.game
+        g.x = [int(d.get(f"x{i}", 0)) for i in range(9)]
+        g.o = [int(d.get(f"o{i}", 0)) for i in range(9)]
+        g.meta_x = int(d.get("mx", 0))
+        g.meta_o = int(d.get("mo", 0))
+        g.meta_d = int(d.get("md", 0))
+        g.current = d.get("cur", "X")
+        g.forced = int(d.get("forced", -1))
+        g.winner = d.get("winner") or None
+        line = int(d.get("line", -1))
+        g.line = LINES[line] if line >= 0 else None
+        g.base = int(d.get("base", 0))
+        room.game_id = d.get("gid", "")
+        g.moves = bytearray(moves or b"")
+        g.rebuild()
+        return room
+
+    async def get(self, code, fresh=False):
+        hit = self._cache.get(code)
+        if hit:
+            if not fresh and self._clock() - hit[2] < self.cache_ttl:
+                return hit[0]
+            # nur die Version abfragen – komplett neu laden nur bei Änderung
+            ver = await self.redis.hget(self._key(code), "ver")
+            if ver is not None and int(ver) == hit[1]:
+                self._remember(hit[0], hit[1], snapshot=False)
+                return hit[0]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self._key(code))
+            pipe.get(self._moves_key(code))
+            data, moves = await pipe.execute()
+        if not data:
+            self._cache.pop(code, None)
+            return None
+        if isinstance(moves, str):
+            moves = moves.encode("latin-1")
+        d = {_s(k): _s(v) for k, v in data.items()}
+        room = self._decode(code, d, moves)
+        self._remember(room, int(d.get("ver", 0)))
+        return room
+
+    async def get_or_create(self, code):
+        room = Room(code)
+        fields = {"meta": _meta(room), "phase": room.phase, "gid": "", "ver": 0, **_game_fields(room.game)}
+        args = [v for kv in fields.items() for v in kv]
+        created = await self._create(keys=[self._key(code)], args=args)
+        if created:
+            self._remember(room, 0)
+            return room, True
+        self._cache.pop(code, None)
+        return await self.get(code), False
+
+    async def save(self, room):
+        key = self._key(room.code)
+        read = self._read.get(room)
+        if read is None:
+            # Raum-Objekt kommt nicht von hier -> aktuellen Stand als Basis nehmen
+            ver, meta, phase = await self.redis.hmget(key, "ver", "meta", "phase")
+            if ver is None:
+                return
+            read = (int(ver), {**json.loads(_s(meta) or "{}"), "phase": _s(phase)})
+        ver, base = read
+        for _ in range(_SAVE_RETRIES):
+            res = await self._save(keys=[key], args=[ver, _meta(room), room.phase])
+            if int(res[0]) == 1:
+                if ver == read[0]:
+                    self._remember(room, int(res[1]))
+                else:
+                    # zwischendurch fremde Änderungen (evtl. auch Züge) -> Spielstand neu laden
+                    self._cache.pop(room.code, None)
+                    self._read[room] = (int(res[1]), _snapshot(room))
+                return
+            if int(res[0]) == -1:
+                self._cache.pop(room.code, None)
+                return
+            ver = int(res[1])
+            theirs = {**json.loads(_s(res[2]) or "{}"), "phase": _s(res[3])}
+            merged = _merge(base, _snapshot(room), theirs)
+            room.players = merged.get("players", {})
+            room.host = merged.get("host")
+            room.symbols = merged.get("symbols", {})
+            room.symbol_by_name = merged.get("symbol_by_name", {})
+            room.user_ids = merged.get("user_ids", {})
+            room.phase = merged.get("phase") or room.phase
+            base = theirs
+        self._cache.pop(room.code, None)
+        raise RuntimeError(f"Raum {room.code}: save() nach {_SAVE_RETRIES} Versuchen aufgegeben")
+
+    async def reset_game(self, room, phase):
+        room.new_game()
+        room.phase = phase
+        key = self._key(room.code)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={"phase": phase, "gid": room.game_id, **_game_fields(room.game)})
+            pipe.delete(self._moves_key(room.code))
+            pipe.hincrby(key, "ver", 1)
+            _, _, ver = await pipe.execute()
+        self._remember(room, ver)
+
+    async def apply_move(self, code, symbol, big, small):
+        res = await self._move(keys=[self._key(code), self._moves_key(code)], args=[symbol, big, small])
+        if _s(res[0]) != "ok":
+            raise IllegalMove(_ERRORS.get(_s(res[1]), "Ungültiger Zug."))
+
+        fin, nxt, cur, winner, line = _s(res[1]), int(res[2]), _s(res[3]), _s(res[4]), int(res[5])
+        ver, version = int(res[6]), int(res[7])
+        legal = 0
+        for b in range(9):
+            legal |= int(res[8 + b]) << (9 * b)
+        delta = MoveDelta(
+            big, small, symbol,
+            (big, fin) if fin else None,
+            nxt, cur, winner or None,
+            LINES[line] if line >= 0 else None,
+            version, legal,
+        )
+
+        # lokalen Cache nachziehen, wenn er genau eine Version zurückliegt
+        hit = self._cache.get(code)
+        if hit and hit[1] == ver - 1:
+            room = hit[0]
+            try:
+                room.game.apply_move(big, small, symbol)
+            except IllegalMove:
+                self._cache.pop(code, None)
+            else:
+                if winner:
+                    room.phase = "finished"
+                self._remember(room, ver, snapshot=False)
+        else:
+            self._cache.pop(code, None)
+        return delta
+
+    async def delete(self, code):
+        self._cache.pop(code, None)
+        await self.redis.delete(self._key(code), self._moves_key(code))
+
+    async def restore(self, room):
+        # Redis überlebt den Neustart meist selbst -> dann bleibt dessen Stand
+        fields = {"meta": _meta(room), "phase": room.phase, "gid": room.game_id, "ver": 0,
+                  **_game_fields(room.game)}
+        args = [v for kv in fields.items() for v in kv]
+        if not await self._create(keys=[self._key(room.code)], args=args):
+            return False
+        if room.game.moves:
+            await self.redis.set(self._moves_key(room.code), bytes(room.game.moves))
+        self._cache.pop(room.code, None)
+        return True
+
+
+def load_store(config: dict) -> RoomStore:
+    """settings.ROOM_STORE -> Store-Instanz (Standard: InMemoryRoomStore)."""
+    path = config.get("BACKEND", "ultictactoe_app.store.InMemoryRoomStore")
+    module, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module), name)(**config.get("CONFIG", {}))
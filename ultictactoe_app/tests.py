@@ -1,3 +1,1415 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import io
+import json
+import os
+import random
+import re
+import struct
+import tempfile
+import threading
+import types
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core import signing
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+
+from chat_app import consumers as chat_consumers
+
+try:
+    import fakeredis
+except ImportError:   # optional, nur für die Redis-Tests
+    fakeredis = None
+
+try:
+    import numpy as np
+    from . import batch as batch_mod
+except ImportError:   # optional, nur für selfplay
+    np = batch_mod = None
+
+from .codes import CodeAllocator, NoCodesLeft
+from . import benchmarks, consumers, metrics, protocol
+from .actors import RoomSerializer
+from .analysis import Solver, zobrist
+from .bot import BotLimit, BotPlayer, Position, search, think
+from .cluster import FrontRouter, HashRing, Membership, write_ring
+from .engine import LINES, GameState, IllegalMove, legal_cells, mask_result
+from . import history as history_mod
+from .expiry import TimerWheel
+from .layers import HybridChannelLayer
+from .management.commands.runworkers import Supervisor
+from .matchmaking import Matchmaker
+from .recovery import Snapshotter, recover
+from .models import Game, Move
+from .resume import EventLog, make_token, read_token
+from .routing import websocket_urlpatterns
+from .spectators import SpectatorHub
+from .rooms import Room
+from .store import InMemoryRoomStore, RedisRoomStore
+from .views import Metrics
+
+
+# --- Referenz: die alten Dict-Regeln aus consumers.py, absichtlich langsam und simpel ---
+
+def _line_winner(arr):
+    for a, b, c in LINES:
+        if arr[a] and arr[a] == arr[b] == arr[c]:
+            return arr[a]
+    return None
+
+
+class ReferenceGame:
+    def __init__(self):
+        self.board = {i: {} for i in range(9)}
+        self.finished = {}
+        self.current = "X"
+        self.forced = None
+        self.winner = None
+
+    def legal(self):
+        if self.winner:
+            return set()
+        bigs = [self.forced] if self.forced is not None else range(9)
+        return {(b, s) for b in bigs if b not in self.finished for s in range(9) if s not in self.board[b]}
+
+    def play(self, big, small):
+        self.board[big][small] = self.current
+        arr = [self.board[big].get(i) for i in range(9)]
+        w = _line_winner(arr)
+        if w:
+            self.finished[big] = w
+        elif len(self.board[big]) == 9:
+            self.finished[big] = "D"
+        self.current = "O" if self.current == "X" else "X"
+        self.forced = None if small in self.finished else small
+        w = _line_winner([self.finished.get(i) if self.finished.get(i) in ("X", "O") else None for i in range(9)])
+        if w:
+            self.winner = w
+        elif len(self.finished) == 9:
+            self.winner = "D"
+        if self.winner:
+            self.forced = None
+
+
+class EngineTests(SimpleTestCase):
+    def test_random_games_match_reference(self):
+        rng = random.Random(7)
+        winners = set()
+        for _ in range(300):
+            game, ref = GameState(), ReferenceGame()
+            while True:
+                self.assertEqual(set(legal_cells(game.legal_mask())), ref.legal())
+                self.assertEqual(game.finished_fields(), ref.finished)
+                self.assertEqual(game.winner, ref.winner)
+                if ref.winner:
+                    break
+                big, small = rng.choice(sorted(ref.legal()))
+                delta = game.apply_move(big, small)
+                ref.play(big, small)
+                self.assertEqual(delta.next_big, -1 if ref.forced is None else ref.forced)
+                self.assertEqual(delta.current, ref.current)
+                self.assertEqual(delta.legal, game.legal_mask())
+            winners.add(game.winner)
+        self.assertEqual(winners, {"X", "O", "D"})
+
+    def test_rebuild_matches_incremental_free_mask(self):
+        rng = random.Random(1)
+        game = GameState()
+        for _ in range(40):
+            if game.winner:
+                break
+            game.apply_move(*rng.choice(legal_cells(game.legal_mask())))
+        free = game.free
+        game.free = 0
+        game.rebuild()
+        self.assertEqual(game.free, free)
+
+    def test_illegal_moves_leave_state_untouched(self):
+        game = GameState()
+        game.apply_move(4, 0)            # O muss jetzt in Großfeld 0
+        version, legal = game.version, game.legal_mask()
+        for args, message in (
+            ((1, 1), "Klick ins richtige Feld!"),
+            ((0, 9), "Außerhalb des Boards."),
+            ((0, 1, "X"), "Du bist nicht dran."),
+        ):
+            with self.assertRaises(IllegalMove) as cm:
+                game.apply_move(*args)
+            self.assertEqual(cm.exception.message, message)
+        self.assertEqual((game.version, game.legal_mask()), (version, legal))
+
+        game.apply_move(0, 4)            # zurück nach 4
+        with self.assertRaises(IllegalMove) as cm:
+            game.apply_move(4, 0)
+        self.assertEqual(cm.exception.message, "Feld bereits belegt.")
+
+    def test_small_win_before_full_board(self):
+        # volle Reihe X in einem vollen Feld ist Sieg, kein Unentschieden
+        self.assertEqual(mask_result(0b010010111, 0b101101000), ("win", "X", (0, 1, 2)))
+        self.assertEqual(mask_result(0b110001101, 0b001110010), ("draw", None, None))
+        self.assertEqual(mask_result(0b1, 0b10), ("ongoing", None, None))
+
+    def test_moves_since(self):
+        game = GameState(base=10)
+        game.apply_move(4, 4)
+        game.apply_move(4, 0)
+        self.assertEqual(game.moves_since(10), [(4, 4, "X"), (4, 0, "O")])
+        self.assertEqual(game.moves_since(11), [(4, 0, "O")])
+        self.assertEqual(game.moves_since(12), [])
+        self.assertIsNone(game.moves_since(9))
+        self.assertIsNone(game.moves_since(13))
+
+
+class FakeClock:
+    def __init__(self, t=0.0):
+        self.t = t
+
+    def __call__(self):
+        return self.t
+
+
+class CodeAllocatorTests(SimpleTestCase):
+    def test_hands_out_every_code_once(self):
+        alloc = CodeAllocator(length=2, rng=random.Random(3))
+        codes = [alloc.reserve()[0] for _ in range(100)]
+        self.assertEqual(sorted(codes), [f"{i:02d}" for i in range(100)])
+        with self.assertRaises(NoCodesLeft):
+            alloc.reserve()
+
+    def test_reservation_expires_back_into_pool(self):
+        clock = FakeClock()
+        alloc = CodeAllocator(length=1, reservation_ttl=10, clock=clock)
+        code, _ = alloc.reserve()
+        self.assertEqual(alloc.available(), 9)
+        clock.t = 10
+        self.assertEqual(alloc.available(), 10)
+        # verfallener Code lässt sich trotzdem direkt belegen
+        self.assertTrue(alloc.claim(code))
+        self.assertEqual((alloc.available(), alloc.in_use()), (9, 1))
+
+    def test_claim_and_release(self):
+        alloc = CodeAllocator(length=2, rng=random.Random(5))
+        self.assertTrue(alloc.claim("42"))
+        self.assertTrue(alloc.claim("42"))          # zweiter Spieler im selben Raum
+        self.assertFalse(alloc.claim("abc"))
+        self.assertNotIn("42", {alloc.reserve()[0] for _ in range(99)})
+        alloc.release("42")
+        self.assertEqual(alloc.reserve()[0], "42")  # einziger freier Code
+        alloc.release("42")                         # Reservierung zurückgeben
+        self.assertEqual(alloc.available(), 1)
+
+    def test_reserved_code_needs_its_token(self):
+        clock = FakeClock()
+        alloc = CodeAllocator(length=2, reservation_ttl=10, clock=clock, rng=random.Random(2))
+        code, token = alloc.reserve()
+        # jemand tippt den Code ein, bevor der Anfordernde ankommt
+        self.assertFalse(alloc.claim(code))
+        self.assertFalse(alloc.claim(code, "geraten"))
+        self.assertTrue(alloc.is_reserved(code))
+        self.assertTrue(alloc.claim(code, token))
+        self.assertFalse(alloc.is_reserved(code))
+        self.assertEqual(alloc.in_use(), 1)
+        # nach Ablauf der TTL ist der Code wieder für alle frei
+        other, _ = alloc.reserve()
+        clock.t = 10
+        self.assertFalse(alloc.is_reserved(other))
+        self.assertTrue(alloc.claim(other))
+
+    def test_owns_filters_codes(self):
+        alloc = CodeAllocator(length=2, rng=random.Random(9), owns=lambda c: int(c) % 2 == 0)
+        self.assertTrue(all(int(alloc.reserve()[0]) % 2 == 0 for _ in range(50)))
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis nicht installiert")
+class RedisRoomStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeAsyncRedis()
+
+    def worker(self):
+        # je Worker ein eigener Store, ohne Cache -> jeder get() sieht Redis
+        return RedisRoomStore(client=self.redis, cache_ttl=0)
+
+    async def test_moves_match_in_memory_store(self):
+        redis_store, memory = self.worker(), InMemoryRoomStore()
+        for st in (redis_store, memory):
+            room, _ = await st.get_or_create("0042")
+            await st.reset_game(room, "playing")
+        rng = random.Random(11)
+        while True:
+            game = (await memory.get("0042")).game
+            if game.winner:
+                break
+            big, small = rng.choice(legal_cells(game.legal_mask()))
+            a = await redis_store.apply_move("0042", game.current, big, small)
+            b = await memory.apply_move("0042", game.current, big, small)
+            self.assertEqual([getattr(a, f) for f in a.__slots__], [getattr(b, f) for f in b.__slots__])
+        with self.assertRaises(IllegalMove):
+            await redis_store.apply_move("0042", "X", 0, 0)
+        room = await self.worker().get("0042", fresh=True)
+        self.assertEqual((room.phase, room.game.winner), ("finished", game.winner))
+        self.assertEqual(room.game.cells(), game.cells())
+
+    async def test_concurrent_saves_keep_both_players(self):
+        w1, w2 = self.worker(), self.worker()
+        await w1.get_or_create("0001")
+        r1, r2 = await w1.get("0001"), await w2.get("0001")
+        r1.players["ch1"] = "Ann"
+        r1.symbols["ch1"] = "X"
+        r1.host = "ch1"
+        r2.players["ch2"] = "Ben"
+        r2.symbols["ch2"] = "O"
+        await asyncio.gather(w1.save(r1), w2.save(r2))
+        room = await self.worker().get("0001", fresh=True)
+        self.assertEqual(room.players, {"ch1": "Ann", "ch2": "Ben"})
+        self.assertEqual(room.symbols, {"ch1": "X", "ch2": "O"})
+        self.assertEqual(room.host, "ch1")
+
+    async def test_stale_save_merges_leave_and_keeps_moves(self):
+        w1, w2 = self.worker(), self.worker()
+        room, _ = await w1.get_or_create("0002")
+        room.players = {"ch1": "Ann", "ch2": "Ben"}
+        room.symbols = {"ch1": "X", "ch2": "O"}
+        await w1.save(room)
+        await w1.reset_game(room, "playing")
+
+        stale = await w2.get("0002")
+        await w1.apply_move("0002", "X", 4, 4)
+        del stale.players["ch2"]                  # Ben geht, w2 kennt den Zug noch nicht
+        await w2.save(stale)
+        self.assertEqual(stale.players, {"ch1": "Ann"})
+
+        room = await self.worker().get("0002", fresh=True)
+        self.assertEqual(room.players, {"ch1": "Ann"})
+        self.assertEqual(room.symbols, {"ch1": "X", "ch2": "O"})
+        self.assertEqual(room.game.moves_since(room.game.base), [(4, 4, "X")])
+        self.assertEqual(room.phase, "playing")
+
+    async def test_save_after_delete_does_not_recreate(self):
+        w = self.worker()
+        room, _ = await w.get_or_create("0003")
+        await w.delete("0003")
+        room.players["ch1"] = "Ann"
+        await w.save(room)
+        self.assertIsNone(await w.get("0003", fresh=True))
+
+
+def _decode_state(frame: bytes):
+    """Wie der Binär-Client in game.html: STATE -> (v, current, forced, winner, Zellen, Großfelder)."""
+    op, v, cur, forced, winner = struct.unpack_from("!BIBBB", frame)
+    packed = int.from_bytes(frame[8:29], "little")
+    meta = int.from_bytes(frame[29:32], "little")
+    names = {1: "X", 2: "O", 3: "D"}
+    cells = [(c // 9, c % 9, names[packed >> (2 * c) & 3]) for c in range(81) if packed >> (2 * c) & 3]
+    fields = {b: names[meta >> (2 * b) & 3] for b in range(9) if meta >> (2 * b) & 3}
+    return op, v, "XO"[cur], -1 if forced == protocol.FREE else forced, names.get(winner), cells, fields
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_state_round_trip(self):
+        rng = random.Random(2)
+        for _ in range(30):
+            game = GameState(base=rng.randrange(1000))
+            for _ in range(rng.randrange(82)):
+                if game.winner:
+                    break
+                game.apply_move(*rng.choice(legal_cells(game.legal_mask())))
+            frame = protocol.encode_state(game)
+            self.assertEqual(len(frame), 32)
+            self.assertEqual(
+                _decode_state(frame),
+                (protocol.OP_STATE, game.version, game.current, game.forced, game.winner,
+                 game.cells(), game.finished_fields()),
+            )
+
+    def test_move_frame(self):
+        frame = protocol.encode_move({
+            "v": 7, "big": 3, "small": 5, "symbol": "O", "currentPlayer": "X",
+            "big_field_to_click": "", "finished": {"big": 3, "winner": "D"},
+        })
+        op, v, cell, flags, nxt, fin = struct.unpack("!BIBBBB", frame)
+        self.assertEqual((op, v, cell, flags, nxt), (protocol.OP_MOVE, 7, 32, 0b01, protocol.FREE))
+        self.assertEqual((fin & 0x0F, fin >> 4), (3, 3))
+
+        frame = protocol.encode_move({
+            "v": 8, "big": 0, "small": 4, "symbol": "X", "currentPlayer": "O",
+            "big_field_to_click": 4, "finished": None,
+        })
+        self.assertEqual(struct.unpack("!BIBBBB", frame)[3:], (0b10, 4, protocol.FREE))
+
+    def test_game_over_and_reset(self):
+        frame = protocol.encode_game_over({"winner": "O", "line": [2, 4, 6]})
+        self.assertEqual(struct.unpack("!BBB", frame), (protocol.OP_GAME_OVER, 2, LINES.index((2, 4, 6))))
+        self.assertEqual(protocol.encode_game_over({"winner": "D", "line": None})[2], protocol.FREE)
+        self.assertEqual(struct.unpack("!BIB", protocol.encode_reset({"v": 12, "currentPlayer": "O"})),
+                         (protocol.OP_RESET, 12, 1))
+
+    def test_decode_client(self):
+        self.assertEqual(protocol.decode_client(bytes([protocol.OP_C_MOVE, 8, 2])), ("game_move", {"big": 8, "small": 2}))
+        self.assertEqual(protocol.decode_client(struct.pack("!BI", protocol.OP_C_SYNC, 70000)), ("sync", {"since": 70000}))
+        self.assertEqual(protocol.decode_client(bytes([protocol.OP_C_GET_STATE])), ("get_state", {}))
+        self.assertEqual(protocol.decode_client(bytes([protocol.OP_C_RESET])), ("reset", {}))
+        for junk in (b"", bytes([protocol.OP_C_MOVE, 1]), bytes([protocol.OP_C_SYNC, 0, 0]), b"\x7f"):
+            self.assertEqual(protocol.decode_client(junk), (None, {}))
+
+
+class FakeViewer:
+    binary = False
+
+    def __init__(self):
+        self.frames = []
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.frames.append(text_data)
+
+
+class SpectatorRelayTests(SimpleTestCase):
+    async def test_worker_without_spectators_relays_moves(self):
+        layer = InMemoryChannelLayer()
+        players = SpectatorHub(snapshot=None, tick=0, relay=True, channel_layer=layer)
+        watchers = SpectatorHub(snapshot=None, tick=0, relay=True, channel_layer=layer)
+        viewer = FakeViewer()
+        await watchers.watch("0042", viewer, version=3)
+
+        players.publish("0042", 4, {"text": '{"event":"move","v":4}'})
+        for _ in range(50):
+            if viewer.frames:
+                break
+            await asyncio.sleep(0.01)
+        self.assertEqual(viewer.frames, ['{"event":"move","v":4}'])
+        self.assertEqual(players.count, 0)
+
+        for hub in (players, watchers):
+            for task in hub._relay_tasks:
+                task.cancel()
+
+
+class BotHintSlotTests(SimpleTestCase):
+    async def test_hints_have_their_own_budget(self):
+        bot = BotPlayer(workers=1, hint_slots=1)
+        bot._executor = ThreadPoolExecutor(max_workers=2)   # statt Prozess-Pool
+        bot._slots = asyncio.Semaphore(1)
+        release = threading.Event()
+        try:
+            first = asyncio.ensure_future(bot.hint(release.wait, 5))
+            await asyncio.sleep(0.01)
+            with self.assertRaises(BotLimit):
+                await bot.hint(release.wait, 5)
+            # Bot-Züge laufen trotzdem sofort
+            self.assertEqual(await asyncio.wait_for(bot.run(sum, (1, 2)), 1), 3)
+            release.set()
+            self.assertTrue(await first)
+            self.assertEqual(bot.hints_running, 0)
+        finally:
+            release.set()
+            bot._executor.shutdown()
+
+
+def _mate_position():
+    # X hat Großfelder 0 und 1, muss in 2 spielen und hat dort schon 0 und 1 -> (2, 2) gewinnt
+    game = GameState()
+    game.meta_x = 0b011
+    game.x[0], game.o[0] = 0b000000111, 0b000011000
+    game.x[1], game.o[1] = 0b001010100, 0b000001001
+    game.x[2], game.o[2] = 0b000000011, 0b000110000
+    game.o[5], game.o[7] = 0b000000111, 0b000000011
+    game.meta_o = 0b100000
+    game.forced = 2
+    game.rebuild()
+    return game
+
+
+class SearchTests(SimpleTestCase):
+    def _position(self, seed, plies=12):
+        rng = random.Random(seed)
+        game = GameState()
+        for _ in range(plies):
+            game.apply_move(*rng.choice(legal_cells(game.legal_mask())))
+        return game
+
+    def test_returns_a_legal_move(self):
+        for seed in range(5):
+            game = self._position(seed)
+            big, small, playouts = think(Position.from_game(game).to_tuple(), 1000, 300, seed=seed)
+            self.assertIn((big, small), legal_cells(game.legal_mask()))
+            self.assertEqual(playouts, 300)
+
+    def test_takes_the_winning_move(self):
+        cell, _ = search(Position.from_game(_mate_position()), budget_ms=1000, max_playouts=2000, seed=1)
+        self.assertEqual(divmod(cell, 9), (2, 2))
+
+    def test_seeded_search_is_deterministic(self):
+        state = Position.from_game(self._position(7)).to_tuple()
+        # großes Zeitbudget, damit nur max_playouts die Suche begrenzt
+        runs = {think(state, 10_000, 500, seed=42) for _ in range(3)}
+        self.assertEqual(len(runs), 1)
+
+
+class SolverTests(SimpleTestCase):
+    def test_finds_mate_in_one(self):
+        result = Solver(tt_bits=12).analyze(_mate_position(), max_depth=4)
+        self.assertEqual(result.best, (2, 2))
+        self.assertEqual(result.mate, 1)
+        self.assertEqual(result.pv[0], (2, 2))
+
+    def test_best_move_is_legal_and_deterministic(self):
+        rng = random.Random(4)
+        game = GameState()
+        for _ in range(12):
+            game.apply_move(*rng.choice(legal_cells(game.legal_mask())))
+        a = Solver(tt_bits=12).analyze(game, max_depth=3)
+        b = Solver(tt_bits=12).analyze(game, max_depth=3)
+        self.assertIn(a.best, legal_cells(game.legal_mask()))
+        self.assertEqual((a.best, a.score), (b.best, b.score))
+
+    def test_zobrist_follows_moves_not_order(self):
+        a, b = GameState(), GameState()
+        for big, small in ((4, 0), (0, 4), (4, 1), (1, 4)):
+            a.apply_move(big, small)
+        for big, small in ((4, 1), (1, 4), (4, 0), (0, 4)):
+            b.apply_move(big, small)
+        self.assertEqual(zobrist(Position.from_game(a)), zobrist(Position.from_game(b)))
+        b.apply_move(4, 2)
+        self.assertNotEqual(zobrist(Position.from_game(a)), zobrist(Position.from_game(b)))
+
+
+class BenchCompareTests(SimpleTestCase):
+    @staticmethod
+    def _result(**cases):
+        return {"results": {name: {"min_us": v[0], "median_us": v[0] * 1.5, "noise": v[1]}
+                            for name, v in cases.items()}}
+
+    def test_gate_uses_minimum_plus_noise(self):
+        base = self._result(quiet=(10.0, 0.02), noisy=(10.0, 0.10), slow=(10.0, 0.02))
+        cur = self._result(quiet=(11.5, 0.02), noisy=(12.4, 0.05), slow=(20.0, 0.02))
+        rows = {r[0]: r for r in benchmarks.compare(cur, base, threshold=0.15)}
+        self.assertFalse(rows["quiet"][5])    # +15 % < 15 % + 2 %
+        self.assertFalse(rows["noisy"][5])    # +24 % < 15 % + 10 % Rauschen der Baseline
+        self.assertTrue(rows["slow"][5])
+        self.assertAlmostEqual(rows["noisy"][4], 0.25)
+
+    def test_noise_allowance_is_capped(self):
+        base = self._result(wild=(10.0, 0.50))
+        for now, regressed in ((12.9, False), (15.0, True)):
+            row, = benchmarks.compare(self._result(wild=(now, 0.40)), base, threshold=0.15)
+            self.assertAlmostEqual(row[4], 0.30)     # nicht 15 % + 50 %
+            self.assertEqual(row[5], regressed)
+
+    def test_merge_repeats(self):
+        runs = [{"min_us": 10.0, "median_us": 11.0, "p95_us": 12.0, "n": 7},
+                {"min_us": 12.0, "median_us": 13.0, "p95_us": 14.0, "n": 7}]
+        merged = benchmarks._merge(runs)
+        self.assertEqual((merged["min_us"], merged["median_us"], merged["n"]), (10.0, 12.0, 14))
+        self.assertEqual(merged["noise"], 0.2)
+
+
+class TimerWheelTests(SimpleTestCase):
+    def test_fires_each_key_exactly_at_its_tick(self):
+        rng = random.Random(8)
+        wheel = TimerWheel(slots=8, levels=3)
+        due_at = {}
+        for key in range(500):
+            tick = rng.randrange(1, 700)        # auch über die Spanne des Rads (512) hinaus
+            due_at[key] = tick
+            wheel.schedule(key, tick)
+        fired = {}
+        for t in range(1, 701):
+            for key in wheel.advance(t):
+                fired[key] = t
+        self.assertEqual(fired, due_at)
+        self.assertEqual(len(wheel), 0)
+
+    def test_schedule_while_running_and_in_the_past(self):
+        wheel = TimerWheel(slots=4, levels=2)
+        self.assertEqual(wheel.advance(10), [])
+        wheel.schedule("late", 5)              # schon vorbei -> nächster Tick
+        wheel.schedule("soon", 12)
+        wheel.schedule("far", 40)
+        self.assertEqual(wheel.advance(11), ["late"])
+        self.assertEqual(wheel.advance(39), ["soon"])
+        self.assertEqual(wheel.advance(40), ["far"])
+
+    def test_advance_jumps_several_ticks(self):
+        wheel = TimerWheel(slots=4, levels=2)
+        for key, tick in (("a", 3), ("b", 9), ("c", 2)):
+            wheel.schedule(key, tick)
+        self.assertEqual(sorted(wheel.advance(9)), ["a", "b", "c"])
+
+
+class MatchmakerTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pairs = []
+
+        async def on_match(a, b, waited_a, waited_b):
+            self.pairs.append((a.nickname, b.nickname))
+
+        self.mm = Matchmaker(on_match, window=100, widen=50, max_window=400, tick=3600, clock=self.clock)
+
+    async def test_immediate_match_returns_no_ticket(self):
+        waiting = await self.mm.join("p1", "Ann", 1500)
+        self.assertIsNotNone(waiting)
+        self.assertIsNone(await self.mm.join("p2", "Ben", 1550))
+        self.assertEqual(self.pairs, [("Ann", "Ben")])
+        self.assertEqual(len(self.mm), 0)
+        self.assertFalse(self.mm.leave(waiting))   # schon gepaart
+
+    async def test_window_widens_with_waiting_time(self):
+        self.mm.tick = 0.01
+        await self.mm.join("p1", "Ann", 1500)
+        await self.mm.join("p2", "Ben", 1800)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.pairs, [])
+        self.clock.t = 5                            # Ann: 100 + 5 * 50 = 350 >= 300
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.pairs, [("Ann", "Ben")])
+        self.assertEqual(len(self.mm), 0)
+
+    async def test_closest_rating_wins(self):
+        await self.mm.join("p1", "Ann", 1500)
+        await self.mm.join("p2", "Ben", 1800)
+        self.assertIsNone(await self.mm.join("p3", "Cid", 1560))
+        self.assertEqual(self.pairs, [("Ann", "Cid")])
+
+    async def test_cancel_leaves_queue(self):
+        ann = await self.mm.join("p1", "Ann", 1500)
+        self.assertTrue(self.mm.leave(ann))
+        self.assertIsNotNone(await self.mm.join("p2", "Ben", 1500))
+        self.assertEqual(self.pairs, [])
+
+
+class ResumeTokenTests(SimpleTestCase):
+    def test_round_trip(self):
+        token = make_token("ABCD", "Ann", "X")
+        self.assertEqual(read_token(token, max_age=60), ("ABCD", "Ann", "X"))
+
+    def test_expired(self):
+        token = make_token("ABCD", "Ann", "X")
+        with mock.patch("django.core.signing.time.time", return_value=signing.time.time() + 61):
+            self.assertIsNone(read_token(token, max_age=60))
+            self.assertIsNotNone(read_token(token, max_age=120))
+
+    def test_tampered_or_foreign(self):
+        token = make_token("ABCD", "Ann", "X")
+        self.assertIsNone(read_token(token[:-1] + ("A" if token[-1] != "A" else "B"), max_age=60))
+        self.assertIsNone(read_token("", max_age=60))
+        self.assertIsNone(read_token(None, max_age=60))
+        # gleiche Daten, anderes Salt (z.B. ein Token aus einer anderen App)
+        other = signing.dumps({"r": "ABCD", "n": "Ann", "s": "X"}, salt="something.else", compress=True)
+        self.assertIsNone(read_token(other, max_age=60))
+        # richtig signiert, aber falscher Inhalt
+        junk = signing.dumps(["ABCD"], salt="ultictactoe.resume")
+        self.assertIsNone(read_token(junk, max_age=60))
+
+
+class EventLogTests(SimpleTestCase):
+    def _stamp(self, log, code, n):
+        return [log.stamp(code, {"text": f'{{"i":{i}}}'})["text"] for i in range(n)]
+
+    def test_stamp_and_since(self):
+        log = EventLog(size=8)
+        frames = self._stamp(log, "ABCD", 3)
+        self.assertEqual(frames[0], '{"seq":1,"i":0}')
+        self.assertEqual(log.stamp("ABCD", {"text": "{}"})["text"], '{"seq":4}')
+        self.assertEqual(log.latest("ABCD"), 4)
+        self.assertEqual(log.since("ABCD", log.epoch, 1), frames[1:] + ['{"seq":4}'])
+        self.assertEqual(log.since("ABCD", log.epoch, 4), [])
+        self.assertEqual(log.replayed, 3)
+
+    def test_misses(self):
+        log = EventLog(size=4)
+        self._stamp(log, "ABCD", 10)
+        self.assertIsNone(log.since("ABCD", "other", 9))        # anderer Prozess
+        self.assertIsNone(log.since("ABCD", log.epoch, 11))     # aus der Zukunft
+        self.assertIsNone(log.since("ABCD", log.epoch, "x"))
+        self.assertIsNone(log.since("ABCD", log.epoch, 2))      # aus dem Ringpuffer gefallen
+        self.assertEqual(len(log.since("ABCD", log.epoch, 6)), 4)
+        self.assertIsNone(log.since("WXYZ", log.epoch, 0))
+        self.assertEqual(log.misses, 5)
+
+    def test_foreign_event_invalidates_older_seqs(self):
+        log = EventLog(size=8)
+        self._stamp(log, "ABCD", 3)
+        log.foreign("ABCD")
+        self.assertIsNone(log.since("ABCD", log.epoch, 2))
+        self.assertEqual(log.since("ABCD", log.epoch, 3), [])
+        frames = self._stamp(log, "ABCD", 2)
+        self.assertEqual(log.since("ABCD", log.epoch, 3), frames)
+
+    def test_drop(self):
+        log = EventLog()
+        self._stamp(log, "ABCD", 2)
+        log.drop("ABCD")
+        self.assertEqual(len(log), 0)
+        self.assertEqual(log.latest("ABCD"), 0)
+
+
+class HashRingTests(SimpleTestCase):
+    KEYS = [f"room{i}" for i in range(10000)]
+
+    def _owners(self, ring):
+        return {k: ring.node_for(k) for k in self.KEYS}
+
+    def test_add_moves_about_one_nth(self):
+        ring = HashRing([f"w{i}" for i in range(4)])
+        before = self._owners(ring)
+        ring.add("w4")
+        after = self._owners(ring)
+        moved = [k for k in self.KEYS if before[k] != after[k]]
+        self.assertTrue(all(after[k] == "w4" for k in moved))
+        self.assertAlmostEqual(len(moved) / len(self.KEYS), 1 / 5, delta=0.07)
+
+    def test_remove_only_moves_its_keys(self):
+        ring = HashRing([f"w{i}" for i in range(4)])
+        before = self._owners(ring)
+        ring.remove("w2")
+        after = self._owners(ring)
+        moved = [k for k in self.KEYS if before[k] != after[k]]
+        self.assertTrue(all(before[k] == "w2" for k in moved))
+        self.assertAlmostEqual(len(moved) / len(self.KEYS), 1 / 4, delta=0.07)
+        self.assertNotIn("w2", set(after.values()))
+        ring.add("w2")
+        self.assertEqual(self._owners(ring), before)
+
+    def test_empty_ring(self):
+        self.assertIsNone(HashRing().node_for("ABCD"))
+
+
+class FrontRouterTests(SimpleTestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.router = FrontRouter(pin_ttl=10.0, clock=self.clock)
+        for i in range(3):
+            self.router.add(f"w{i}", ("127.0.0.1", 8100 + i))
+
+    def test_pin_holds_until_ttl_after_last_connection(self):
+        worker, room = self.router._pick("/ws/game/ABCD/")
+        self.assertEqual(room, "ABCD")
+        self.router._pin(room, worker, 1)
+        self.router.drain(worker)
+        self.clock.t = 100
+        self.assertEqual(self.router._pick("/ws/game/ABCD/")[0], worker)   # Verbindung offen
+        self.router._pin(room, worker, -1)
+        self.clock.t = 109
+        self.assertEqual(self.router._pick("/ws/play/ABCD/")[0], worker)   # Reconnect-Fenster
+        self.clock.t = 110
+        moved_to, _ = self.router._pick("/ws/game/ABCD/")
+        self.assertNotEqual(moved_to, worker)
+        self.assertEqual(self.router.moved, 1)
+        self.router.sweep()
+        self.assertEqual(self.router._pins, {})
+
+    def test_drained_worker_gets_no_new_rooms(self):
+        self.router.drain("w1")
+        picked = {self.router._pick(f"/ws/game/R{i}/")[0] for i in range(500)}
+        self.assertEqual(picked, {"w0", "w2"})
+        others = {self.router._pick("/")[0] for _ in range(10)}
+        self.assertEqual(others, {"w0", "w2"})
+
+    def test_late_decrement_from_old_worker_is_ignored(self):
+        self.router._pin("ABCD", "w0", 1)
+        self.router._pin("ABCD", "w0", -1)
+        self.clock.t = 20
+        self.router._pin("ABCD", "w1", 1)
+        self.router._pin("ABCD", "w0", -1)
+        self.assertEqual(self.router._pins["ABCD"][:2], ["w1", 1])
+
+    def test_removed_worker_drops_its_pins(self):
+        self.router._pin("ABCD", "w0", 1)
+        self.router.remove("w0")
+        self.assertNotIn("ABCD", self.router._pins)
+        self.assertNotEqual(self.router._pick("/ws/game/ABCD/")[0], "w0")
+
+
+class MembershipTests(SimpleTestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+
+    def test_follows_ring_file(self):
+        clock = FakeClock()
+        write_ring(self.path, ["w0", "w1", "w2"])
+        me = Membership("w1", self.path, check=1.0, clock=clock)
+        ring = HashRing(["w0", "w1", "w2"])
+        codes = [f"C{i}" for i in range(200)]
+        self.assertEqual([me.owns(c) for c in codes], [ring.node_for(c) == "w1" for c in codes])
+
+        write_ring(self.path, ["w1"])
+        os.utime(self.path, ns=(1, 1))   # mtime sicher anders
+        self.assertFalse(all(me.owns(c) for c in codes))   # noch nicht neu geprüft
+        clock.t = 1
+        self.assertTrue(all(me.owns(c) for c in codes))
+
+    def test_broken_file_keeps_old_ring(self):
+        clock = FakeClock()
+        write_ring(self.path, ["w0", "w1"])
+        me = Membership("w0", self.path, check=0, clock=clock)
+        owned = [me.owns(f"C{i}") for i in range(100)]
+        with open(self.path, "w") as f:
+            f.write("[\"w0\", ")
+        os.utime(self.path, ns=(2, 2))
+        self.assertEqual([me.owns(f"C{i}") for i in range(100)], owned)
+
+
+class FakeProc:
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+        self._done = asyncio.Event()
+
+    def terminate(self):
+        self.returncode = -15
+        self._done.set()
+
+    async def wait(self):
+        if self.returncode is None:
+            await self._done.wait()
+        return self.returncode
+
+
+class SupervisorTests(SimpleTestCase):
+    async def test_failed_start_leaves_no_entry_and_retries(self):
+        server = await asyncio.start_server(lambda r, w: w.close(), "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        spawned = [FakeProc(returncode=1), FakeProc()]
+
+        async def spawn(worker, port):
+            return spawned.pop(0)
+
+        sup = Supervisor(types.SimpleNamespace(stdout=io.StringIO()), {"pin_ttl": 10.0})
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        sup.ring_file = os.path.join(tmp.name, "ring.json")
+        sup._spawn = spawn
+        sup._stop = asyncio.Event()
+        try:
+            await sup._start("w0", port, delay=0.01)
+            self.assertNotIn("w0", sup.procs)
+            self.assertNotIn("w0", sup.router.ring.nodes)
+            for _ in range(100):
+                if "w0" in sup.router.ring.nodes:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(spawned, [])
+            self.assertIn("w0", sup.procs)
+            self.assertIn("w0", sup.router.ring.nodes)
+            with open(sup.ring_file) as f:
+                self.assertEqual(json.load(f), ["w0"])
+        finally:
+            sup._stop.set()
+            for proc in sup.procs.values():
+                proc.terminate()
+            server.close()
+            await server.wait_closed()
+            await asyncio.sleep(0)
+
+
+class FakeRedisLayer(HybridChannelLayer):
+    """HybridChannelLayer gegen einen gemeinsamen fakeredis-Server (ein Objekt = ein Prozess)."""
+
+    def __init__(self, server, **kwargs):
+        super().__init__(**kwargs)
+        self._fake = fakeredis.FakeAsyncRedis(server=server)
+
+    def connection(self, index):
+        return self._fake
+
+
+@unittest.skipIf(fakeredis is None, "fakeredis nicht installiert")
+class HybridChannelLayerTests(SimpleTestCase):
+    @contextlib.asynccontextmanager
+    async def _layers(self):
+        server = fakeredis.FakeServer()
+        layers = FakeRedisLayer(server), FakeRedisLayer(server)
+        try:
+            yield layers
+        finally:
+            for layer in layers:
+                await layer.close_pools()
+
+    async def _until(self, cond, what):
+        for _ in range(100):
+            if cond():
+                return
+            await asyncio.sleep(0.01)
+        self.fail(what)
+
+    async def _subscribed(self, *layers):
+        # erst mit stehendem Abo wird gecacht
+        await self._until(lambda: all(layer._subscribed for layer in layers), "Registry-Abo steht nicht")
+
+    async def _get(self, layer, channel):
+        return await asyncio.wait_for(layer.receive(channel), 2)
+
+    async def _procs(self, layer, group):
+        procs = await layer._fake.hgetall(layer._registry_key(group))
+        return {p.decode(): int(n) for p, n in procs.items()}
+
+    async def test_local_group_send_skips_redis(self):
+        async with self._layers() as (a, _):
+            a1, a2 = await a.new_channel(), await a.new_channel()
+            await a.group_add("game_ABCD", a1)
+            await a.group_add("game_ABCD", a2)
+            await self._subscribed(a)
+            self.assertEqual(await self._procs(a, "game_ABCD"), {a.client_prefix: 2})
+            await a.group_send("game_ABCD", {"type": "move", "n": 1})    # fragt das Register einmal
+            with mock.patch.object(a, "connection", side_effect=AssertionError("Redis-Aufruf")):
+                await a.group_send("game_ABCD", {"type": "move", "n": 2})
+            for n in (1, 2):
+                self.assertEqual(await self._get(a, a1), {"type": "move", "n": n})
+                self.assertEqual(await self._get(a, a2), {"type": "move", "n": n})
+
+    async def test_local_and_remote_members(self):
+        async with self._layers() as (a, b):
+            a1, b1 = await a.new_channel(), await b.new_channel()
+            await a.group_add("game_ABCD", a1)
+            await b.group_add("game_ABCD", b1)
+            await a.group_send("game_ABCD", {"type": "move", "n": 1})
+            self.assertEqual(await self._get(a, a1), {"type": "move", "n": 1})
+            self.assertEqual(await self._get(b, b1), {"type": "move", "n": 1})
+            await b.group_send("game_ABCD", {"type": "move", "n": 2})
+            self.assertEqual(await self._get(a, a1), {"type": "move", "n": 2})
+            self.assertEqual(await self._get(b, b1), {"type": "move", "n": 2})
+            # je genau einmal, nichts doppelt über Redis
+            self.assertTrue(a.receive_buffer[a1].empty())
+            self.assertTrue(b.receive_buffer[b1].empty())
+
+    async def test_join_invalidates_cached_registry(self):
+        async with self._layers() as (a, b):
+            a1 = await a.new_channel()
+            await a.group_add("game_ABCD", a1)
+            await self._subscribed(a)
+            await a.group_send("game_ABCD", {"type": "move", "n": 1})
+            await self._get(a, a1)
+            self.assertIn("game_ABCD", a._remote)             # "keine anderen" gecacht
+
+            b1 = await b.new_channel()
+            await b.group_add("game_ABCD", b1)
+            await self._until(lambda: "game_ABCD" not in a._remote, "Beitritt nicht gemeldet")
+            await a.group_send("game_ABCD", {"type": "move", "n": 2})
+            self.assertEqual(await self._get(b, b1), {"type": "move", "n": 2})
+            self.assertEqual(await self._get(a, a1), {"type": "move", "n": 2})
+
+            # B ganz raus -> A fragt einmal neu und bleibt danach wieder lokal
+            await b.group_discard("game_ABCD", b1)
+            await self._until(lambda: "game_ABCD" not in a._remote, "Austritt nicht gemeldet")
+            await a.group_send("game_ABCD", {"type": "move", "n": 3})
+            with mock.patch.object(a, "connection", side_effect=AssertionError("Redis-Aufruf")):
+                await a.group_send("game_ABCD", {"type": "move", "n": 4})
+
+    async def test_discard_cleans_registry(self):
+        async with self._layers() as (a, b):
+            a1, a2, b1 = await a.new_channel(), await a.new_channel(), await b.new_channel()
+            for layer, channel in ((a, a1), (a, a2), (b, b1)):
+                await layer.group_add("game_ABCD", channel)
+            await a.group_discard("game_ABCD", a1)
+            self.assertEqual(await self._procs(a, "game_ABCD"), {a.client_prefix: 1, b.client_prefix: 1})
+            await a.group_discard("game_ABCD", a2)
+            self.assertEqual(await self._procs(a, "game_ABCD"), {b.client_prefix: 1})
+            self.assertNotIn("game_ABCD", a.local_groups)
+            await b.group_send("game_ABCD", {"type": "move", "n": 1})
+            self.assertEqual(await self._get(b, b1), {"type": "move", "n": 1})
+            self.assertTrue(a.receive_buffer[a2].empty())
+
+
+@unittest.skipIf(np is None, "numpy nicht installiert")
+class BatchTests(SimpleTestCase):
+    def _assert_same(self, batch, games):
+        legal = batch.legal()
+        for i, game in enumerate(games):
+            self.assertEqual([int(m) for m in batch.boards[i, 0]], game.x)
+            self.assertEqual([int(m) for m in batch.boards[i, 1]], game.o)
+            self.assertEqual([int(m) for m in batch.meta[i]], [game.meta_x, game.meta_o, game.meta_d])
+            result = int(batch.result[i])
+            self.assertEqual(batch_mod.RESULT_CODES.get(result), game.winner)
+            self.assertEqual(sum(1 << c for c in np.nonzero(legal[i])[0].tolist()), game.legal_mask())
+
+    def test_random_games_match_engine(self):
+        for policy in ("random", "greedy"):
+            batch = batch_mod.Batch(200, np.random.default_rng(3))
+            games = [GameState() for _ in range(batch.size)]
+            while True:
+                cell = batch.choose(policy)
+                if (cell < 0).all():
+                    break
+                for i, c in enumerate(cell.tolist()):
+                    if c >= 0:
+                        games[i].apply_move(c // 9, c % 9)
+                batch.play(cell)
+                self._assert_same(batch, games)
+            self.assertEqual({g.winner for g in games}, {"X", "O", "D"})
+            for (res, moves), game in zip(batch_mod.decode(batch.encode()), games):
+                self.assertEqual(batch_mod.RESULT_CODES[res], game.winner)
+                self.assertEqual(moves, bytes(game.moves))
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+                   RECOVER_ROOMS=False)
+class PlayConsumerTests(SimpleTestCase):
+    """/ws/play/ über WebsocketCommunicator; jeder Test in eigenem Raum."""
+
+    def setUp(self):
+        self.clients = []
+
+    async def _connect(self, room):
+        client = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f"/ws/play/{room}/")
+        connected, _ = await client.connect()
+        self.assertTrue(connected)
+        self.clients.append(client)
+        return client
+
+    async def _close(self):
+        for client in self.clients:
+            await client.disconnect()
+
+    async def _send(self, client, stream, payload):
+        await client.send_json_to({"stream": stream, "payload": payload})
+
+    async def _join(self, client, nickname):
+        await self._send(client, "game", {"action": "create_or_join", "nickname": nickname})
+        # "joined" direkt, die Spielerliste über die Gruppe – Reihenfolge egal
+        frames = {}
+        for _ in range(2):
+            got = await client.receive_json_from()
+            frames[got["stream"]] = got["payload"]
+        self.assertEqual(frames["game"]["event"], "joined")
+        self.assertEqual(frames["presence"]["event"], "player_list")
+        return frames["game"]
+
+    async def test_game_chat_and_presence_are_tagged(self):
+        try:
+            # Ben erst nach Anns Join verbinden – sonst hat er ihre Spielerliste schon in der Gruppe
+            ann = await self._connect("MXPLAY")
+            self.assertEqual((await self._join(ann, "Ann"))["your_symbol"], "X")
+            ben = await self._connect("MXPLAY")
+            self.assertEqual((await self._join(ben, "Ben"))["your_symbol"], "O")
+            update = await ann.receive_json_from()          # Ben ist dazugekommen
+            self.assertEqual(update["stream"], "presence")
+            self.assertEqual(update["payload"]["count"], 2)
+
+            await self._send(ann, "chat", {"message": "gg"})
+            for client in (ann, ben):
+                self.assertEqual(await client.receive_json_from(),
+                                 {"stream": "chat", "payload": {"messages": ["Ann: gg"]}})
+
+            await self._send(ben, "presence", {"typing": True})
+            typing = await ann.receive_json_from()
+            self.assertEqual(typing["stream"], "presence")
+            self.assertEqual((typing["payload"]["name"], typing["payload"]["typing"]), ("Ben", True))
+            self.assertTrue(await ben.receive_nothing(0.05))   # nicht an sich selbst
+        finally:
+            await self._close()
+
+    async def test_rejected_input(self):
+        try:
+            client = await self._connect("MXREJECT")
+            for text in ("[1, 2]", '"game"', "kein json", '{"stream": "nope", "payload": {}}',
+                         '{"stream": "game", "payload": [1]}'):
+                await client.send_to(text_data=text)
+            self.assertTrue(await client.receive_nothing(0.05))
+
+            await client.send_to(text_data="x" * (chat_consumers.MAX_FRAME + 1))
+            self.assertEqual(await client.receive_json_from(),
+                             {"stream": "game", "payload": {"event": "error", "message": "Frame zu groß."}})
+
+            # Chat erst nach create_or_join
+            await self._send(client, "chat", {"message": "hallo?"})
+            self.assertEqual(await client.receive_json_from(),
+                             {"stream": "chat", "payload": {"error": "Erst dem Raum beitreten."}})
+        finally:
+            await self._close()
+
+    async def test_chat_rate_limit(self):
+        try:
+            client = await self._connect("MXLIMIT")
+            await self._join(client, "Ann")
+            for i in range(chat_consumers.BURST + 1):
+                await self._send(client, "chat", {"message": f"m{i}"})
+            limited = await client.receive_json_from()
+            self.assertEqual(limited["stream"], "chat")
+            self.assertIn("Zu viele Nachrichten", limited["payload"]["error"])
+            batch = await client.receive_json_from()        # der Rest gesammelt in einem Frame
+            self.assertEqual(batch["payload"]["messages"], [f"Ann: m{i}" for i in range(chat_consumers.BURST)])
+            # Tippen kostet dasselbe Budget und wird dann still verworfen
+            await self._send(client, "presence", {"typing": True})
+            self.assertTrue(await client.receive_nothing(0.05))
+        finally:
+            await self._close()
+
+
+def _played_room(code, moves, rng=None):
+    """Raum mit laufender Partie; Rückgabe (room, [MoveDelta, …])."""
+    rng = rng or random.Random(0)
+    room = Room(code)
+    room.new_game()
+    deltas = []
+    for _ in range(moves):
+        if room.game.winner:
+            break
+        deltas.append(room.game.apply_move(*rng.choice(legal_cells(room.game.legal_mask()))))
+    return room, deltas
+
+
+class HistoryWriterTests(SimpleTestCase):
+    """Puffer/Batching/Gegendruck mit einem Fake statt der DB."""
+
+    def setUp(self):
+        self.batches = []
+        self.gate = None          # asyncio.Event: _write wartet darauf
+        self.poison = None        # Zug-Nummer, deren Zeile nie geschrieben werden kann
+
+        async def write(items):
+            if self.gate is not None:
+                await self.gate.wait()
+            if any(kind == "move" and data[1] == self.poison for kind, data in items):
+                raise ValueError("kaputte Zeile")
+            self.batches.append(len(items))
+
+        patcher = mock.patch.object(history_mod, "_write", write)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def _moves(self, writer, room, deltas):
+        for delta in deltas:
+            await writer.move(room, delta)
+
+    async def test_batches_by_size(self):
+        writer = history_mod.HistoryWriter(batch_size=3, interval=60)
+        room, deltas = _played_room("HSIZE", 7)
+        await self._moves(writer, room, deltas[:2])
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.batches, [])          # wartet aufs Intervall
+        await writer.move(room, deltas[2])
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.batches, [3])         # Batch voll -> sofort
+        await self._moves(writer, room, deltas[3:])
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.batches, [3, 3, 1])   # höchstens batch_size pro Transaktion
+        self.assertEqual(writer.written["move"], 7)
+
+    async def test_batches_by_interval(self):
+        writer = history_mod.HistoryWriter(batch_size=100, interval=0.02)
+        room, deltas = _played_room("HTIME", 2)
+        await self._moves(writer, room, deltas)
+        self.assertEqual(self.batches, [])
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.batches, [2])
+
+    async def test_backpressure_blocks_then_drops(self):
+        writer = history_mod.HistoryWriter(batch_size=1, interval=60, max_queue=2, block=0.05)
+        self.gate = asyncio.Event()
+        room, deltas = _played_room("HFULL", 6)
+        await writer.move(room, deltas[0])
+        await asyncio.sleep(0.01)                     # hängt jetzt im Writer
+        await self._moves(writer, room, deltas[1:3])  # Puffer voll
+        self.assertEqual((writer.waits, writer.depth), (0, 2))
+
+        await writer.move(room, deltas[3])            # wartet `block` s, dann verworfen
+        self.assertEqual((writer.waits, writer.dropped, writer.depth), (1, 1, 2))
+
+        waiting = asyncio.ensure_future(writer.move(room, deltas[4]))
+        await asyncio.sleep(0.01)
+        self.assertFalse(waiting.done())
+        self.gate.set()                               # Writer schafft Platz -> Zug kommt mit
+        await waiting
+        await writer.flush()
+        self.assertEqual((writer.waits, writer.dropped), (2, 1))
+        self.assertEqual(writer.written["move"], 4)
+
+    async def test_failing_row_only_loses_itself(self):
+        writer = history_mod.HistoryWriter(batch_size=100, interval=60)
+        room, deltas = _played_room("HFAIL", 5)
+        self.poison = 3
+        writer.game_started(room)
+        await self._moves(writer, room, deltas)
+        await writer.flush()
+        # ganzer Batch zweimal fehlgeschlagen, dann einzeln: nur Zug 3 fehlt
+        self.assertEqual(self.batches, [1] * 5)
+        self.assertEqual(writer.written["game"], 1)
+        self.assertEqual(writer.written["move"], 4)
+        self.assertEqual(writer.errors, 1)
+
+    async def test_retry_once_keeps_the_batch(self):
+        writer = history_mod.HistoryWriter(batch_size=100, interval=60)
+        room, deltas = _played_room("HRETRY", 4)
+        failures = [ValueError("database is locked")]
+        write = history_mod._write
+
+        async def flaky(items):
+            if failures:
+                raise failures.pop()
+            await write(items)
+
+        with mock.patch.object(history_mod, "_write", flaky):
+            await self._moves(writer, room, deltas)
+            await writer.flush()
+        self.assertEqual(self.batches, [4])
+        self.assertEqual(writer.errors, 0)
+
+
+class HistoryDatabaseTests(TransactionTestCase):
+    async def test_game_and_moves_after_flush(self):
+        writer = history_mod.HistoryWriter(batch_size=100, interval=60)
+        room, deltas = _played_room("HDB", 81, random.Random(4))
+        room.players = {"c1": "Ann", "c2": "Ben"}
+        room.symbols = {"c1": "X", "c2": "O"}
+        writer.game_started(room)
+        for delta in deltas:
+            await writer.move(room, delta)
+        # Zug zu einer Partie, die es nicht gibt -> nur diese Zeile fehlt
+        ghost, ghost_deltas = _played_room("HGHOST", 1)
+        await writer.move(ghost, ghost_deltas[0])
+        await writer.flush()
+
+        game = await Game.objects.aget(id=room.game_id)
+        self.assertEqual((game.room, game.x_name, game.o_name), ("HDB", "Ann", "Ben"))
+        self.assertEqual((game.winner, game.moves), (room.game.winner, len(deltas)))
+        self.assertIsNotNone(game.finished_at)
+        rows = [(m.ply, m.big, m.small, m.symbol) async for m in Move.objects.filter(game_id=room.game_id)]
+        self.assertEqual(rows, [(d.version - room.game.base, d.big, d.small, d.symbol) for d in deltas])
+        self.assertFalse(await Move.objects.filter(game_id=ghost.game_id).aexists())
+        self.assertEqual(writer.errors, 1)
+
+
+class RecoveryTests(TransactionTestCase):
+    async def _snapshot_then_play(self, code, before, after, skip=None):
+        """Raum mit `before` Zügen snapshotten, `after` weitere nur ins Move-Log schreiben."""
+        writer = history_mod.HistoryWriter(batch_size=100, interval=60)
+        room, deltas = _played_room(code, before + after, random.Random(11))
+        room.phase = "playing"
+        room.symbol_by_name = {"Ann": "X", "Ben": "O"}
+        room.user_ids = {"X": 7, "O": 9}
+        writer.game_started(room)
+        for delta in deltas:
+            if delta.version - room.game.base != skip:
+                await writer.move(room, delta)
+
+        # der Stand, den der Snapshotter zu sehen bekommt: nur die ersten `before` Züge
+        seen = Room(code)
+        for name in ("phase", "symbol_by_name", "user_ids", "game_id"):
+            setattr(seen, name, getattr(room, name))
+        seen.game = GameState(base=room.game.base)
+        for delta in deltas[:before]:
+            seen.game.apply_move(delta.big, delta.small)
+
+        async def load(_code):
+            return seen
+
+        snapshots = Snapshotter(writer, load, interval=0)
+        snapshots.mark(code)
+        await asyncio.sleep(0.01)
+        await writer.flush()
+        self.assertEqual(snapshots.snapshots, 1)
+        return room
+
+    async def test_snapshot_plus_tail_matches_original(self):
+        room = await self._snapshot_then_play("RECOVER", 10, 6)
+        self.assertIsNone(room.game.winner)
+        store, seen = InMemoryRoomStore(), []
+        rooms = await recover(store, on_room=seen.append)
+        self.assertEqual([r.code for r in rooms], ["RECOVER"])
+        self.assertEqual(seen, rooms)
+        got = await store.get("RECOVER")
+        for name in ("x", "o", "meta_x", "meta_o", "meta_d", "current", "forced", "winner", "moves", "base",
+                     "free"):
+            self.assertEqual(getattr(got.game, name), getattr(room.game, name), name)
+        self.assertEqual(got.game.legal_mask(), room.game.legal_mask())
+        self.assertEqual((got.phase, got.game_id, got.symbol_by_name), (room.phase, room.game_id, room.symbol_by_name))
+        self.assertEqual(got.user_ids, {"X": 7, "O": 9})   # sonst keine Wertung nach Spielende
+
+    async def test_gap_in_tail_stops_replay(self):
+        room = await self._snapshot_then_play("RECGAP", 10, 6, skip=13)
+        rooms = await recover(InMemoryRoomStore())
+        self.assertEqual(len(rooms), 1)
+        self.assertEqual(bytes(rooms[0].game.moves), bytes(room.game.moves[:12]))
+
+    async def test_owns_filters_and_existing_room_wins(self):
+        await self._snapshot_then_play("RECOWN", 4, 2)
+        self.assertEqual(await recover(InMemoryRoomStore(), owns=lambda code: False), [])
+        store = InMemoryRoomStore()
+        existing, _ = await store.get_or_create("RECOWN")
+        self.assertEqual(await recover(store), [])
+        self.assertIs(await store.get("RECOWN"), existing)
+
+
+class RoomSerializerTests(SimpleTestCase):
+    async def test_same_room_fifo_other_rooms_parallel(self):
+        rooms = RoomSerializer()
+        gate = asyncio.Event()
+        log = []
+
+        async def command(code, name, wait=False):
+            async with rooms.hold(code):
+                log.append(("start", name))
+                if wait:
+                    await gate.wait()          # kritischer Abschnitt hängt
+                log.append(("end", name))
+
+        first = asyncio.ensure_future(command("A", "a1", wait=True))
+        await asyncio.sleep(0)
+        queued = [asyncio.ensure_future(command("A", f"a{i}")) for i in range(2, 5)]
+        await asyncio.sleep(0)
+        # anderer Raum läuft durch, obwohl A blockiert
+        await asyncio.wait_for(command("B", "b1"), 1)
+        self.assertEqual(log, [("start", "a1"), ("start", "b1"), ("end", "b1")])
+        self.assertEqual((rooms.depth("A"), rooms.depth("B")), (4, 0))
+        self.assertEqual(rooms.hot_rooms(), [("A", 4, 4)])
+        self.assertEqual(rooms.stats(), {"busy_rooms": 1, "queued": 4, "max_depth": 4, "commands": 1})
+
+        gate.set()
+        await asyncio.gather(first, *queued)
+        order = [name for event, name in log if event == "start" and name.startswith("a")]
+        self.assertEqual(order, ["a1", "a2", "a3", "a4"])
+        # nie zwei Befehle für A gleichzeitig
+        running = 0
+        for event, name in log:
+            if name.startswith("a"):
+                running += 1 if event == "start" else -1
+                self.assertLessEqual(running, 1)
+        self.assertEqual(rooms.stats(), {"busy_rooms": 0, "queued": 0, "max_depth": 4, "commands": 5})
+        self.assertEqual(rooms.hot_rooms(), [])
+
+    async def test_error_releases_the_room(self):
+        rooms = RoomSerializer()
+        with self.assertRaises(ValueError):
+            async with rooms.hold("A"):
+                raise ValueError
+        self.assertEqual(rooms.depth("A"), 0)
+        async with rooms.hold("A"):
+            self.assertEqual(rooms.depth("A"), 1)
+
+
+_SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\]|\\.)*)",?')
+
+
+def _parse_exposition(text):
+    """Prometheus-Text -> ({name: (help, type)}, [(name, {label: wert}, wert)])"""
+    meta, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, help = line[7:].split(" ", 1)
+            meta[name] = [help, None]
+        elif line.startswith("# TYPE "):
+            name, kind = line[7:].split(" ")
+            meta[name][1] = kind
+        elif line:
+            m = _SAMPLE.match(line)
+            assert m, line
+            raw = m.group(2) or ""
+            labels = {k: re.sub(r"\\(.)", lambda e: "\n" if e.group(1) == "n" else e.group(1), v)
+                      for k, v in _LABEL.findall(raw)}
+            assert "".join(f'{k}="{v}",' for k, v in _LABEL.findall(raw)).rstrip(",") == raw, line
+            samples.append((m.group(1), labels, float(m.group(3))))
+    return {k: tuple(v) for k, v in meta.items()}, samples
+
+
+class MetricsTests(SimpleTestCase):
+    def _metric(self, cls, *args, **kwargs):
+        metric = cls(*args, **kwargs)
+        self.addCleanup(metrics.REGISTRY.remove, metric)
+        return metric
+
+    def test_render_parses(self):
+        counter = self._metric(metrics.Counter, "t_actions_total", "Aktionen", labels=("action",))
+        counter.labels('say "hi"\\n').inc(2)
+        counter.labels("line\nbreak").inc()
+        self._metric(metrics.Gauge, "t_ratio", "per Callback", fn=lambda: float("inf"))
+        gauge = self._metric(metrics.Gauge, "t_open", "offen")
+        gauge.set(3)
+        gauge.dec()
+
+        meta, samples = _parse_exposition(metrics.render())
+        self.assertEqual(meta["t_actions_total"], ("Aktionen", "counter"))
+        self.assertEqual(meta["t_open"], ("offen", "gauge"))
+        mine = {(n, tuple(sorted(l.items()))): v for n, l, v in samples if n.startswith("t_")}
+        self.assertEqual(mine, {
+            ("t_actions_total", (("action", 'say "hi"\\n'),)): 2,
+            ("t_actions_total", (("action", "line\nbreak"),)): 1,
+            ("t_ratio", ()): float("inf"),
+            ("t_open", ()): 2,
+        })
+        # Metriken der Consumer sind registriert und parsen
+        self.assertEqual(meta["ultictactoe_actions_total"][1], "counter")
+
+    def test_histogram_buckets(self):
+        hist = self._metric(metrics.Histogram, "t_seconds", "Dauer", labels=("action",), buckets=(0.01, 0.1, 1))
+        for v in (0.005, 0.01, 0.05, 0.5, 2.0, 3.0):
+            hist.labels("move").observe(v)
+        meta, samples = _parse_exposition(hist.render())
+        self.assertEqual(meta["t_seconds"], ("Dauer", "histogram"))
+        buckets = [(l["le"], v) for n, l, v in samples if n == "t_seconds_bucket"]
+        # kumulativ, le inklusive (0.01 zählt in le="0.01")
+        self.assertEqual(buckets, [("0.01", 2), ("0.1", 3), ("1", 4), ("+Inf", 6)])
+        rest = {n: v for n, l, v in samples if n != "t_seconds_bucket"}
+        self.assertEqual(rest["t_seconds_count"], 6)
+        self.assertAlmostEqual(rest["t_seconds_sum"], 5.565)
+        self.assertEqual(hist.labels("move").quantile(0.5), 0.1)
+        self.assertEqual(hist.labels("move").quantile(0.99), float("inf"))
+
+
+class MetricsViewTests(SimpleTestCase):
+    async def _get(self, ip):
+        request = RequestFactory().get("/metrics", REMOTE_ADDR=ip)
+        return await Metrics.as_view()(request)
+
+    @override_settings(METRICS_ALLOWED_IPS=("10.0.0.1",))
+    async def test_only_allowed_ips(self):
+        self.assertEqual((await self._get("10.0.0.2")).status_code, 403)
+        self.assertEqual((await self._get("127.0.0.1")).status_code, 403)
+        response = await self._get("10.0.0.1")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        meta, _ = _parse_exposition(response.content.decode())
+        self.assertIn("ultictactoe_actions_total", meta)
+
+    @override_settings(METRICS_ALLOWED_IPS=None)
+    async def test_none_allows_everyone(self):
+        self.assertEqual((await self._get("203.0.113.9")).status_code, 200)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}},
+                   RECOVER_ROOMS=False)
+class CodeReservationTests(SimpleTestCase):
+    async def test_typed_code_does_not_steal_a_reservation(self):
+        app = URLRouter(websocket_urlpatterns)
+        lobby = WebsocketCommunicator(app, "/ws/lobby/")
+        await lobby.connect()
+        await lobby.send_json_to({"action": "request_code"})
+        allocated = await lobby.receive_json_from()
+        await lobby.disconnect()
+        code = allocated["code"]
+
+        intruder = WebsocketCommunicator(app, f"/ws/game/{code}/")
+        owner = WebsocketCommunicator(app, f"/ws/game/{code}/")
+        await intruder.connect()
+        try:
+            await intruder.send_json_to({"action": "create_or_join", "nickname": "Eve"})
+            self.assertEqual(await intruder.receive_json_from(),
+                             {"event": "error", "message": "Dieser Raum-Code ist gerade reserviert."})
+            await intruder.disconnect()
+
+            await owner.connect()
+            await owner.send_json_to({"action": "create_or_join", "nickname": "Ann",
+                                      "reservation": allocated["reservation"]})
+            events = {(await owner.receive_json_from())["event"] for _ in range(2)}
+            self.assertEqual(events, {"joined", "player_list"})
+        finally:
+            await owner.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class GameLobbyConsumerTests(SimpleTestCase):
+    async def test_disconnect_after_failed_connect(self):
+        consumer = consumers.GameLobbyConsumer()
+        consumer.scope = {"url_route": {"kwargs": {"room_name": "ABCD"}}}
+        consumer.channel_layer = InMemoryChannelLayer()
+        consumer.channel_name = "test.failed"
+        with mock.patch.object(consumers, "recover_rooms", side_effect=RuntimeError("redis weg")):
+            with self.assertRaises(RuntimeError):
+                await consumer.connect()
+        await consumer.disconnect(1011)   # darf nicht an fehlenden Attributen sterben
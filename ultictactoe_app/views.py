@@ -1,6 +1,11 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import redirect, render
 from django.views import View
 
+from . import consumers  # noqa: F401 – registriert die Metriken
+from . import metrics
+
 # Create your views here.
 
 class Game(View):
@@ -19,4 +24,15 @@ class Index(View):
 class Board(View):
     def get(self, request):
         # room_code ist jetzt z. B. 3200
-        return render(request, 'game.html')
\ No newline at end of file
+        return render(request, 'game.html')
+
+
+class Metrics(View):
+    """Prometheus-Textformat; nur von METRICS_ALLOWED_IPS aus erreichbar."""
+
+    async def get(self, request):
+        allowed = getattr(settings, "METRICS_ALLOWED_IPS", ("127.0.0.1", "::1"))
+        if allowed is not None and request.META.get("REMOTE_ADDR") not in allowed:
+            return HttpResponseForbidden()
+        # async-View: läuft im Event-Loop-Thread, wie die Consumer, die die Werte schreiben
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import Player
+
+
+@admin.register(Player)
+class PlayerAdmin(admin.ModelAdmin):
+    list_display = ("user", "rating", "games", "wins", "losses", "draws", "updated_at")
+    search_fields = ("user__username",)
+    ordering = ("-rating",)
@@ -0,0 +1,216 @@
+# user_app/ratings.py
+"""
+Elo-Wertung und Rangliste.
+
+Wertung: klassisches Elo, K = 40 für die ersten 30 Partien, danach 20.
+Aktualisiert wird nach game_over (consumers.play_move), nur wenn beide
+Seiten eingeloggte, verschiedene User sind.
+
+Rangliste: Fenwick-Baum über ganzzahlige Wertungs-Buckets (0..4000),
+absteigend sortiert. Rang eines Users = Anzahl mit höherer Wertung + 1,
+Seite ab Rang k = Bucket per Binärsuche im Baum finden und weiterlaufen
+– beides O(log n) statt ORDER BY + COUNT über die ganze Tabelle.
+Der Index wird einmal aus der DB geladen und danach bei jeder
+Wertungsänderung nachgeführt; andere Worker laden spätestens nach
+LEADERBOARD_REFRESH Sekunden neu.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+DEFAULT_RATING = 1500.0
+K_NEW, K = 40, 20
+PROVISIONAL_GAMES = 30
+
+
+def expected(ra: float, rb: float) -> float:
+    return 1.0 / (1.0 + 10 ** ((rb - ra) / 400.0))
+
+
+def elo(ra: float, rb: float, score_a: float, k_a: float = K, k_b: float = K):
+    """Neue Wertungen (a, b); score_a = 1 Sieg, 0.5 Remis, 0 Niederlage von a."""
+    e = expected(ra, rb)
+    return ra + k_a * (score_a - e), rb + k_b * ((1 - score_a) - (1 - e))
+
+
+def _k(player):
+    return K_NEW if player.games < PROVISIONAL_GAMES else K
+
+
+def record_result(x_user_id, o_user_id, winner):
+    """
+    Partie werten (synchron, eigene Transaktion). winner: "X" / "O" / "D".
+    Rückgabe: [(user_id, username, neue Wertung), …] für den Ranglisten-Index.
+    """
+    from .models import Player
+
+    with transaction.atomic():
+        for uid in (x_user_id, o_user_id):
+            Player.objects.get_or_create(user_id=uid)
+        players = {p.user_id: p for p in
+                   Player.objects.select_for_update().select_related("user").filter(user_id__in=(x_user_id, o_user_id))}
+        px, po = players[x_user_id], players[o_user_id]
+
+        score_x = {"X": 1.0, "O": 0.0}.get(winner, 0.5)
+        px.rating, po.rating = elo(px.rating, po.rating, score_x, _k(px), _k(po))
+        for p, score in ((px, score_x), (po, 1.0 - score_x)):
+            p.games += 1
+            if score == 1.0:
+                p.wins += 1
+            elif score == 0.0:
+                p.losses += 1
+            else:
+                p.draws += 1
+            p.save(update_fields=["rating", "games", "wins", "losses", "draws", "updated_at"])
+    return [(p.user_id, p.user.get_username(), p.rating) for p in (px, po)]
+
+
+def rating_for(user_id) -> float:
+    from .models import Player
+
+    rating = Player.objects.filter(user_id=user_id).values_list("rating", flat=True).first()
+    return DEFAULT_RATING if rating is None else rating
+
+
+class Leaderboard:
+    def __init__(self, max_rating: int = 4000, page_size: int = 50, cached_pages: int = 32):
+        self.max_rating = max_rating
+        self.page_size = page_size
+        self.cached_pages = cached_pages
+        self._lock = threading.Lock()   # Views laufen im Sync-Thread, Updates im Event-Loop
+        self._updates = {}              # user_id -> (zeit, username, rating), seit dem letzten load
+        self._clear()
+
+    def _clear(self):
+        n = self.max_rating + 1
+        self._tree = [0] * (n + 1)       # Fenwick, 1-basiert; Position 1 = höchste Wertung
+        self._members = {}               # pos -> {user_id: (rating, username)}
+        self._where = {}                 # user_id -> pos
+        self._pages = OrderedDict()      # start -> Seite (bis zur nächsten Änderung), LRU
+        self.loaded_at = None
+
+    def _pos(self, rating):
+        r = min(self.max_rating, max(0, int(round(rating))))
+        return self.max_rating - r + 1
+
+    def _add(self, pos, delta):
+        while pos < len(self._tree):
+            self._tree[pos] += delta
+            pos += pos & -pos
+
+    def _prefix(self, pos):
+        total = 0
+        while pos > 0:
+            total += self._tree[pos]
+            pos -= pos & -pos
+        return total
+
+    def _lower_bound(self, k):
+        """Kleinste Position mit prefix(pos) >= k (binäres Absteigen im Baum)."""
+        pos, step = 0, 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] < k:
+                pos = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return pos + 1
+
+    def __len__(self):
+        return len(self._where)
+
+    def load(self, rows):
+        """
+        rows: [(user_id, username, rating)] – kompletter Neuaufbau.
+        Query und Aufbau laufen ohne Lock (update() im Event-Loop wartet nie
+        auf die DB); getauscht wird erst am Ende. Updates, die während des
+        Ladens kamen, werden danach noch mal eingespielt – sonst könnte der
+        ältere DB-Stand sie überschreiben.
+        """
+        started = time.monotonic()
+        fresh = Leaderboard(self.max_rating)
+        for uid, name, rating in rows:   # rows darf ein QuerySet sein, ausgewertet wird hier
+            fresh._put(uid, name, rating)
+        with self._lock:
+            self._tree, self._members, self._where = fresh._tree, fresh._members, fresh._where
+            self._pages = OrderedDict()
+            recent = {uid: u for uid, u in self._updates.items() if u[0] >= started}
+            for uid, (_, name, rating) in recent.items():
+                self._put(uid, name, rating)
+            self._updates = recent
+            self.loaded_at = time.monotonic()
+
+    def _put(self, uid, name, rating):
+        old = self._where.get(uid)
+        if old is not None:
+            del self._members[old][uid]
+            self._add(old, -1)
+        pos = self._where[uid] = self._pos(rating)
+        self._members.setdefault(pos, {})[uid] = (rating, name)
+        self._add(pos, 1)
+
+    def update(self, uid, name, rating):
+        with self._lock:
+            self._put(uid, name, rating)
+            self._pages.clear()
+            self._updates[uid] = (time.monotonic(), name, rating)
+
+    def rank(self, uid):
+        with self._lock:
+            pos = self._where.get(uid)
+            if pos is None:
+                return None
+            return self._prefix(pos - 1) + 1
+
+    def page(self, start: int = 0):
+        """
+        [(rang, user_id, username, rating)] ab Platz start+1, page_size Einträge.
+        start kommt aus ?page= -> auf eine Seitengrenze in [0, len) gezogen,
+        damit der Cache nur echte Seiten kennt (und höchstens cached_pages davon).
+        """
+        size = self.page_size
+        with self._lock:
+            last = max(0, len(self._where) - 1)
+            start = min(max(0, start), last) // size * size
+            hit = self._pages.get(start)
+            if hit is not None:
+                self._pages.move_to_end(start)
+                return hit
+            rows, k = [], start + 1
+            while len(rows) < size and k <= len(self._where):
+                pos = self._lower_bound(k)
+                before = self._prefix(pos - 1)
+                rank = before + 1
+                # innerhalb eines Buckets nach genauer Wertung, dann Name
+                bucket = sorted(self._members[pos].items(), key=lambda kv: (-kv[1][0], kv[1][1]))
+                for uid, (rating, name) in bucket[k - before - 1:]:
+                    if len(rows) >= size:
+                        break
+                    rows.append((rank, uid, name, rating))
+                k = before + len(bucket) + 1
+            self._pages[start] = rows
+            if len(self._pages) > self.cached_pages:
+                self._pages.popitem(last=False)
+            return rows
+
+
+_board = Leaderboard(page_size=getattr(settings, "LEADERBOARD_PAGE_SIZE", 50))
+
+
+def leaderboard() -> Leaderboard:
+    """Index holen, beim ersten Mal bzw. nach LEADERBOARD_REFRESH Sekunden aus der DB laden."""
+    from .models import Player
+
+    refresh = getattr(settings, "LEADERBOARD_REFRESH", 300)
+    if _board.loaded_at is None or time.monotonic() - _board.loaded_at > refresh:
+        _board.load(Player.objects.filter(games__gt=0).values_list("user_id", "user__username", "rating"))
+    return _board
+
+
+def apply_result(rows):
+    """Nach record_result: Index nachführen (auch während eines laufenden load(), siehe dort)."""
+    for uid, name, rating in rows:
+        _board.update(uid, name, rating)
@@ -1,3 +1,62 @@
-from django.test import TestCase
+import random
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from .ratings import Leaderboard, elo
+
+
+class EloTests(SimpleTestCase):
+    def test_zero_sum_with_equal_k(self):
+        a, b = elo(1600, 1400, 0.0)
+        self.assertAlmostEqual(a + b, 3000)
+        self.assertLess(a, 1600)
+        self.assertEqual(elo(1500, 1500, 0.5), (1500, 1500))
+
+
+class LeaderboardTests(SimpleTestCase):
+    def test_rank_and_page_match_sorting(self):
+        rng = random.Random(5)
+        rows = [(uid, f"u{uid:04d}", rng.uniform(800, 2400)) for uid in range(2000)]
+        board = Leaderboard()
+        board.load(rows)
+        for uid, name, rating in rng.sample(rows, 100):
+            board.update(uid, name, rating + rng.uniform(-50, 50))
+        ratings = {uid: board._members[pos][uid][0] for uid, pos in board._where.items()}
+
+        for uid in rng.sample(range(2000), 50):
+            higher = sum(1 for r in ratings.values() if round(r) > round(ratings[uid]))
+            self.assertEqual(board.rank(uid), higher + 1)
+        page = board.page(100)
+        expected = sorted(ratings.values(), key=lambda r: -r)[100:150]
+        self.assertEqual([r for _, _, _, r in page], expected)
+        self.assertEqual([rank for rank, *_ in page], sorted(rank for rank, *_ in page))
+
+    def test_load_keeps_updates_that_arrive_meanwhile(self):
+        board = Leaderboard()
+        board.load([(1, "ann", 1500.0), (2, "ben", 1500.0)])
+
+        def rows():
+            # läuft wie ein QuerySet erst in load() – ohne Lock, Updates kommen dazwischen
+            self.assertFalse(board._lock.locked())
+            yield 1, "ann", 1500.0
+            board.update(2, "ben", 1700.0)       # Partie endet während des Ladens
+            yield 2, "ben", 1500.0               # alter DB-Stand
+            yield 3, "cid", 1600.0
+
+        board.load(rows())
+        self.assertEqual([(rank, uid) for rank, uid, _, _ in board.page(0)], [(1, 2), (2, 3), (3, 1)])
+        self.assertEqual(len(board), 3)
+
+    def test_page_cache_is_bounded(self):
+        board = Leaderboard(page_size=10, cached_pages=4)
+        board.load([(uid, f"u{uid}", 1000.0 + uid) for uid in range(95)])
+        self.assertEqual(board.page(23), board.page(20))       # auf die Seitengrenze
+        self.assertEqual(board.page(-5)[0][0], 1)
+        self.assertEqual([r[0] for r in board.page(10 ** 9)], [91, 92, 93, 94, 95])   # letzte Seite
+        for start in range(0, 10 ** 6, 7):
+            board.page(start)
+        self.assertLessEqual(len(board._pages), 4)
+        first = board.page(0)
+        board.update(0, "u0", 5000.0)                           # Änderung leert den Cache
+        self.assertNotEqual(board.page(0), first)
+        self.assertEqual(board.page(0)[0][1], 0)
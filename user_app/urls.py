@@ -1,10 +1,11 @@
 from django.contrib import admin
 from django.urls import path
 
-from user_app.views import Login, Register
+from user_app.views import Leaderboard, Login, Register
 
 urlpatterns = [
     path("login/", Login.as_view(), name="login"),
     path("register/", Register.as_view(), name="register"),
+    path("leaderboard/", Leaderboard.as_view(), name="leaderboard"),
     
 ]
\ No newline at end of file
@@ -5,6 +5,9 @@ from django.contrib.auth import authenticate, login, get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
 
+from .models import Player
+from .ratings import leaderboard
+
 User = get_user_model()  # <— WICHTIG: benötigst du für User.objects[...]
 
 class Login(View):
@@ -82,3 +85,34 @@ class Register(View):
         messages.success(request, f"Willkommen, {user.get_username()}!")
         return render(request, "index.html")
 
+
+
+class Leaderboard(View):
+    def get(self, request):
+        board = leaderboard()   # Index im Speicher, kein ORDER BY / COUNT pro Aufruf
+        size = board.page_size
+        pages = max(1, -(-len(board) // size))
+        try:
+            page = min(pages, max(1, int(request.GET.get("page", 1))))
+        except ValueError:
+            page = 1
+        rows = board.page((page - 1) * size)
+
+        me = None
+        if request.user.is_authenticated:
+            rank = board.rank(request.user.pk)
+            player = Player.objects.filter(user=request.user).first()
+            if rank is not None and player is not None:
+                me = {"rank": rank, "rating": player.rating, "games": player.games,
+                      "wins": player.wins, "losses": player.losses, "draws": player.draws}
+
+        return render(request, "leaderboard.html", {
+            "rows": [{"rank": r, "name": n, "rating": rt, "is_me": uid == request.user.pk}
+                     for r, uid, n, rt in rows],
+            "page": page,
+            "pages": pages,
+            "prev": page - 1 if page > 1 else None,
+            "next": page + 1 if page < pages else None,
+            "me": me,
+            "total": len(board),
+        })